@@ -1,4 +1,5 @@
 import copy
+import hmac
 import json
 import os
 import logging
@@ -31,6 +32,7 @@ from azure.identity import DefaultAzureCredential as SyncDefaultAzureCredential,
 
 # AI Service Factory import for OpenAI client management
 from infrastructure.factories.ai_service_factory import create_ai_service_factory
+from backend.auth.credential_registry import close_credential_registry, get_credential_registry
 
 # Initialize logging first to prevent issues
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -67,14 +69,27 @@ from backend.settings import (
     app_settings,
     MINIMUM_SUPPORTED_AZURE_OPENAI_PREVIEW_API_VERSION
 )
+from backend.auth.graph_groups import close_group_resolver
 from backend.utils import (
-    format_as_ndjson,
-    format_stream_response,
     format_non_streaming_response,
     sanitize_messages_for_openai,
     convert_to_pf_format,
     format_pf_non_streaming_response,
 )
+from backend.answer_cache import (
+    AnswerCacheHit,
+    cached_answer_items,
+    cached_answer_message,
+    get_answer_cache,
+)
+from backend.completion_singleflight import create_chat_completion
+from backend.stream_encoder import (
+    encode_ndjson_stream,
+    modern_rag_stream_items,
+    openai_stream_items,
+    stream_format_headers,
+    wants_compact_stream,
+)
 from backend.deep_research_service import (
     create_service_from_env,
     DeepResearchResult,
@@ -85,6 +100,7 @@ from domain.user.interfaces.auth_service import AuthenticationError
 
 # TDD: 削除した履歴エンドポイントを新しいルーターで復元
 from web.routers.history_router import history_bp, init_history_router
+from web.routers.stream_router import chat_stream_response, stream_bp
 
 # ==========================================
 # グローバル変数・定数 (Global Variables & Constants)
@@ -242,17 +258,9 @@ async def init_cosmosdb_client():
             )
 
             if not app_settings.chat_history.account_key:
-                # Use managed identity with explicit client ID
-                managed_identity_client_id = os.environ.get("AZURE_CLIENT_ID")
-                if managed_identity_client_id:
-                    # Use specific managed identity
-                    from azure.identity.aio import ManagedIdentityCredential
-                    credential = ManagedIdentityCredential(client_id=managed_identity_client_id)
-                    logging.info(f"Using managed identity with client ID: {managed_identity_client_id}")
-                else:
-                    # Fallback to default credential
-                    credential = DefaultAzureCredential()
-                    logging.info("Using DefaultAzureCredential")
+                # Shared worker credential (managed identity when AZURE_CLIENT_ID is set,
+                # DefaultAzureCredential otherwise) with a per-scope token cache
+                credential = get_credential_registry().get_credential()
                     
             else:
                 credential = app_settings.chat_history.account_key
@@ -264,8 +272,15 @@ async def init_cosmosdb_client():
                 database_name=app_settings.chat_history.database,
                 container_name=app_settings.chat_history.conversations_container,
                 enable_message_feedback=app_settings.chat_history.enable_feedback,
+                updated_at_write_behind=app_settings.chat_history.updated_at_write_behind,
+                updated_at_flush_interval=app_settings.chat_history.updated_at_flush_interval,
             )
             logging.info("CosmosDB client initialized successfully")
+
+            # 履歴クエリが前提とする複合インデックスの確認（不足時は警告し、単一プロパティORDER BYで動作）
+            missing_indexes = await cosmos_conversation_client.check_indexing_policy()
+            if not missing_indexes:
+                logging.info("CosmosDB composite indexes for history queries are present")
         except Exception as e:
             logging.exception("Exception in CosmosDB initialization", e)
             cosmos_conversation_client = None
@@ -417,6 +432,33 @@ async def get_frontend_settings():
         return jsonify(fallback), HTTPStatus.OK
 
 
+def _answer_cache_bypassed() -> bool:
+    """Cache-Control: no-cache の要求は回答キャッシュを参照しない（生成した回答は保存する）"""
+    return "no-cache" in request.headers.get("Cache-Control", "").lower()
+
+
+def _cached_answer_response(cache_hit: AnswerCacheHit, stream: bool, response_id: str, history_metadata, apim_request_id=None):
+    """キャッシュした回答を通常の応答と同じ形式で返す"""
+    fields = {
+        "id": response_id,
+        "model": app_settings.azure_openai.model,
+        "created": int(datetime.now().timestamp()),
+        "object": "chat.completion.chunk" if stream else "chat.completion",
+        "history_metadata": history_metadata,
+    }
+    if apim_request_id is not None:
+        fields["apim-request-id"] = apim_request_id
+    if stream:
+        compact = wants_compact_stream(request.headers.get("Accept"), request.args.get("stream_format"))
+        return chat_stream_response(
+            encode_ndjson_stream(cached_answer_items(cache_hit.answer, fields), compact=compact),
+            headers={**stream_format_headers(compact), **cache_hit.headers()},
+        )
+    message = cached_answer_message(cache_hit.answer)
+    message.update({"id": str(uuid.uuid4()), "date": datetime.now().isoformat()})
+    return jsonify({**fields, "choices": [{"messages": [message]}]}), 200, cache_hit.headers()
+
+
 @bp.route("/conversation", methods=["POST"])
 async def conversation():
     """
@@ -479,7 +521,7 @@ async def conversation():
         factory = getattr(current_app, "ai_service_factory", None)
         if not factory:
             raise RuntimeError("AI Service Factory is not initialized")
-        azure_openai_client = await factory.create_azure_openai_client()
+        azure_openai_client = await factory.get_azure_openai_client()
     except Exception as e:
         # In non-production, fall back to mock response to keep local/dev and CI stable
         if not is_production and mock_chat_response:
@@ -516,24 +558,40 @@ async def conversation():
     if app_settings.azure_openai.user:
         openai_request["user"] = app_settings.azure_openai.user
 
+    answer_cache = get_answer_cache()
+    cache_lookup = answer_cache.prepare("conversation", prepared_messages, openai_request)
+    cache_headers = {}
+    if cache_lookup:
+        cache_hit = None
+        if _answer_cache_bypassed():
+            cache_headers["X-Answer-Cache"] = "BYPASS"
+        else:
+            cache_hit = await answer_cache.lookup(cache_lookup)
+            cache_headers["X-Answer-Cache"] = "MISS"
+        if cache_hit:
+            return _cached_answer_response(
+                cache_hit, openai_request["stream"], str(uuid.uuid4()), history_metadata, apim_request_id
+            )
+
     try:
         if openai_request["stream"]:
-            response_stream = await azure_openai_client.chat.completions.create(**openai_request)
-
-            async def events():
-                async for completion_chunk in response_stream:
-                    event = format_stream_response(completion_chunk, history_metadata, apim_request_id)
-                    if event:
-                        yield event
-
-            return Response(
-                format_as_ndjson(events()),
-                mimetype="application/x-ndjson",
+            response_stream = await create_chat_completion(azure_openai_client, openai_request)
+
+            items = openai_stream_items(response_stream, history_metadata, apim_request_id)
+            if cache_lookup:
+                items = answer_cache.record(cache_lookup, items)
+            compact = wants_compact_stream(request.headers.get("Accept"), request.args.get("stream_format"))
+            return chat_stream_response(
+                encode_ndjson_stream(items, compact=compact),
+                headers={**stream_format_headers(compact), **cache_headers},
             )
 
-        chat_completion = await azure_openai_client.chat.completions.create(**openai_request)
+        chat_completion = await create_chat_completion(azure_openai_client, openai_request)
         response_obj = format_non_streaming_response(chat_completion, history_metadata, apim_request_id)
-        return jsonify(response_obj)
+        if cache_lookup and response_obj and chat_completion.choices[0].finish_reason == "stop":
+            message = response_obj["choices"][0]["messages"][0]
+            await answer_cache.store_answer(cache_lookup, message.get("content") or "", message.get("context"))
+        return jsonify(response_obj), 200, cache_headers
 
     except Exception as e:
         logging.exception("Exception in /conversation")
@@ -776,7 +834,53 @@ async def modern_rag_web_conversation():
                 return jsonify(response_data), status_code
             
         service = current_app.modern_rag
-        result = await service.process_user_query(user_message, user_id)
+        # conversation_id があれば同じ Agents スレッドを再利用（ワーカー内キャッシュ）
+        conversation_id = request_json.get("conversation_id")
+        history_metadata = {
+            "conversation_id": conversation_id or str(uuid.uuid4()),
+            "title": user_message[:50] + "..." if len(user_message) > 50 else user_message,
+            "date": datetime.now().isoformat()
+        }
+        
+        # 回答キャッシュは新しい会話（Agents スレッドの文脈が無い質問）のみ対象
+        answer_cache = get_answer_cache()
+        cache_lookup = None
+        cache_headers = {}
+        if not conversation_id and answer_cache.enabled_for("modern_rag_web"):
+            # エージェントの指示・ツールが変わったら以前の回答は使わない
+            cache_lookup = answer_cache.prepare(
+                "modern_rag_web",
+                [{"role": "user", "content": user_message}],
+                {"model": app_settings.azure_openai.model, "agent_definition": service.get_agent_definition_hash()}
+            )
+        if cache_lookup:
+            cache_hit = None
+            if _answer_cache_bypassed():
+                cache_headers["X-Answer-Cache"] = "BYPASS"
+            else:
+                cache_hit = await answer_cache.lookup(cache_lookup)
+                cache_headers["X-Answer-Cache"] = "MISS"
+            if cache_hit:
+                return _cached_answer_response(
+                    cache_hit, bool(request_json.get("stream")), str(uuid.uuid4()), history_metadata
+                )
+        
+        if request_json.get("stream"):
+            # Agents run event stream: token deltas / tool progress / citations (final chunk)
+            response_id = str(uuid.uuid4())
+            
+            events = service.stream_user_query(user_message, user_id, conversation_id=conversation_id)
+            items = modern_rag_stream_items(events, response_id, app_settings.azure_openai.model, history_metadata)
+            if cache_lookup:
+                items = answer_cache.record(cache_lookup, items)
+            compact = wants_compact_stream(request.headers.get("Accept"), request.args.get("stream_format"))
+            
+            return chat_stream_response(
+                encode_ndjson_stream(items, compact=compact),
+                headers={**stream_format_headers(compact), **cache_headers},
+            )
+        
+        result = await service.process_user_query(user_message, user_id, conversation_id=conversation_id)
         
         if result.status == "success":
             # Format response in chat completion format with citations embedded in assistant message
@@ -805,13 +909,15 @@ async def modern_rag_web_conversation():
                     "messages": [response_message]
                 }],
                 "history_metadata": {
-                    "conversation_id": result.thread_id or str(uuid.uuid4()),
+                    "conversation_id": conversation_id or result.thread_id or str(uuid.uuid4()),
                     "title": user_message[:50] + "..." if len(user_message) > 50 else user_message,
                     "date": datetime.now().isoformat()
                 }
             }
+            if cache_lookup:
+                await answer_cache.store_answer(cache_lookup, result.response, response_message["context"])
             
-            return jsonify(chat_response)
+            return jsonify(chat_response), 200, cache_headers
         
         else:
             # Return error response
@@ -834,6 +940,36 @@ async def modern_rag_web_conversation():
         return jsonify(response_data), status_code
 
 
+@bp.route("/admin/answer-cache/purge", methods=["POST"])
+async def purge_answer_cache():
+    """
+    回答キャッシュの全件削除（同一ホストの他ワーカーにも反映）
+
+    X-Admin-Key ヘッダーに ANSWER_CACHE_ADMIN_KEY を指定する（未設定の場合は無効）。
+    本文の index_version を指定すると、以後はそのインデックスバージョンで回答を保存・照会する。
+    """
+    admin_key = os.environ.get("ANSWER_CACHE_ADMIN_KEY", "")
+    provided = request.headers.get("X-Admin-Key", "")
+    if not admin_key or not hmac.compare_digest(provided.encode("utf-8"), admin_key.encode("utf-8")):
+        response_data, status_code = create_error_response(
+            "管理者キーが正しくありません",
+            HTTPStatus.FORBIDDEN,
+            "FORBIDDEN"
+        )
+        return jsonify(response_data), status_code
+
+    request_json = await request.get_json(silent=True) or {}
+    index_version = request_json.get("index_version") if isinstance(request_json, dict) else None
+    answer_cache = get_answer_cache()
+    purged = await answer_cache.purge(index_version=str(index_version) if index_version else None)
+    logging.info(f"Answer cache purged: {purged} entries, index_version={answer_cache.index_version!r}")
+    return jsonify({
+        "purged": purged,
+        "index_version": answer_cache.index_version,
+        "stats": answer_cache.stats,
+    })
+
+
 @bp.route("/api/modern-rag/health", methods=["GET"])
 async def modern_rag_health_check():
     """
@@ -890,6 +1026,7 @@ def create_app():
     
     # TDD: 削除した履歴エンドポイントを新しいルーターで復元
     app.register_blueprint(history_bp)
+    app.register_blueprint(stream_bp)
     
     app.config["TEMPLATES_AUTO_RELOAD"] = True
     
@@ -924,6 +1061,12 @@ def create_app():
         try:
             # TDD Phase 4: 新しいKey Vaultサービス層初期化
             init_keyvault_service()
+            if keyvault_service:
+                # シークレットを一括で非同期取得し、以降はキャッシュ＋バックグラウンド更新
+                try:
+                    await keyvault_service.start()
+                except Exception as e:
+                    logging.warning(f"Key Vault secret preload failed, falling back to on-demand reads: {e}")
             
             # Task 20: フィーチャーフラグサービス初期化
             init_feature_flag_service()
@@ -970,6 +1113,13 @@ def create_app():
                 if azure_ai_agent_endpoint and bing_grounding_conn_id:
                     logging.info("Attempting to initialize Modern RAG service...")
                     app.modern_rag = await ModernBingGroundingAgentService.create()
+                    # MODERN_RAG_AGENT_STORE=cosmos の場合はエージェントIDを履歴コンテナに保存（ホスト間で共有）
+                    if app.cosmos_conversation_client:
+                        from backend.agent_identity import AGENT_STORE_BACKEND, create_agent_identity_store
+                        if AGENT_STORE_BACKEND == "cosmos":
+                            app.modern_rag.agent_store = create_agent_identity_store(
+                                app.cosmos_conversation_client.container_client
+                            )
                     logging.info("Modern RAG service initialized successfully")
                 else:
                     logging.warning("Modern RAG service disabled - missing required environment variables")
@@ -1014,6 +1164,21 @@ def create_app():
             if hasattr(app, 'deepresearch') and app.deepresearch:
                 await app.deepresearch.aclose()
                 logging.info("DeepResearch service closed successfully")
+            # Flush pending conversation writes and close CosmosDB client
+            if hasattr(app, 'cosmos_conversation_client') and app.cosmos_conversation_client:
+                await app.cosmos_conversation_client.aclose()
+                logging.info("CosmosDB client closed successfully")
+            # Cleanup shared Azure OpenAI client (connection pool)
+            if hasattr(app, 'ai_service_factory') and app.ai_service_factory:
+                await app.ai_service_factory.aclose()
+                logging.info("Azure OpenAI client pool closed successfully")
+            # Close the shared Graph session used for group-based search filters
+            await close_group_resolver()
+            # Stop Key Vault background refresh
+            if keyvault_service:
+                await keyvault_service.aclose()
+            # Close shared credentials last (clients above may still hold them)
+            await close_credential_registry()
         except Exception as e:
             logging.exception("Error during service cleanup")
     
@@ -0,0 +1,187 @@
+"""
+Modern RAG エージェント ID の永続化
+
+目的:
+- gunicorn の各ワーカー・再起動ごとに create_agent が呼ばれ、起動が遅くなり孤立エージェントが増えるのを防ぐ
+
+設計:
+- エージェント定義（名前・モデル・指示・ツール・ツールリソース）の正規化 JSON のハッシュをキーに agent_id を保存
+- 定義が変わればハッシュも変わるため、新しいエージェントが作られる（古い ID は再利用されない）
+- ファイルストア: 同一ホストのワーカー間で flock によるプロセス間ロックをかけ、作成を1回に絞る
+- Cosmos ストア: 履歴コンテナに1ドキュメントとして保存。ホスト間は create_item の競合（409）で勝者を決める
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# file（既定） / cosmos / none
+AGENT_STORE_BACKEND = os.environ.get("MODERN_RAG_AGENT_STORE", "file").lower()
+AGENT_STORE_PATH = os.environ.get(
+    "MODERN_RAG_AGENT_STORE_PATH",
+    os.path.join(tempfile.gettempdir(), "modern_rag_agents.json")
+)
+# Cosmos ドキュメントのパーティションキー（userId）
+AGENT_STORE_PARTITION = "__modern_rag_agents__"
+
+
+def _to_jsonable(value: Any) -> Any:
+    """SDK モデル（as_dict を持つ）を JSON 化可能な形に変換"""
+    if hasattr(value, "as_dict"):
+        return value.as_dict()
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return str(value)
+
+
+def agent_definition_hash(definition: Dict[str, Any]) -> str:
+    """エージェント定義のハッシュ（キー順・空白に依存しない）"""
+    payload = json.dumps(definition, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=_to_jsonable)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class FileAgentIdentityStore:
+    """
+    ローカル JSON ファイルによるエージェント ID ストア
+
+    ファイル I/O と flock はスレッドで実行し、イベントループを塞がない。
+    """
+
+    def __init__(self, path: str = AGENT_STORE_PATH):
+        self.path = path
+        self.lock_path = path + ".lock"
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Agent identity store unreadable, ignoring: {e}")
+            return {}
+
+    def _write(self, entries: Dict[str, Any]) -> None:
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        # 書き込み途中のファイルを他ワーカーが読まないよう、一時ファイルから置き換える
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".agents-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    async def get(self, definition_hash: str) -> Optional[str]:
+        entries = await asyncio.to_thread(self._read)
+        return (entries.get(definition_hash) or {}).get("agentId")
+
+    async def set(self, definition_hash: str, agent_id: str) -> str:
+        """保存して採用された agent_id を返す（ファイルストアでは常に引数の ID）"""
+        def update():
+            entries = self._read()
+            entries[definition_hash] = {
+                "agentId": agent_id,
+                "createdAt": datetime.now(timezone.utc).isoformat()
+            }
+            self._write(entries)
+
+        await asyncio.to_thread(update)
+        return agent_id
+
+    async def delete(self, definition_hash: str) -> None:
+        def remove():
+            entries = self._read()
+            if entries.pop(definition_hash, None) is not None:
+                self._write(entries)
+
+        await asyncio.to_thread(remove)
+
+    @contextlib.asynccontextmanager
+    async def locked(self) -> AsyncIterator[None]:
+        """同一ホストのワーカー間で作成処理を直列化する"""
+        import fcntl
+
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        lock_file = open(self.lock_path, "a")
+        try:
+            await asyncio.to_thread(fcntl.flock, lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            lock_file.close()
+
+
+class CosmosAgentIdentityStore:
+    """
+    Cosmos DB（履歴コンテナ）によるエージェント ID ストア
+
+    ホストをまたぐロックは持たず、同時作成時は create_item の 409 で先に保存した ID を採用する。
+    """
+
+    def __init__(self, container_client: Any):
+        self.container_client = container_client
+
+    @staticmethod
+    def _document_id(definition_hash: str) -> str:
+        return f"agent-{definition_hash}"
+
+    async def get(self, definition_hash: str) -> Optional[str]:
+        from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+        try:
+            item = await self.container_client.read_item(
+                item=self._document_id(definition_hash), partition_key=AGENT_STORE_PARTITION
+            )
+        except CosmosResourceNotFoundError:
+            return None
+        return item.get("agentId")
+
+    async def set(self, definition_hash: str, agent_id: str) -> str:
+        """保存して採用された agent_id を返す（他ホストが先に保存していればその ID）"""
+        from azure.cosmos.exceptions import CosmosResourceExistsError
+
+        try:
+            await self.container_client.create_item({
+                "id": self._document_id(definition_hash),
+                "userId": AGENT_STORE_PARTITION,
+                "type": "agentIdentity",
+                "agentId": agent_id,
+                "definitionHash": definition_hash,
+                "createdAt": datetime.now(timezone.utc).isoformat()
+            })
+            return agent_id
+        except CosmosResourceExistsError:
+            return await self.get(definition_hash) or agent_id
+
+    async def delete(self, definition_hash: str) -> None:
+        from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+        try:
+            await self.container_client.delete_item(
+                item=self._document_id(definition_hash), partition_key=AGENT_STORE_PARTITION
+            )
+        except CosmosResourceNotFoundError:
+            pass
+
+    @contextlib.asynccontextmanager
+    async def locked(self) -> AsyncIterator[None]:
+        yield
+
+
+def create_agent_identity_store(container_client: Any = None):
+    """
+    MODERN_RAG_AGENT_STORE に応じたストアを作成（none の場合は None）
+
+    cosmos 指定でもコンテナが無い場合はファイルストアを使う。
+    """
+    if AGENT_STORE_BACKEND == "none":
+        return None
+    if AGENT_STORE_BACKEND == "cosmos" and container_client is not None:
+        return CosmosAgentIdentityStore(container_client)
+    return FileAgentIdentityStore()
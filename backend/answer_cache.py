@@ -0,0 +1,391 @@
+"""
+チャット回答キャッシュ（完全一致 + 埋め込み類似度）
+
+目的:
+- 社内でよく似た質問が繰り返される場合に、回答を毎回生成し直さない
+
+設計:
+- エンドポイントごとに有効化（ANSWER_CACHE_ENDPOINTS=conversation,modern_rag_web）
+- スコープ = エンドポイント + 生成パラメータ（モデル・システムメッセージ・temperature 等、
+  エージェントを使うエンドポイントはエージェント定義のハッシュ）のハッシュ
+- 1段目: スコープ + 正規化した会話全体（NFKC・小文字化・空白の畳み込み）のハッシュで完全一致
+- 2段目: 会話が単一の質問の場合のみ、質問の埋め込みのコサイン類似度が ANSWER_CACHE_SIMILARITY 以上の
+  同一スコープのエントリを採用（埋め込みの設定が無ければ完全一致のみ）
+- 回答と一緒に context（RAG の引用など）を保存し、ヒット時もそのまま返す
+- TTL と件数上限（古いものから破棄）で削除。検索インデックスのバージョン（ANSWER_CACHE_INDEX_VERSION、
+  またはパージ時の指定）が変わったら保存済みの回答は使わない
+- パージは同一ホストの全ワーカーに伝わるよう、マーカーファイルの更新時刻で通知する
+  （照会ごとに stat しないよう、確認は ANSWER_CACHE_PURGE_CHECK_INTERVAL 秒に1回）
+- ストアは AnswerStore プロトコルで差し替え可能（既定はワーカー内メモリ）
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import operator
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Protocol, Tuple
+
+from backend.stream_encoder import StreamEnd, StreamEnvelope, StreamItem, TokenChunk
+from backend.utils import normalize_text
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENDPOINTS = frozenset(
+    endpoint.strip() for endpoint in os.environ.get("ANSWER_CACHE_ENDPOINTS", "").split(",") if endpoint.strip()
+)
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_INDEX_VERSION = os.environ.get("ANSWER_CACHE_INDEX_VERSION", "")
+ANSWER_CACHE_PURGE_MARKER = os.environ.get(
+    "ANSWER_CACHE_PURGE_MARKER",
+    os.path.join(tempfile.gettempdir(), "answer_cache_purge.json")
+)
+ANSWER_CACHE_PURGE_CHECK_INTERVAL = float(os.environ.get("ANSWER_CACHE_PURGE_CHECK_INTERVAL", "5"))
+# キーに含める生成パラメータ（agent_definition はエージェント定義のハッシュ）
+_SCOPE_PARAMS = ("model", "temperature", "top_p", "seed", "max_tokens", "stop", "agent_definition")
+
+
+@dataclass
+class CachedAnswer:
+    """キャッシュした回答"""
+    key: str
+    scope: str
+    question: str
+    content: str
+    context: Optional[str]
+    index_version: str
+    created_at: float
+    embedding: Optional[List[float]] = None
+    hits: int = 0
+
+
+@dataclass
+class AnswerCacheLookup:
+    """1要求分のキャッシュ照会（ヒットしなければ同じ照会で保存する）"""
+    endpoint: str
+    scope: str
+    key: str
+    question: str
+    semantic: bool
+    embedding: Optional[List[float]] = None
+
+
+@dataclass
+class AnswerCacheHit:
+    answer: CachedAnswer
+    match: str
+    similarity: float = 1.0
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"X-Answer-Cache": "HIT", "X-Answer-Cache-Match": self.match}
+        if self.match == "semantic":
+            headers["X-Answer-Cache-Similarity"] = f"{self.similarity:.3f}"
+        return headers
+
+
+class AnswerStore(Protocol):
+    """回答キャッシュのストア"""
+
+    async def get(self, key: str) -> Optional[CachedAnswer]: ...
+
+    async def put(self, answer: CachedAnswer, max_entries: int) -> None: ...
+
+    async def delete(self, key: str) -> None: ...
+
+    async def candidates(self, scope: str) -> List[CachedAnswer]: ...
+
+    async def clear(self) -> int: ...
+
+
+class MemoryAnswerStore:
+    """ワーカー内メモリのストア（挿入順で古いものから破棄）"""
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[CachedAnswer]:
+        return self._entries.get(key)
+
+    async def put(self, answer: CachedAnswer, max_entries: int) -> None:
+        self._entries.pop(answer.key, None)
+        self._entries[answer.key] = answer
+        while len(self._entries) > max(max_entries, 1):
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    async def candidates(self, scope: str) -> List[CachedAnswer]:
+        return [answer for answer in self._entries.values() if answer.scope == scope and answer.embedding]
+
+    async def clear(self) -> int:
+        count = len(self._entries)
+        self._entries.clear()
+        return count
+
+
+def _hash(payload: Any) -> str:
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _unit(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def _best_match(vector: List[float], candidates: List[CachedAnswer]) -> Tuple[Optional[CachedAnswer], float]:
+    best, best_score = None, -1.0
+    for candidate in candidates:
+        score = sum(map(operator.mul, vector, candidate.embedding))
+        if score > best_score:
+            best, best_score = candidate, score
+    return best, best_score
+
+
+class AnswerCache:
+    """
+    回答キャッシュ
+
+    Args:
+        store: AnswerStore（未指定時はメモリ）
+        embedder: embed(text) を持つ埋め込み計算（未指定時は完全一致のみ）
+        endpoints: 有効にするエンドポイント名
+    """
+
+    def __init__(
+        self,
+        store: Optional[AnswerStore] = None,
+        embedder: Any = None,
+        endpoints=ANSWER_CACHE_ENDPOINTS,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        similarity: float = ANSWER_CACHE_SIMILARITY,
+        index_version: str = ANSWER_CACHE_INDEX_VERSION,
+        purge_marker: Optional[str] = ANSWER_CACHE_PURGE_MARKER,
+        purge_check_interval: float = ANSWER_CACHE_PURGE_CHECK_INTERVAL
+    ):
+        self.store = store or MemoryAnswerStore()
+        self.embedder = embedder
+        self.endpoints = frozenset(endpoints)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.index_version = index_version
+        self.purge_marker = purge_marker
+        self.purge_check_interval = purge_check_interval
+        self._marker_mtime: Optional[float] = None
+        self._marker_checked_at = time.monotonic()
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0}
+        # 起動前のパージで指定されたインデックスバージョンを引き継ぐ
+        marker = self._read_marker()
+        if marker.get("index_version"):
+            self.index_version = marker["index_version"]
+
+    def enabled_for(self, endpoint: str) -> bool:
+        return endpoint in self.endpoints
+
+    def prepare(
+        self,
+        endpoint: str,
+        messages: List[Dict[str, Any]],
+        params: Dict[str, Any]
+    ) -> Optional[AnswerCacheLookup]:
+        """照会を作成（エンドポイントが無効・最後が利用者の質問でない場合は None）"""
+        if not self.enabled_for(endpoint):
+            return None
+        turns = [m for m in messages if isinstance(m, dict) and m.get("role") != "system"]
+        if not turns or turns[-1].get("role") != "user" or not isinstance(turns[-1].get("content"), str):
+            return None
+        system = [m.get("content") for m in messages if isinstance(m, dict) and m.get("role") == "system"]
+        scope = _hash({
+            "endpoint": endpoint,
+            "system": system,
+            **{param: params.get(param) for param in _SCOPE_PARAMS},
+        })
+        normalized = [
+            {"role": m.get("role"), "content": normalize_text(m.get("content"))
+             if isinstance(m.get("content"), str) else m.get("content")}
+            for m in turns
+        ]
+        question = turns[-1]["content"]
+        return AnswerCacheLookup(
+            endpoint=endpoint,
+            scope=scope,
+            key=_hash({"scope": scope, "messages": normalized}),
+            question=question,
+            semantic=self.embedder is not None and len(turns) == 1,
+        )
+
+    def _read_marker(self) -> Dict[str, Any]:
+        """パージマーカーを読み、更新時刻を記録する"""
+        if not self.purge_marker:
+            return {}
+        try:
+            self._marker_mtime = os.stat(self.purge_marker).st_mtime
+            with open(self.purge_marker, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    async def _check_purged(self) -> None:
+        """他ワーカーのパージ（マーカーファイルの更新）を反映（確認は purge_check_interval 秒に1回）"""
+        if not self.purge_marker:
+            return
+        now = time.monotonic()
+        if now - self._marker_checked_at < self.purge_check_interval:
+            return
+        self._marker_checked_at = now
+        try:
+            mtime = os.stat(self.purge_marker).st_mtime
+        except OSError:
+            return
+        if mtime == self._marker_mtime:
+            return
+        marker = self._read_marker()
+        if marker.get("index_version"):
+            self.index_version = marker["index_version"]
+        await self.store.clear()
+
+    def _usable(self, answer: CachedAnswer) -> bool:
+        return answer.index_version == self.index_version and time.time() - answer.created_at < self.ttl
+
+    async def lookup(self, lookup: AnswerCacheLookup) -> Optional[AnswerCacheHit]:
+        """完全一致 → 類似度の順に照会"""
+        await self._check_purged()
+        answer = await self.store.get(lookup.key)
+        if answer is not None:
+            if self._usable(answer):
+                answer.hits += 1
+                self.stats["hits"] += 1
+                return AnswerCacheHit(answer, "exact")
+            await self.store.delete(answer.key)
+
+        if lookup.semantic:
+            try:
+                lookup.embedding = _unit(await self.embedder.embed(normalize_text(lookup.question)))
+            except Exception as e:
+                logger.warning(f"Answer cache embedding failed, using exact match only: {e}")
+                lookup.semantic = False
+            else:
+                candidates = [c for c in await self.store.candidates(lookup.scope) if self._usable(c)]
+                if candidates:
+                    best, score = await asyncio.to_thread(_best_match, lookup.embedding, candidates)
+                    if best is not None and score >= self.similarity:
+                        best.hits += 1
+                        self.stats["hits"] += 1
+                        self.stats["semantic_hits"] += 1
+                        return AnswerCacheHit(best, "semantic", score)
+
+        self.stats["misses"] += 1
+        return None
+
+    async def store_answer(self, lookup: AnswerCacheLookup, content: str, context: Optional[str] = None) -> None:
+        if not content:
+            return
+        await self.store.put(CachedAnswer(
+            key=lookup.key,
+            scope=lookup.scope,
+            question=lookup.question,
+            content=content,
+            context=context,
+            index_version=self.index_version,
+            created_at=time.time(),
+            embedding=lookup.embedding,
+        ), self.max_entries)
+        self.stats["stores"] += 1
+
+    async def record(self, lookup: AnswerCacheLookup, items: AsyncIterator[StreamItem]) -> AsyncIterator[StreamItem]:
+        """
+        ストリームをそのまま流しつつ回答を組み立て、正常終了した場合のみ保存
+
+        ツール呼び出し・エラーを含む応答や、stop 以外で終了した応答は保存しない。
+        """
+        content: List[str] = []
+        context = None
+        cacheable = True
+        finish_reason = None
+        async for item in items:
+            if isinstance(item, TokenChunk):
+                content.append(item.content)
+            elif isinstance(item, StreamEnd):
+                finish_reason = item.finish_reason
+            elif "error" in item:
+                cacheable = False
+            else:
+                for message in (item.get("choices") or [{}])[0].get("messages", []):
+                    if message.get("tool_calls"):
+                        cacheable = False
+                    if message.get("context"):
+                        context = message["context"]
+                    if message.get("content"):
+                        content.append(message["content"])
+            yield item
+        if cacheable and finish_reason == "stop":
+            await self.store_answer(lookup, "".join(content), context)
+
+    async def purge(self, index_version: Optional[str] = None) -> int:
+        """全件削除（index_version 指定時は以後そのバージョンで保存・照会）し、他ワーカーにも通知"""
+        if index_version:
+            self.index_version = index_version
+        count = await self.store.clear()
+        if self.purge_marker:
+            def write_marker():
+                with open(self.purge_marker, "w", encoding="utf-8") as f:
+                    json.dump({"index_version": self.index_version, "purged_at": time.time()}, f)
+                return os.stat(self.purge_marker).st_mtime
+
+            try:
+                self._marker_mtime = await asyncio.to_thread(write_marker)
+            except OSError as e:
+                logger.warning(f"Failed to write answer cache purge marker: {e}")
+        return count
+
+
+async def cached_answer_items(answer: CachedAnswer, fields: Dict[str, Any]) -> AsyncIterator[StreamItem]:
+    """キャッシュした回答を StreamItem（本文 → context → 終了）として返す"""
+    yield TokenChunk(StreamEnvelope(fields), answer.content)
+    if answer.context:
+        yield {**fields, "choices": [{"messages": [{"role": "assistant", "content": "", "context": answer.context}]}]}
+    yield StreamEnd("stop")
+
+
+def cached_answer_message(answer: CachedAnswer) -> Dict[str, Any]:
+    """非ストリーミング応答用の assistant メッセージ"""
+    message = {"role": "assistant", "content": answer.content}
+    if answer.context:
+        message["context"] = answer.context
+    return message
+
+
+_answer_cache: Optional[AnswerCache] = None
+
+
+def get_answer_cache() -> AnswerCache:
+    """
+    プロセス共有の AnswerCache を取得
+
+    AZURE_OPENAI_ENDPOINT と AZURE_OPENAI_EMBEDDING_NAME があれば類似度照会を有効にする。
+    """
+    global _answer_cache
+    if _answer_cache is None:
+        embedder = None
+        endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT")
+        deployment = os.environ.get("AZURE_OPENAI_EMBEDDING_NAME")
+        if ANSWER_CACHE_ENDPOINTS and endpoint and deployment:
+            from backend.functions.vector_search import QueryEmbedder
+
+            embedder = QueryEmbedder(
+                endpoint=endpoint,
+                deployment=deployment,
+                api_key=os.environ.get("AZURE_OPENAI_KEY") or None
+            )
+        _answer_cache = AnswerCache(embedder=embedder)
+    return _answer_cache
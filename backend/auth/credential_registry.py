@@ -0,0 +1,221 @@
+"""
+認証情報レジストリ
+
+Cosmos DB / Azure OpenAI / Azure AI Agents で同じ非同期認証情報を共有し、
+スコープごとのアクセストークンをワーカープロセス内でキャッシュする。
+
+設計:
+- 認証情報はクライアントID（ユーザー割り当てマネージドID）ごとに1つだけ生成する
+  （IMDS プローブや DefaultAzureCredential のチェーン探索を繰り返さない）
+- トークンは有効期限の CREDENTIAL_TOKEN_REFRESH_MARGIN 秒前からバックグラウンドで更新し、
+  更新中も既存トークンを返すため、リクエストがトークン取得を待たない
+- 同一スコープの同時取得は1回にまとめる
+- トークン取得レイテンシをスコープ別に記録し、ヘルスチェックで参照できるようにする
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from azure.core.credentials import AccessToken
+from azure.identity.aio import DefaultAzureCredential, ManagedIdentityCredential
+
+
+logger = logging.getLogger(__name__)
+
+# 有効期限の何秒前からトークンを先行更新するか
+CREDENTIAL_TOKEN_REFRESH_MARGIN = float(os.environ.get("CREDENTIAL_TOKEN_REFRESH_MARGIN", "300"))
+
+COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
+
+
+class CachingCredential:
+    """
+    スコープ単位でトークンをキャッシュする非同期認証情報ラッパー
+
+    AsyncTokenCredential と同じ get_token / close / async with を提供するため、
+    Cosmos・Agents などの SDK クライアントにそのまま渡せる。
+    共有インスタンスのため、async with を抜けても close しない（close はレジストリが行う）。
+    """
+
+    def __init__(self, credential, refresh_margin: float = CREDENTIAL_TOKEN_REFRESH_MARGIN):
+        self._credential = credential
+        self.refresh_margin = refresh_margin
+        self._tokens: Dict[Tuple[str, ...], AccessToken] = {}
+        self._locks: Dict[Tuple[str, ...], asyncio.Lock] = {}
+        self._refresh_tasks: Dict[Tuple[str, ...], asyncio.Task] = {}
+        self._metrics: Dict[Tuple[str, ...], Dict[str, float]] = {}
+
+    def _metric(self, key: Tuple[str, ...]) -> Dict[str, float]:
+        return self._metrics.setdefault(key, {
+            "hits": 0,
+            "fetches": 0,
+            "background_refreshes": 0,
+            "errors": 0,
+            "total_latency_ms": 0.0,
+            "max_latency_ms": 0.0,
+            "last_latency_ms": 0.0,
+        })
+
+    async def _fetch(self, key: Tuple[str, ...], **kwargs) -> AccessToken:
+        metric = self._metric(key)
+        started = time.perf_counter()
+        try:
+            token = await self._credential.get_token(*key, **kwargs)
+        except Exception:
+            metric["errors"] += 1
+            raise
+        latency_ms = (time.perf_counter() - started) * 1000
+        metric["fetches"] += 1
+        metric["total_latency_ms"] += latency_ms
+        metric["last_latency_ms"] = latency_ms
+        metric["max_latency_ms"] = max(metric["max_latency_ms"], latency_ms)
+        self._tokens[key] = token
+        return token
+
+    async def _refresh_in_background(self, key: Tuple[str, ...]) -> None:
+        try:
+            async with self._locks.setdefault(key, asyncio.Lock()):
+                await self._fetch(key)
+            self._metric(key)["background_refreshes"] += 1
+        except Exception as e:
+            logger.warning(f"Background token refresh failed for {key}: {e}")
+        finally:
+            self._refresh_tasks.pop(key, None)
+
+    async def get_token(self, *scopes: str, claims: Optional[str] = None, tenant_id: Optional[str] = None, **kwargs) -> AccessToken:
+        # クレームチャレンジ・テナント指定はキャッシュせずそのまま委譲
+        if claims or tenant_id:
+            return await self._credential.get_token(*scopes, claims=claims, tenant_id=tenant_id, **kwargs)
+
+        key = tuple(scopes)
+        token = self._tokens.get(key)
+        now = time.time()
+        if token and token.expires_on - now > self.refresh_margin:
+            self._metric(key)["hits"] += 1
+            return token
+
+        if token and token.expires_on - now > 30:
+            # 期限が近い: 既存トークンを返しつつバックグラウンドで更新
+            self._metric(key)["hits"] += 1
+            if key not in self._refresh_tasks:
+                self._refresh_tasks[key] = asyncio.create_task(self._refresh_in_background(key))
+            return token
+
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            token = self._tokens.get(key)
+            if token and token.expires_on - time.time() > 30:
+                self._metric(key)["hits"] += 1
+                return token
+            return await self._fetch(key, **kwargs)
+
+    def metrics(self) -> Dict[str, Any]:
+        """スコープ別のトークン取得統計"""
+        now = time.time()
+        result = {}
+        for key, metric in self._metrics.items():
+            token = self._tokens.get(key)
+            fetches = metric["fetches"]
+            result[" ".join(key)] = {
+                "hits": metric["hits"],
+                "fetches": fetches,
+                "background_refreshes": metric["background_refreshes"],
+                "errors": metric["errors"],
+                "avg_latency_ms": round(metric["total_latency_ms"] / fetches, 1) if fetches else 0.0,
+                "max_latency_ms": round(metric["max_latency_ms"], 1),
+                "last_latency_ms": round(metric["last_latency_ms"], 1),
+                "expires_in_seconds": int(token.expires_on - now) if token else None,
+            }
+        return result
+
+    async def close(self) -> None:
+        for task in list(self._refresh_tasks.values()):
+            task.cancel()
+        self._refresh_tasks.clear()
+        await self._credential.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        # 共有インスタンスのため、ここでは閉じない
+        return None
+
+
+class CredentialRegistry:
+    """
+    ワーカープロセス内で共有する認証情報のレジストリ
+
+    AZURE_CLIENT_ID が設定されていればユーザー割り当てマネージドID、
+    無ければ DefaultAzureCredential を使う（既存の各初期化処理と同じ選択規則）。
+    """
+
+    def __init__(self, refresh_margin: float = CREDENTIAL_TOKEN_REFRESH_MARGIN):
+        self.refresh_margin = refresh_margin
+        self._credentials: Dict[Optional[str], CachingCredential] = {}
+
+    def get_credential(self, client_id: Optional[str] = None) -> CachingCredential:
+        """
+        共有認証情報を取得（初回のみ生成）
+
+        Args:
+            client_id: マネージドIDのクライアントID（省略時は AZURE_CLIENT_ID）
+        """
+        client_id = client_id or os.environ.get("AZURE_CLIENT_ID")
+        credential = self._credentials.get(client_id)
+        if credential is None:
+            if client_id:
+                inner = ManagedIdentityCredential(client_id=client_id)
+                logger.info(f"Using shared managed identity credential with client ID: {client_id}")
+            else:
+                inner = DefaultAzureCredential()
+                logger.info("Using shared DefaultAzureCredential")
+            credential = CachingCredential(inner, self.refresh_margin)
+            self._credentials[client_id] = credential
+        return credential
+
+    def get_token_provider(self, scope: str = COGNITIVE_SERVICES_SCOPE, client_id: Optional[str] = None) -> Callable[[], Awaitable[str]]:
+        """AsyncAzureOpenAI の azure_ad_token_provider に渡せるトークン取得関数"""
+        credential = self.get_credential(client_id)
+
+        async def token_provider() -> str:
+            token = await credential.get_token(scope)
+            return token.token
+
+        return token_provider
+
+    def metrics(self) -> Dict[str, Any]:
+        """認証情報ごとのトークン取得統計"""
+        return {
+            (client_id or "default"): credential.metrics()
+            for client_id, credential in self._credentials.items()
+        }
+
+    async def aclose(self) -> None:
+        for credential in self._credentials.values():
+            try:
+                await credential.close()
+            except Exception as e:
+                logger.warning(f"Failed to close credential: {e}")
+        self._credentials.clear()
+
+
+_registry: Optional[CredentialRegistry] = None
+
+
+def get_credential_registry() -> CredentialRegistry:
+    """プロセス共有の CredentialRegistry を取得"""
+    global _registry
+    if _registry is None:
+        _registry = CredentialRegistry()
+    return _registry
+
+
+async def close_credential_registry() -> None:
+    """共有認証情報をすべて閉じる（シャットダウン時）"""
+    global _registry
+    if _registry is not None:
+        await _registry.aclose()
+        _registry = None
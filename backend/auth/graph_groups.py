@@ -0,0 +1,217 @@
+"""
+Microsoft Graph グループメンバーシップの非同期解決
+
+目的:
+- ドキュメントレベルのアクセス制御（Azure Search の permitted groups フィルタ）で、
+  Graph 呼び出しがイベントループをブロックしないようにする
+- 同じトークンでの連続リクエストで Graph を毎回呼ばない
+
+設計:
+- aiohttp セッションを1つ共有し、@odata.nextLink はループで辿る（再帰しない）
+- トークン全体の SHA-256 をキーに TTL 付き LRU キャッシュ。
+  署名を検証していないクレーム（oid など）はキーに使わない（偽造トークンで他人のフィルタを得られないように）。
+  Graph の呼び出しが成功したトークンだけがキャッシュされる
+- search.in フィルタ文字列はキャッシュ登録時に1度だけ組み立てる
+- 同じトークンの同時ミスは1回の Graph 呼び出しにまとめる
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+
+logger = logging.getLogger(__name__)
+
+GRAPH_GROUPS_ENDPOINT = "https://graph.microsoft.com/v1.0/me/transitiveMemberOf?$select=id"
+# グループ一覧のキャッシュ有効期間（秒）
+GRAPH_GROUP_CACHE_TTL = float(os.environ.get("GRAPH_GROUP_CACHE_TTL", "300"))
+# キャッシュするトークン数の上限
+GRAPH_GROUP_CACHE_SIZE = int(os.environ.get("GRAPH_GROUP_CACHE_SIZE", "5000"))
+# Graph 呼び出し1回あたりのタイムアウト（秒）
+GRAPH_REQUEST_TIMEOUT = float(os.environ.get("GRAPH_REQUEST_TIMEOUT", "10"))
+# nextLink を辿る上限（異常な応答での無限ループ防止）
+GRAPH_MAX_PAGES = int(os.environ.get("GRAPH_MAX_PAGES", "100"))
+
+
+def token_cache_key(user_token: str) -> str:
+    """
+    アクセストークンのキャッシュキー（トークン全体の SHA-256）
+
+    トークンの署名はここでは検証しないため、クレームからキーを作らない。
+    """
+    return hashlib.sha256(user_token.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class GroupMembership:
+    """ユーザーの所属グループと事前計算済みフィルタ文字列"""
+    group_ids: Tuple[str, ...]
+    filter_string: str
+    expires_at: float
+
+
+class GraphGroupResolver:
+    """
+    Graph の transitiveMemberOf を非同期に取得し、トークン単位でキャッシュする
+
+    Args:
+        permitted_groups_column: Azure Search のグループ列名
+        cache_ttl: キャッシュ有効期間（秒）
+        cache_size: キャッシュするトークン数の上限
+        request_timeout: Graph 呼び出しのタイムアウト（秒）
+    """
+
+    def __init__(
+        self,
+        permitted_groups_column: Optional[str],
+        cache_ttl: float = GRAPH_GROUP_CACHE_TTL,
+        cache_size: int = GRAPH_GROUP_CACHE_SIZE,
+        request_timeout: float = GRAPH_REQUEST_TIMEOUT
+    ):
+        self.permitted_groups_column = permitted_groups_column
+        self.cache_ttl = cache_ttl
+        self.cache_size = max(cache_size, 1)
+        self.request_timeout = request_timeout
+        self._cache: "OrderedDict[str, GroupMembership]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.stats = {"hits": 0, "misses": 0, "graph_calls": 0, "errors": 0}
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout)
+            )
+        return self._session
+
+    def build_filter_string(self, group_ids: List[str]) -> str:
+        """search.in フィルタ文字列を組み立てる"""
+        return f"{self.permitted_groups_column}/any(g:search.in(g, '{', '.join(group_ids)}'))"
+
+    async def fetch_group_ids(self, user_token: str) -> List[str]:
+        """
+        Graph からグループIDを全ページ取得
+
+        Raises:
+            aiohttp.ClientError / asyncio.TimeoutError / RuntimeError（HTTPエラー時）
+        """
+        session = self._get_session()
+        headers = {"Authorization": "bearer " + user_token}
+        endpoint = GRAPH_GROUPS_ENDPOINT
+        group_ids: List[str] = []
+        for _ in range(GRAPH_MAX_PAGES):
+            self.stats["graph_calls"] += 1
+            async with session.get(endpoint, headers=headers) as response:
+                if response.status != 200:
+                    text = await response.text()
+                    raise RuntimeError(f"Error fetching user groups: {response.status} {text}")
+                data = await response.json()
+            group_ids.extend(obj["id"] for obj in data.get("value", []))
+            endpoint = data.get("@odata.nextLink")
+            if not endpoint:
+                break
+        else:
+            logger.warning(f"Stopped following Graph nextLink after {GRAPH_MAX_PAGES} pages")
+        return group_ids
+
+    def _get_cached(self, key: str) -> Optional[GroupMembership]:
+        membership = self._cache.get(key)
+        if membership is None:
+            return None
+        if membership.expires_at <= time.monotonic():
+            self._cache.pop(key, None)
+            return None
+        self._cache.move_to_end(key)
+        return membership
+
+    def _store(self, key: str, group_ids: List[str]) -> GroupMembership:
+        membership = GroupMembership(
+            group_ids=tuple(group_ids),
+            filter_string=self.build_filter_string(group_ids),
+            expires_at=time.monotonic() + self.cache_ttl
+        )
+        self._cache[key] = membership
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return membership
+
+    async def get_membership(self, user_token: str) -> GroupMembership:
+        """
+        所属グループを取得（キャッシュ優先、同じトークンの同時ミスは1回の呼び出しに集約）
+
+        Graph 呼び出しに失敗した場合は空のグループ（＝何も許可しないフィルタ）を返し、キャッシュしない。
+        """
+        key = token_cache_key(user_token)
+        membership = self._get_cached(key)
+        if membership:
+            self.stats["hits"] += 1
+            return membership
+
+        self.stats["misses"] += 1
+        inflight = self._inflight.get(key)
+        if inflight:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            try:
+                group_ids = await self.fetch_group_ids(user_token)
+                membership = self._store(key, group_ids)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Exception in fetching user groups: {e}")
+                membership = GroupMembership(
+                    group_ids=(),
+                    filter_string=self.build_filter_string([]),
+                    expires_at=0.0
+                )
+            future.set_result(membership)
+            return membership
+        finally:
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(key, None)
+
+    async def get_filter_string(self, user_token: str) -> str:
+        """事前計算済みの search.in フィルタ文字列を取得"""
+        membership = await self.get_membership(user_token)
+        if not membership.group_ids:
+            logger.debug("No user groups found")
+        return membership.filter_string
+
+    def get_cached_filter_string(self, user_token: str) -> Optional[str]:
+        """キャッシュ済みのフィルタ文字列（未キャッシュ・期限切れはNone）"""
+        membership = self._get_cached(token_cache_key(user_token))
+        return membership.filter_string if membership else None
+
+    async def aclose(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_resolver: Optional[GraphGroupResolver] = None
+
+
+def get_group_resolver() -> GraphGroupResolver:
+    """プロセス共有の GraphGroupResolver を取得"""
+    global _resolver
+    if _resolver is None:
+        _resolver = GraphGroupResolver(os.environ.get("AZURE_SEARCH_PERMITTED_GROUPS_COLUMN"))
+    return _resolver
+
+
+async def close_group_resolver() -> None:
+    """共有 GraphGroupResolver のセッションを閉じる（シャットダウン時）"""
+    global _resolver
+    if _resolver is not None:
+        await _resolver.aclose()
+        _resolver = None
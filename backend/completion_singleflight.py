@@ -0,0 +1,181 @@
+"""
+同一 Chat Completions 要求のシングルフライト（実行中の要求への相乗り）
+
+目的:
+- 全社告知やデモ直後のように同じ質問が同時に集中した場合、Azure OpenAI 呼び出しを1回にまとめる
+
+設計:
+- キーは (model, 正規化したメッセージ, temperature, top_p, seed, max_tokens, stop, stream など) の正規化 JSON のハッシュ
+- 出力が決定的な設定（temperature == 0）の場合のみ有効。それ以外は常に個別に呼び出す
+- ストリーミング: 最初の要求がタスクで上流を読み、チャンクを共有リストに追記する。
+  相乗りした要求は先頭から読み直すため、途中参加でも同じ応答全体を受け取れる
+- 上流の作成時エラーは全員の create 呼び出しで、読み取り中のエラーは全員のストリームで送出される
+- 完了したフライトはすぐ破棄する（結果のキャッシュではない）
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+COMPLETION_SINGLE_FLIGHT = os.environ.get("COMPLETION_SINGLE_FLIGHT", "true").lower() == "true"
+
+# キーに含める要求パラメータ
+_KEY_PARAMS = ("model", "temperature", "top_p", "seed", "max_tokens", "stop", "stream", "user")
+# キーに含めるメッセージのフィールド
+_MESSAGE_FIELDS = ("role", "content", "name", "tool_calls", "tool_call_id")
+
+
+def _normalize_content(content: Any) -> Any:
+    if isinstance(content, str):
+        return content.strip()
+    return content
+
+
+def single_flight_key(openai_request: Dict[str, Any]) -> Optional[str]:
+    """
+    要求のシングルフライトキー（決定的でない設定・無効化時は None）
+    """
+    if not COMPLETION_SINGLE_FLIGHT or openai_request.get("temperature") != 0:
+        return None
+    messages = [
+        {field: _normalize_content(message.get(field)) if field == "content" else message.get(field)
+         for field in _MESSAGE_FIELDS if message.get(field) is not None}
+        for message in openai_request.get("messages", [])
+        if isinstance(message, dict)
+    ]
+    payload = {param: openai_request.get(param) for param in _KEY_PARAMS}
+    payload["messages"] = messages
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """実行中の1回の上流呼び出し"""
+
+    def __init__(self):
+        self.started: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class CompletionSingleFlight:
+    """同一キーの Chat Completions 呼び出しを1回にまとめる"""
+
+    def __init__(self):
+        self._streams: Dict[str, _Flight] = {}
+        self._results: Dict[str, asyncio.Future] = {}
+        self.stats = {"leaders": 0, "followers": 0}
+
+    async def stream(self, key: str, create: Callable[[], Awaitable[AsyncIterator[Any]]]) -> AsyncIterator[Any]:
+        """
+        ストリーミング呼び出しに相乗りし、チャンクのイテレータを返す
+
+        create は上流のストリームを作成する（同じキーの実行中フライトが無い場合のみ呼ばれる）。
+        """
+        flight = self._streams.get(key)
+        if flight is None:
+            self.stats["leaders"] += 1
+            flight = _Flight()
+            self._streams[key] = flight
+            flight.task = asyncio.ensure_future(self._pump(key, flight, create))
+        else:
+            self.stats["followers"] += 1
+            logger.info(f"Joined in-flight completion stream {key[:12]}")
+        await asyncio.shield(flight.started)
+        return self._subscribe(flight)
+
+    async def _pump(self, key: str, flight: _Flight, create: Callable[[], Awaitable[AsyncIterator[Any]]]) -> None:
+        # 要求元の接続が切れても、相乗りしている要求のために最後まで読む
+        try:
+            upstream = await create()
+        except Exception as e:
+            flight.started.set_exception(e)
+            # 待機者がいない場合の "exception was never retrieved" を防ぐ
+            flight.started.exception()
+            flight.done = True
+            self._streams.pop(key, None)
+            return
+        flight.started.set_result(None)
+        try:
+            async for chunk in upstream:
+                async with flight.changed:
+                    flight.chunks.append(chunk)
+                    flight.changed.notify_all()
+        except Exception as e:
+            flight.error = e
+        finally:
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+            async with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
+
+    async def _subscribe(self, flight: _Flight) -> AsyncIterator[Any]:
+        index = 0
+        while True:
+            async with flight.changed:
+                while index >= len(flight.chunks) and not flight.done:
+                    await flight.changed.wait()
+                chunks = flight.chunks[index:]
+                finished = flight.done
+            for chunk in chunks:
+                yield chunk
+            index += len(chunks)
+            if finished and index >= len(flight.chunks):
+                if flight.error is not None:
+                    raise flight.error
+                return
+
+    async def complete(self, key: str, create: Callable[[], Awaitable[Any]]) -> Any:
+        """非ストリーミング呼び出しに相乗りし、同じ応答を返す"""
+        task = self._results.get(key)
+        if task is None:
+            self.stats["leaders"] += 1
+            # 要求元がキャンセルされても相乗りしている要求には結果を返す
+            task = asyncio.ensure_future(create())
+            self._results[key] = task
+
+            def finished(done: asyncio.Future):
+                if self._results.get(key) is done:
+                    del self._results[key]
+                if not done.cancelled():
+                    done.exception()
+
+            task.add_done_callback(finished)
+        else:
+            self.stats["followers"] += 1
+            logger.info(f"Joined in-flight completion {key[:12]}")
+        return await asyncio.shield(task)
+
+
+_single_flight: Optional[CompletionSingleFlight] = None
+
+
+def get_completion_single_flight() -> CompletionSingleFlight:
+    """プロセス共有の CompletionSingleFlight を取得"""
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = CompletionSingleFlight()
+    return _single_flight
+
+
+async def create_chat_completion(client: Any, openai_request: Dict[str, Any]) -> Any:
+    """
+    client.chat.completions.create(**openai_request) と同じ結果を返す（決定的な設定では同一要求を相乗り）
+    """
+    def create():
+        return client.chat.completions.create(**openai_request)
+
+    key = single_flight_key(openai_request)
+    if key is None:
+        return await create()
+    if openai_request.get("stream"):
+        return await get_completion_single_flight().stream(key, create)
+    return await get_completion_single_flight().complete(key, create)
@@ -5,8 +5,13 @@ TDD Phase 2: Green - 最小限の実装でテストを通す
 """
 
 import os
-from typing import Optional
-from dataclasses import dataclass
+from typing import List, Optional
+from dataclasses import dataclass, field
+
+
+def _split_env_list(value: Optional[str]) -> List[str]:
+    """カンマ区切りの環境変数をリストに変換（空要素は除外）"""
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
 
 
 @dataclass
@@ -17,6 +22,26 @@ class FunctionsConfig:
     search_index: str
     search_key: str
     keyvault_uri: Optional[str] = None
+    # 取得するフィールド（select）。空なら全フィールドを取得し、ベクトルフィールドのみ除外
+    select_fields: List[str] = field(default_factory=list)
+    # 応答から除外するベクトルフィールド
+    vector_fields: List[str] = field(default_factory=lambda: ["contentVector", "embedding"])
+    # 文字数を制限する本文フィールドと上限（0 以下で無制限）
+    content_fields: List[str] = field(default_factory=lambda: ["content"])
+    max_content_chars: int = 2000
+    # gzip 圧縮する応答サイズの下限（バイト）
+    gzip_min_bytes: int = 1024
+    # 既定のクエリ種別（simple / semantic / vector / vector_simple_hybrid / vector_semantic_hybrid）
+    query_type: str = "simple"
+    semantic_config: str = "default"
+    # ベクトル検索の対象フィールドと近傍数
+    vector_search_field: str = "contentVector"
+    vector_k: int = 50
+    # クエリ埋め込み用の Azure OpenAI 設定（キー未指定時は Managed Identity）
+    embedding_endpoint: Optional[str] = None
+    embedding_key: Optional[str] = None
+    embedding_deployment: Optional[str] = None
+    embedding_api_version: str = "2024-05-01-preview"
     
     @classmethod
     def from_environment(cls) -> "FunctionsConfig":
@@ -28,6 +53,13 @@ class FunctionsConfig:
         - SEARCH_INDEX: 検索対象のインデックス名
         - SEARCH_KEY: Azure AI Search のAPIキー（またはKEYVAULT_URIから取得）
         
+        任意環境変数:
+        - SEARCH_SELECT_FIELDS / SEARCH_VECTOR_FIELDS / SEARCH_CONTENT_FIELDS: カンマ区切りのフィールド名
+        - SEARCH_MAX_CONTENT_CHARS: 本文フィールドの最大文字数
+        - SEARCH_GZIP_MIN_BYTES: gzip 圧縮する応答サイズの下限
+        - SEARCH_QUERY_TYPE / SEARCH_SEMANTIC_CONFIG / SEARCH_VECTOR_SEARCH_FIELD / SEARCH_VECTOR_K: 検索モード
+        - AZURE_OPENAI_ENDPOINT / AZURE_OPENAI_KEY / AZURE_OPENAI_EMBEDDING_NAME: クエリ埋め込み
+        
         Returns:
             FunctionsConfig: 設定インスタンス
             
@@ -57,7 +89,20 @@ class FunctionsConfig:
             search_endpoint=search_endpoint,
             search_index=search_index,
             search_key=search_key or "",  # Key Vault使用時は空文字
-            keyvault_uri=keyvault_uri
+            keyvault_uri=keyvault_uri,
+            select_fields=_split_env_list(os.getenv("SEARCH_SELECT_FIELDS")),
+            vector_fields=_split_env_list(os.getenv("SEARCH_VECTOR_FIELDS", "contentVector,embedding")),
+            content_fields=_split_env_list(os.getenv("SEARCH_CONTENT_FIELDS", "content")),
+            max_content_chars=int(os.getenv("SEARCH_MAX_CONTENT_CHARS", "2000")),
+            gzip_min_bytes=int(os.getenv("SEARCH_GZIP_MIN_BYTES", "1024")),
+            query_type=os.getenv("SEARCH_QUERY_TYPE", "simple"),
+            semantic_config=os.getenv("SEARCH_SEMANTIC_CONFIG", "default"),
+            vector_search_field=os.getenv("SEARCH_VECTOR_SEARCH_FIELD", "contentVector"),
+            vector_k=int(os.getenv("SEARCH_VECTOR_K", "50")),
+            embedding_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+            embedding_key=os.getenv("AZURE_OPENAI_EMBEDDING_KEY") or os.getenv("AZURE_OPENAI_KEY"),
+            embedding_deployment=os.getenv("AZURE_OPENAI_EMBEDDING_NAME"),
+            embedding_api_version=os.getenv("AZURE_OPENAI_EMBEDDING_API_VERSION", "2024-05-01-preview")
         )
     
     def validate(self) -> bool:
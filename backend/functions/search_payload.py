@@ -0,0 +1,129 @@
+"""
+Search Proxy 応答の射影・圧縮
+
+目的:
+- ベクトルフィールドや長い本文をそのまま返さず、転送バイト数とエージェントが読むトークン数を減らす
+
+設計:
+- select が指定されていれば Azure AI Search 側で射影（返すフィールドを限定）
+- select 未指定時はベクトルフィールド（設定名 + 長い数値配列）を応答から除外
+- 本文フィールドは max_content_chars で切り詰め、切り詰めたフィールド名を truncated に記録
+- 応答本文は Accept-Encoding に gzip が含まれ、一定サイズ以上の場合のみ圧縮
+"""
+import gzip
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# 数値配列をベクトルとみなす要素数の下限（設定名に無いベクトルフィールドの検出用）
+VECTOR_MIN_DIMENSIONS = 64
+TRUNCATION_SUFFIX = "…"
+
+
+class ProjectionError(ValueError):
+    """リクエストの射影オプションが不正"""
+
+
+@dataclass(frozen=True)
+class SearchProjection:
+    """1リクエスト分の射影・圧縮設定"""
+    select: Tuple[str, ...] = ()
+    vector_fields: Tuple[str, ...] = ()
+    content_fields: Tuple[str, ...] = ()
+    max_content_chars: int = 0
+    include_vectors: bool = False
+
+    @classmethod
+    def from_request(cls, config: Any, options: Dict[str, Any]) -> "SearchProjection":
+        """
+        設定とリクエストボディのオプション（select / max_content_chars / include_vectors）から作成
+
+        Raises:
+            ProjectionError: オプションの型が不正な場合
+        """
+        select = options.get("select")
+        if select is None:
+            select = list(config.select_fields)
+        elif isinstance(select, str):
+            select = [name.strip() for name in select.split(",") if name.strip()]
+        elif not isinstance(select, list) or not all(isinstance(name, str) for name in select):
+            raise ProjectionError("select must be a list of field names")
+
+        max_chars = options.get("max_content_chars", config.max_content_chars)
+        if isinstance(max_chars, bool) or not isinstance(max_chars, int):
+            raise ProjectionError("max_content_chars must be an integer")
+        # 設定の上限を超える指定は上限に丸める
+        if config.max_content_chars > 0 and (max_chars <= 0 or max_chars > config.max_content_chars):
+            max_chars = config.max_content_chars
+
+        include_vectors = options.get("include_vectors", False)
+        if not isinstance(include_vectors, bool):
+            raise ProjectionError("include_vectors must be a boolean")
+
+        return cls(
+            select=tuple(select),
+            vector_fields=tuple(config.vector_fields),
+            content_fields=tuple(config.content_fields),
+            max_content_chars=max_chars,
+            include_vectors=include_vectors
+        )
+
+    def cache_options(self) -> Dict[str, Any]:
+        """キャッシュキーに含める値"""
+        return {
+            "select": list(self.select),
+            "max_content_chars": self.max_content_chars,
+            "include_vectors": self.include_vectors
+        }
+
+    def _is_vector(self, name: str, value: Any) -> bool:
+        if name in self.vector_fields:
+            return True
+        return (
+            isinstance(value, list)
+            and len(value) >= VECTOR_MIN_DIMENSIONS
+            and isinstance(value[0], (int, float))
+            and not isinstance(value[0], bool)
+        )
+
+    def compact_fields(self, fields: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        ドキュメントのフィールドを射影・切り詰め
+
+        Returns:
+            (フィールド, 切り詰めたフィールド名のリスト)
+        """
+        compacted: Dict[str, Any] = {}
+        truncated: List[str] = []
+        for name, value in fields.items():
+            if self.select and name not in self.select:
+                continue
+            if not self.include_vectors and self._is_vector(name, value):
+                continue
+            if (
+                self.max_content_chars > 0
+                and name in self.content_fields
+                and isinstance(value, str)
+                and len(value) > self.max_content_chars
+            ):
+                value = value[:self.max_content_chars] + TRUNCATION_SUFFIX
+                truncated.append(name)
+            compacted[name] = value
+        return compacted, truncated
+
+
+def encode_body(
+    body: str,
+    accept_encoding: Optional[str],
+    min_bytes: int
+) -> Tuple[Union[str, bytes], Dict[str, str]]:
+    """
+    Accept-Encoding に応じて応答本文を gzip 圧縮
+
+    Returns:
+        (本文, 追加ヘッダー)
+    """
+    encodings = [part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")]
+    raw = body.encode("utf-8")
+    if "gzip" not in encodings or min_bytes < 0 or len(raw) < min_bytes:
+        return body, {}
+    return gzip.compress(raw, compresslevel=5), {"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
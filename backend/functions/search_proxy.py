@@ -7,7 +7,7 @@ TDD Phase 2: Green - 最小限の実装でテストを通す
 import json
 import time
 import logging
-from typing import Dict, Any, Optional, Union
+from typing import Dict, Any, Optional, Tuple, Union
 import asyncio
 
 # Azure Functions の条件付きインポート（テスト時は None）
@@ -23,6 +23,10 @@ from azure.core.credentials import AzureKeyCredential
 from azure.core.exceptions import ClientAuthenticationError, HttpResponseError
 
 from .config import get_config
+from .search_batch import build_batch_response, is_batch_request, parse_batch_queries, run_batch_queries
+from .search_cache import get_search_cache, make_cache_key
+from .search_payload import SearchProjection, encode_body
+from .vector_search import build_search_kwargs, get_query_embedder, resolve_query_type, uses_vector
 
 # ログ設定
 logger = logging.getLogger(__name__)
@@ -46,10 +50,12 @@ class HttpRequest:
 
 class HttpResponse:
     """テスト用のHTTPレスポンスクラス"""
-    def __init__(self, body: str, status_code: int = 200, mimetype: str = "application/json"):
+    def __init__(self, body: str, status_code: int = 200, mimetype: str = "application/json",
+                 headers: Optional[Dict[str, str]] = None):
         self._body = body
         self.status_code = status_code
         self.mimetype = mimetype
+        self.headers = headers or {}
     
     def get_body(self) -> str:
         return self._body
@@ -94,6 +100,10 @@ async def main(req: Union[Any, HttpRequest]) -> Union[Any, HttpResponse]:
                 400
             )
         
+        # バッチモード（/search/batch または queries 配列）
+        if is_batch_request(getattr(req, "url", ""), request_data):
+            return await _handle_batch(req, request_data, request_id, start_time)
+        
         # 必須パラメータの検証
         search_text = request_data.get("search_text")
         if not search_text:
@@ -119,9 +129,31 @@ async def main(req: Union[Any, HttpRequest]) -> Union[Any, HttpResponse]:
                 400
             )
         
+        # 検索モードと応答の射影オプション（select / max_content_chars / include_vectors）
+        try:
+            query_type = resolve_query_type(request_data.get("query_type"), get_config())
+            projection = SearchProjection.from_request(get_config(), request_data)
+        except ValueError as e:
+            return _create_response(
+                {"error": {"code": "InvalidParameterType", "message": str(e)}},
+                400
+            )
+        
+        # キャッシュ参照（Cache-Control: no-cache 指定時は参照せず再取得）
+        cache = get_search_cache()
+        cache_key = make_cache_key(
+            search_text, top, filters, {**projection.cache_options(), "query_type": query_type}
+        )
+        bypass_cache = "no-cache" in (req.headers.get("cache-control") or "").lower()
+        cached_results, cache_source = (None, None) if bypass_cache else await cache.get(cache_key)
+        
         # Azure AI Search実行
         try:
-            results = await perform_search(search_text, top, filters, request_id)
+            if cached_results is not None:
+                results = cached_results
+            else:
+                results = await perform_search(search_text, top, filters, request_id, projection, query_type)
+                await cache.set(cache_key, results)
             
             elapsed_ms = int((time.time() - start_time) * 1000)
             
@@ -131,9 +163,18 @@ async def main(req: Union[Any, HttpRequest]) -> Union[Any, HttpResponse]:
                 "elapsedMs": elapsed_ms
             }
             
-            logger.info(f"[{request_id}] Search completed successfully: {len(results)} results in {elapsed_ms}ms")
+            cache_headers = {"X-Cache": "HIT" if cache_source else "MISS"}
+            if cache_source:
+                cache_headers["X-Cache-Source"] = cache_source
             
-            return _create_response(response_data, 200)
+            logger.info(
+                f"[{request_id}] Search completed successfully: {len(results)} results in {elapsed_ms}ms "
+                f"(cache={cache_headers['X-Cache']})"
+            )
+            
+            return _create_response(
+                response_data, 200, cache_headers, accept_encoding=req.headers.get("accept-encoding")
+            )
             
         except ClientAuthenticationError as e:
             logger.error(f"[{request_id}] Authentication failed: {e}")
@@ -205,25 +246,138 @@ async def main(req: Union[Any, HttpRequest]) -> Union[Any, HttpResponse]:
         }, 500)
 
 
-def _create_response(data: Dict[str, Any], status_code: int) -> Union[Any, HttpResponse]:
-    """HTTPレスポンスを作成"""
-    body = json.dumps(data)
+def _error_payload(e: Exception) -> Tuple[Dict[str, Any], int]:
+    """検索例外を単一検索と同じ形式のエラーに変換"""
+    if isinstance(e, ClientAuthenticationError):
+        return {"code": "SearchUpstreamError", "message": "Authentication failed", "upstream": {"stage": "auth"}}, 500
+    if isinstance(e, HttpResponseError):
+        if getattr(getattr(e, "response", None), "status_code", None) == 429:
+            return {"code": "SearchUpstreamError", "message": "Rate limit exceeded", "upstream": {"stage": "429"}}, 500
+        if "timeout" in str(e).lower():
+            return {"code": "SearchUpstreamError", "message": "Request timeout", "upstream": {"stage": "timeout"}}, 500
+        return {"code": "SearchUpstreamError", "message": "Search service error", "upstream": {"stage": "search"}}, 500
+    return {"code": "InternalServerError", "message": "An unexpected error occurred"}, 500
+
+
+async def _handle_batch(
+    req: Union[Any, HttpRequest],
+    request_data: Dict[str, Any],
+    request_id: str,
+    start_time: float
+) -> Union[Any, HttpResponse]:
+    """
+    複数クエリを1つの SearchClient で並行実行
+    
+    応答:
+    - results: クエリキー → {query, count, cache, results: [{doc, score, rerankerScore?}]}
+    - documents: doc → {id, fields, truncated?}（クエリ間で重複するドキュメントは1回だけ含める）
+    - errors: 失敗したクエリキー → エラー（他のクエリの結果は返す）
+    """
+    try:
+        queries = parse_batch_queries(request_data)
+        query_type = resolve_query_type(request_data.get("query_type"), get_config())
+        projection = SearchProjection.from_request(get_config(), request_data)
+    except ValueError as e:
+        return _create_response({"error": {"code": "InvalidParameterType", "message": str(e)}}, 400)
+    
+    async def search(query: Dict[str, Any]) -> list:
+        return await perform_search(
+            query["search_text"], query["top"], query["filters"], request_id, projection, query_type
+        )
+    
+    outcomes = await run_batch_queries(
+        queries,
+        search,
+        get_search_cache(),
+        {**projection.cache_options(), "query_type": query_type},
+        bypass_cache="no-cache" in (req.headers.get("cache-control") or "").lower()
+    )
+    results, documents, failures = build_batch_response(queries, outcomes)
+    
+    errors: Dict[str, Any] = {}
+    status_code = 200
+    for key, error in failures.items():
+        logger.error(f"[{request_id}] Batch query '{key}' failed: {error}")
+        errors[key], status_code = _error_payload(error)
+    
+    elapsed_ms = int((time.time() - start_time) * 1000)
+    response_data: Dict[str, Any] = {
+        "results": results,
+        "documents": documents,
+        "count": len(results),
+        "elapsedMs": elapsed_ms
+    }
+    if errors:
+        response_data["errors"] = errors
+    logger.info(
+        f"[{request_id}] Batch search completed: {len(queries)} queries, "
+        f"{len(documents)} unique documents, {len(errors)} errors in {elapsed_ms}ms"
+    )
+    # 全クエリが失敗した場合のみエラーステータスを返す
+    return _create_response(
+        response_data,
+        status_code if not results else 200,
+        accept_encoding=req.headers.get("accept-encoding")
+    )
+
+
+def _create_response(
+    data: Dict[str, Any],
+    status_code: int,
+    headers: Optional[Dict[str, str]] = None,
+    accept_encoding: Optional[str] = None
+) -> Union[Any, HttpResponse]:
+    """HTTPレスポンスを作成（accept_encoding に gzip があれば一定サイズ以上を圧縮）"""
+    body = json.dumps(data, ensure_ascii=False)
+    if accept_encoding:
+        body, encoding_headers = encode_body(body, accept_encoding, get_config().gzip_min_bytes)
+        if encoding_headers:
+            headers = {**(headers or {}), **encoding_headers}
     
     if AZURE_FUNCTIONS_AVAILABLE and func:
         return func.HttpResponse(
             body,
             status_code=status_code,
-            mimetype="application/json"
+            mimetype="application/json",
+            headers=headers
         )
     else:
         return HttpResponse(
             body,
             status_code=status_code,
-            mimetype="application/json"
+            mimetype="application/json",
+            headers=headers
         )
 
 
-async def perform_search(search_text: str, top: int, filters: Dict[str, Any], request_id: str) -> list:
+# ウォームワーカー間で再利用する SearchClient（設定とイベントループが変わったら作り直す）
+_search_client: Optional[SearchClient] = None
+_search_client_key: Optional[tuple] = None
+
+
+def _get_search_client() -> SearchClient:
+    """共有 SearchClient を取得（HTTP セッション・コネクションを呼び出し間で再利用）"""
+    global _search_client, _search_client_key
+    config = get_config()
+    key = (config.search_endpoint, config.search_index, config.search_key, id(asyncio.get_running_loop()))
+    if _search_client is None or _search_client_key != key:
+        _search_client = SearchClient(
+            endpoint=config.search_endpoint,
+            index_name=config.search_index,
+            credential=AzureKeyCredential(config.search_key)
+        )
+        _search_client_key = key
+    return _search_client
+
+
+async def perform_search(
+    search_text: str,
+    top: int,
+    filters: Dict[str, Any],
+    request_id: str,
+    projection: Optional[SearchProjection] = None,
+    query_type: Optional[str] = None
+) -> list:
     """
     Azure AI Search の実行
     
@@ -232,43 +386,52 @@ async def perform_search(search_text: str, top: int, filters: Dict[str, Any], re
         top: 取得件数
         filters: フィルター条件
         request_id: リクエストID
+        projection: 応答の射影・切り詰め設定（未指定時は設定値から作成）
+        query_type: 検索モード（未指定時は設定値。vector 系はクエリ埋め込みをキャッシュ経由で取得）
         
     Returns:
         list: 検索結果
     """
     config = get_config()
+    search_client = _get_search_client()
+    if projection is None:
+        projection = SearchProjection.from_request(config, {})
+    query_type = resolve_query_type(query_type, config)
+    
+    # 検索実行（select 指定時は Azure AI Search 側で射影。id は結果の識別に常に含める）
+    logger.info(f"[{request_id}] Executing {query_type} search: '{search_text}' (top={top})")
     
-    # SearchClient の初期化
-    search_client = SearchClient(
-        endpoint=config.search_endpoint,
-        index_name=config.search_index,
-        credential=AzureKeyCredential(config.search_key)
+    vector = await get_query_embedder(config).embed(search_text) if uses_vector(query_type) else None
+    search_kwargs = build_search_kwargs(
+        query_type, search_text, vector, config.vector_search_field, max(config.vector_k, top), config.semantic_config
     )
+    if projection.select:
+        search_kwargs["select"] = list(dict.fromkeys(("id",) + projection.select))
     
-    try:
-        # 検索実行
-        logger.info(f"[{request_id}] Executing search: '{search_text}' (top={top})")
-        
-        results = []
-        search_results = await search_client.search(
-            search_text=search_text,
-            top=top,
-            include_total_count=True
+    results = []
+    search_results = await search_client.search(
+        top=top,
+        include_total_count=True,
+        **search_kwargs
+    )
+    
+    async for result in search_results:
+        # 結果を辞書形式に変換（ベクトル除外・本文の切り詰め）
+        fields, truncated = projection.compact_fields(
+            {k: v for k, v in result.items() if not k.startswith("@")}
         )
-        
-        async for result in search_results:
-            # 結果を辞書形式に変換
-            result_dict = {
-                "id": result.get("id", ""),
-                "score": result.get("@search.score", 0.0),
-                "fields": {k: v for k, v in result.items() if not k.startswith("@")}
-            }
-            results.append(result_dict)
-        
-        return results
-        
-    finally:
-        await search_client.close()
+        result_dict = {
+            "id": result.get("id", ""),
+            "score": result.get("@search.score", 0.0),
+            "fields": fields
+        }
+        if result.get("@search.reranker_score") is not None:
+            result_dict["rerankerScore"] = result["@search.reranker_score"]
+        if truncated:
+            result_dict["truncated"] = truncated
+        results.append(result_dict)
+    
+    return results
 
 
 # Azure Functions での使用のためのエクスポート
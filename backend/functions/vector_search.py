@@ -0,0 +1,277 @@
+"""
+Search Proxy のベクトル / セマンティック・ハイブリッド検索
+
+目的:
+- キーワード検索（simple）に加えて vector / semantic / ハイブリッド検索をプロキシで扱えるようにする
+- 同一クエリの埋め込み計算を繰り返さない
+
+設計:
+- クエリ種別は _AzureSearchSettings.query_type と同じ値（camelCase も可）を受け付ける
+- 埋め込みは「モデル名 + 正規化テキスト」のハッシュをキーに LRU キャッシュし、同一テキストの同時ミスは1回の呼び出しにまとめる
+- SDK 11.5 以降は VectorizedQuery、11.4 beta は vector/top_k/vector_fields 引数で検索する
+- backend/functions と infra/searchfuncapp/Search で同じ内容を使う
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+try:
+    from azure.search.documents.models import VectorizedQuery
+except ImportError:  # azure-search-documents 11.4 beta
+    VectorizedQuery = None
+
+logger = logging.getLogger(__name__)
+
+# 埋め込みキャッシュのエントリ数上限
+EMBEDDING_CACHE_SIZE = int(os.getenv("SEARCH_EMBEDDING_CACHE_SIZE", "1024"))
+
+QUERY_TYPES = ("simple", "semantic", "vector", "vector_simple_hybrid", "vector_semantic_hybrid")
+_QUERY_TYPE_ALIASES = {
+    "vectorSimpleHybrid": "vector_simple_hybrid",
+    "vectorSemanticHybrid": "vector_semantic_hybrid",
+}
+
+
+def normalize_query_type(query_type: Optional[str]) -> str:
+    """
+    クエリ種別を正規化
+
+    Raises:
+        ValueError: 未対応のクエリ種別
+    """
+    normalized = _QUERY_TYPE_ALIASES.get(query_type or "simple", query_type or "simple")
+    if normalized not in QUERY_TYPES:
+        raise ValueError(f"query_type must be one of {', '.join(QUERY_TYPES)}")
+    return normalized
+
+
+def embedding_configured(config: Any) -> bool:
+    return bool(config.embedding_endpoint and config.embedding_deployment)
+
+
+def resolve_query_type(query_type: Optional[str], config: Any) -> str:
+    """
+    リクエストのクエリ種別（未指定時は設定値）を正規化し、この構成で使えるか確認する
+
+    Raises:
+        ValueError: 未対応のクエリ種別、または埋め込みの設定が無いのに vector 系を指定した場合
+    """
+    normalized = normalize_query_type(query_type or config.query_type)
+    if uses_vector(normalized) and not embedding_configured(config):
+        raise ValueError(
+            f"query_type '{normalized}' is not available: "
+            "AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_EMBEDDING_NAME are not configured"
+        )
+    return normalized
+
+
+def uses_vector(query_type: str) -> bool:
+    return query_type.startswith("vector")
+
+
+def uses_semantic(query_type: str) -> bool:
+    return query_type in ("semantic", "vector_semantic_hybrid")
+
+
+def normalize_embedding_text(text: str) -> str:
+    """埋め込み対象テキストを正規化（NFKC・連続空白の畳み込み）"""
+    return " ".join(unicodedata.normalize("NFKC", text or "").split())
+
+
+class QueryEmbedder:
+    """
+    Azure OpenAI でクエリの埋め込みを計算し、LRU キャッシュする
+
+    Args:
+        endpoint: Azure OpenAI エンドポイント
+        deployment: 埋め込みモデルのデプロイ名
+        api_key: API キー（未指定時は DefaultAzureCredential）
+        api_version: API バージョン
+        cache_size: キャッシュするテキスト数の上限
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        deployment: str,
+        api_key: Optional[str] = None,
+        api_version: str = "2024-05-01-preview",
+        cache_size: int = EMBEDDING_CACHE_SIZE
+    ):
+        self.endpoint = endpoint
+        self.deployment = deployment
+        self.api_key = api_key
+        self.api_version = api_version
+        self.cache_size = max(cache_size, 1)
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._client = None
+        self._credential = None
+        self.stats = {"hits": 0, "misses": 0, "calls": 0}
+
+    def _get_client(self):
+        if self._client is None:
+            from openai import AsyncAzureOpenAI
+
+            kwargs: Dict[str, Any] = {"azure_endpoint": self.endpoint, "api_version": self.api_version}
+            if self.api_key:
+                kwargs["api_key"] = self.api_key
+            else:
+                from azure.identity.aio import DefaultAzureCredential, get_bearer_token_provider
+
+                self._credential = DefaultAzureCredential()
+                kwargs["azure_ad_token_provider"] = get_bearer_token_provider(
+                    self._credential, "https://cognitiveservices.azure.com/.default"
+                )
+            self._client = AsyncAzureOpenAI(**kwargs)
+        return self._client
+
+    def cache_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.deployment}\n{normalize_embedding_text(text)}".encode("utf-8")).hexdigest()
+
+    async def compute_embedding(self, text: str) -> List[float]:
+        """埋め込み API を呼び出す（キャッシュなし）"""
+        self.stats["calls"] += 1
+        response = await self._get_client().embeddings.create(model=self.deployment, input=text)
+        return list(response.data[0].embedding)
+
+    async def embed(self, text: str) -> List[float]:
+        """クエリの埋め込みを取得（キャッシュ優先、同一テキストの同時ミスは1回の呼び出しに集約）"""
+        key = self.cache_key(text)
+        vector = self._cache.get(key)
+        if vector is not None:
+            self._cache.move_to_end(key)
+            self.stats["hits"] += 1
+            return vector
+
+        self.stats["misses"] += 1
+        inflight = self._inflight.get(key)
+        if inflight:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            vector = await self.compute_embedding(normalize_embedding_text(text))
+            self._cache[key] = vector
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            future.set_result(vector)
+            return vector
+        except Exception as e:
+            future.set_exception(e)
+            # 待機者がいない場合の "exception was never retrieved" を防ぐ
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        if self._credential is not None:
+            await self._credential.close()
+            self._credential = None
+
+
+def build_search_kwargs(
+    query_type: str,
+    search_text: str,
+    vector: Optional[List[float]],
+    vector_field: str,
+    k_nearest_neighbors: int,
+    semantic_configuration: Optional[str]
+) -> Dict[str, Any]:
+    """
+    クエリ種別に応じた SearchClient.search の引数を組み立てる
+
+    vector 単独の場合はキーワード検索を行わない（search_text=None）。
+    """
+    kwargs: Dict[str, Any] = {"search_text": None if query_type == "vector" else search_text}
+    if uses_vector(query_type):
+        if vector is None:
+            raise ValueError(f"query_type '{query_type}' requires a query embedding")
+        if VectorizedQuery is not None:
+            kwargs["vector_queries"] = [
+                VectorizedQuery(vector=vector, k_nearest_neighbors=k_nearest_neighbors, fields=vector_field)
+            ]
+        else:
+            kwargs.update(vector=vector, top_k=k_nearest_neighbors, vector_fields=vector_field)
+    if uses_semantic(query_type):
+        kwargs["query_type"] = "semantic"
+        if semantic_configuration:
+            kwargs["semantic_configuration_name"] = semantic_configuration
+    return kwargs
+
+
+# ウォームワーカー間で再利用する QueryEmbedder（設定とイベントループが変わったら作り直す）
+_embedder: Optional[QueryEmbedder] = None
+_embedder_key: Optional[tuple] = None
+_embedder_loop: Optional[asyncio.AbstractEventLoop] = None
+# 置き換えた QueryEmbedder のクローズ処理（完了前に GC されないよう参照を保持）
+_closing_tasks: set = set()
+
+
+async def _close_quietly(embedder: QueryEmbedder) -> None:
+    try:
+        await embedder.aclose()
+    except Exception as e:
+        logger.warning(f"Failed to close retired query embedder: {e}")
+
+
+def _retire_embedder(embedder: QueryEmbedder, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    """
+    置き換えた QueryEmbedder の OpenAI クライアントと資格情報を閉じる
+
+    元のループが別スレッドで動いていればそのループで閉じ、
+    それ以外（同じループ、または終了済みのループ）は現在のループで閉じる。
+    """
+    current = asyncio.get_running_loop()
+    if loop is not None and loop is not current and loop.is_running() and not loop.is_closed():
+        asyncio.run_coroutine_threadsafe(_close_quietly(embedder), loop)
+        return
+    task = current.create_task(_close_quietly(embedder))
+    _closing_tasks.add(task)
+    task.add_done_callback(_closing_tasks.discard)
+
+
+def get_query_embedder(config: Any) -> QueryEmbedder:
+    """
+    プロセス共有の QueryEmbedder を取得
+
+    クライアントはイベントループに紐づくため、ループが変わったら作り直す。
+    同じデプロイの埋め込みキャッシュは引き継ぎ、置き換えた側のクライアントは閉じる。
+
+    Raises:
+        ValueError: 埋め込みの設定が無い場合
+    """
+    global _embedder, _embedder_key, _embedder_loop
+    if not embedding_configured(config):
+        raise ValueError("Vector search requires AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_EMBEDDING_NAME")
+    key = (
+        config.embedding_endpoint,
+        config.embedding_deployment,
+        config.embedding_key,
+        config.embedding_api_version,
+        id(asyncio.get_running_loop()),
+    )
+    if _embedder is None or _embedder_key != key:
+        embedder = QueryEmbedder(
+            endpoint=config.embedding_endpoint,
+            deployment=config.embedding_deployment,
+            api_key=config.embedding_key or None,
+            api_version=config.embedding_api_version
+        )
+        if _embedder is not None:
+            if _embedder.deployment == embedder.deployment:
+                embedder._cache = _embedder._cache
+            _retire_embedder(_embedder, _embedder_loop)
+        _embedder = embedder
+        _embedder_key = key
+        _embedder_loop = asyncio.get_running_loop()
+    return _embedder
@@ -0,0 +1,315 @@
+"""
+履歴コンテナの一括削除エンジン
+
+目的:
+- 会話・メッセージ削除を1件ずつ直列に await しない（gunicorn 230秒タイムアウト対策）
+- パーティション(userId)単位のトランザクションバッチ、または同時実行数を制限した並列削除
+- 進捗のストリーミングと、バックグラウンドジョブ（ジョブIDを即時返却）
+
+設計:
+- 削除対象は id のみを射影するクエリで取得し、ページ単位で削除する
+- 404 は削除済みとして扱うため、途中で中断しても再実行で続きから再開できる（冪等）
+- ジョブの状態は同じパーティションに type='deleteJob' のドキュメントとして保存し、
+  どのワーカーからでも参照できるようにする
+- ジョブドキュメントの id は "deleteJob-<job_id>" とし、job_id はサーバーが発行した UUID のみ受け付ける
+  （会話・メッセージのドキュメントを上書きしないため）
+- ジョブドキュメントの ttl はコンテナの既定 TTL（defaultTtl）が設定されている場合のみ有効。
+  未設定のコンテナでは自動削除されないため、起動時に警告を出す
+"""
+import asyncio
+import logging
+import os
+import uuid
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from azure.cosmos import exceptions
+
+
+logger = logging.getLogger(__name__)
+
+# 同時に発行する delete_item の上限（RU消費とスロットリングのバランス）
+BULK_DELETE_CONCURRENCY = int(os.environ.get("HISTORY_BULK_DELETE_CONCURRENCY", "16"))
+# 1ページ（=1進捗イベント）あたりの件数。トランザクションバッチの上限は100操作
+BULK_DELETE_PAGE_SIZE = int(os.environ.get("HISTORY_BULK_DELETE_PAGE_SIZE", "100"))
+
+JOB_DOCUMENT_TYPE = "deleteJob"
+# ジョブ状態ドキュメントの保持期間（コンテナでTTLが有効な場合のみ適用）
+JOB_DOCUMENT_TTL = int(os.environ.get("HISTORY_BULK_DELETE_JOB_TTL", "86400"))
+
+
+@dataclass
+class BulkDeleteProgress:
+    """一括削除の進捗"""
+    job_id: Optional[str] = None
+    status: str = "running"  # running / completed / failed / cancelled
+    total_conversations: int = 0
+    deleted_conversations: int = 0
+    deleted_messages: int = 0
+    failed: int = 0
+    error: Optional[str] = None
+    started_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+    updated_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class BulkDeleter:
+    """
+    userId パーティション内の会話・メッセージ一括削除
+
+    Args:
+        container_client: Cosmos コンテナクライアント（aio）
+        max_concurrency: 並列削除の上限
+        page_size: 1ページあたりの削除件数
+    """
+
+    def __init__(
+        self,
+        container_client,
+        max_concurrency: int = BULK_DELETE_CONCURRENCY,
+        page_size: int = BULK_DELETE_PAGE_SIZE
+    ):
+        self.container_client = container_client
+        self.max_concurrency = max(max_concurrency, 1)
+        self.page_size = min(max(page_size, 1), 100)
+
+    async def _iter_id_pages(
+        self,
+        user_id: str,
+        doc_type: str,
+        conversation_id: Optional[str] = None
+    ) -> AsyncIterator[List[str]]:
+        """削除対象の id をページ単位で取得（id のみ射影）"""
+        query = "SELECT c.id FROM c WHERE c.userId = @userId AND c.type = @type"
+        parameters = [
+            {"name": "@userId", "value": user_id},
+            {"name": "@type", "value": doc_type},
+        ]
+        if conversation_id:
+            query += " AND c.conversationId = @conversationId"
+            parameters.append({"name": "@conversationId", "value": conversation_id})
+
+        pager = self.container_client.query_items(
+            query=query,
+            parameters=parameters,
+            partition_key=user_id,
+            max_item_count=self.page_size
+        )
+        if hasattr(pager, "by_page"):
+            async for page in pager.by_page():
+                ids = [item["id"] async for item in page]
+                if ids:
+                    yield ids
+        else:
+            ids = []
+            async for item in pager:
+                ids.append(item["id"])
+                if len(ids) >= self.page_size:
+                    yield ids
+                    ids = []
+            if ids:
+                yield ids
+
+    async def delete_ids(self, user_id: str, ids: List[str]) -> Dict[str, int]:
+        """
+        同一パーティション内の id 群を削除
+
+        Returns:
+            {"deleted": 件数, "failed": 件数}（404は削除済みとして deleted に計上）
+        """
+        if not ids:
+            return {"deleted": 0, "failed": 0}
+
+        if hasattr(self.container_client, "execute_item_batch"):
+            try:
+                await self.container_client.execute_item_batch(
+                    batch_operations=[("delete", (item_id,)) for item_id in ids],
+                    partition_key=user_id
+                )
+                return {"deleted": len(ids), "failed": 0}
+            except Exception as e:
+                # バッチ内に削除済み(404)が含まれると全体が失敗するため個別削除で続行
+                logger.debug(f"Transactional batch delete failed, falling back to per-item deletes: {e}")
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def delete_one(item_id: str) -> bool:
+            async with semaphore:
+                try:
+                    await self.container_client.delete_item(item=item_id, partition_key=user_id)
+                except exceptions.CosmosResourceNotFoundError:
+                    pass
+                except Exception as e:
+                    logger.warning(f"Failed to delete history item {item_id}: {e}")
+                    return False
+                return True
+
+        results = await asyncio.gather(*(delete_one(item_id) for item_id in ids))
+        deleted = sum(1 for ok in results if ok)
+        return {"deleted": deleted, "failed": len(ids) - deleted}
+
+    async def delete_conversation_messages(self, user_id: str, conversation_id: str) -> int:
+        """会話内の全メッセージを削除し、削除件数を返す"""
+        deleted = 0
+        async for ids in self._iter_id_pages(user_id, "message", conversation_id):
+            result = await self.delete_ids(user_id, ids)
+            deleted += result["deleted"]
+        return deleted
+
+    async def iter_delete_all(
+        self,
+        user_id: str,
+        progress: Optional[BulkDeleteProgress] = None
+    ) -> AsyncIterator[BulkDeleteProgress]:
+        """
+        ユーザーの全会話・全メッセージを削除し、ページごとに進捗を返す
+
+        メッセージを先に削除してから会話を削除するため、中断しても孤立メッセージは残らず、
+        再実行すると残っている分だけが削除される。
+        """
+        progress = progress or BulkDeleteProgress()
+
+        count_query = "SELECT VALUE COUNT(1) FROM c WHERE c.userId = @userId AND c.type = 'conversation'"
+        async for count in self.container_client.query_items(
+            query=count_query,
+            parameters=[{"name": "@userId", "value": user_id}],
+            partition_key=user_id
+        ):
+            progress.total_conversations = count
+
+        for doc_type in ("message", "conversation"):
+            async for ids in self._iter_id_pages(user_id, doc_type):
+                result = await self.delete_ids(user_id, ids)
+                if doc_type == "message":
+                    progress.deleted_messages += result["deleted"]
+                else:
+                    progress.deleted_conversations += result["deleted"]
+                progress.failed += result["failed"]
+                progress.updated_at = datetime.utcnow().isoformat()
+                yield progress
+
+        progress.status = "completed" if progress.failed == 0 else "failed"
+        if progress.failed:
+            progress.error = f"{progress.failed} items could not be deleted; retry to resume"
+        progress.updated_at = datetime.utcnow().isoformat()
+        yield progress
+
+
+class BulkDeleteJobManager:
+    """
+    全会話削除のバックグラウンドジョブ管理
+
+    ジョブの状態は Cosmos に保存するため、ステータス照会は別ワーカーでも可能。
+    実行中タスクはワーカープロセス内で保持し、シャットダウン時にキャンセルする。
+    """
+
+    def __init__(self, deleter: BulkDeleter):
+        self.deleter = deleter
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._ttl_checked = False
+
+    @staticmethod
+    def _document_id(job_id: str) -> str:
+        return f"{JOB_DOCUMENT_TYPE}-{job_id}"
+
+    @staticmethod
+    def _is_valid_job_id(job_id: str) -> bool:
+        try:
+            return str(uuid.UUID(job_id)) == job_id
+        except (TypeError, ValueError, AttributeError):
+            return False
+
+    async def _check_default_ttl(self) -> None:
+        """コンテナに既定 TTL が無い場合、ジョブドキュメントが残り続けることを警告"""
+        if self._ttl_checked:
+            return
+        self._ttl_checked = True
+        try:
+            properties = await self.deleter.container_client.read()
+        except Exception as e:
+            logger.debug(f"Could not read container properties for TTL check: {e}")
+            return
+        if properties.get("defaultTtl") is None:
+            logger.warning(
+                "History container has no defaultTtl; bulk delete job documents "
+                f"(type='{JOB_DOCUMENT_TYPE}') will not expire automatically. "
+                "Set defaultTtl to -1 to enable per-item ttl."
+            )
+
+    async def _save(self, user_id: str, progress: BulkDeleteProgress) -> None:
+        document = progress.to_dict()
+        document.update({
+            "id": self._document_id(progress.job_id),
+            "type": JOB_DOCUMENT_TYPE,
+            "userId": user_id,
+            "ttl": JOB_DOCUMENT_TTL,
+        })
+        try:
+            await self.deleter.container_client.upsert_item(document)
+        except Exception as e:
+            logger.warning(f"Failed to save bulk delete job {progress.job_id}: {e}")
+
+    async def start(self, user_id: str, job_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        ジョブを開始してすぐに返す（job_id 指定時は未完了ジョブを再開）
+
+        Raises:
+            ValueError: job_id がサーバー発行の形式（UUID）でない場合
+        """
+        if job_id is not None and not self._is_valid_job_id(job_id):
+            raise ValueError("Invalid job_id")
+        job_id = job_id or str(uuid.uuid4())
+        await self._check_default_ttl()
+        running = self._tasks.get(job_id)
+        if running and not running.done():
+            return await self.get_status(user_id, job_id) or BulkDeleteProgress(job_id=job_id).to_dict()
+
+        progress = BulkDeleteProgress(job_id=job_id)
+        await self._save(user_id, progress)
+
+        async def run():
+            try:
+                async for current in self.deleter.iter_delete_all(user_id, progress):
+                    await self._save(user_id, current)
+            except asyncio.CancelledError:
+                # シャットダウン時は running のまま残さない（同じ job_id で再開できる）
+                progress.status = "cancelled"
+                progress.error = "Job was interrupted; start again with the same job_id to resume"
+                progress.updated_at = datetime.utcnow().isoformat()
+                await self._save(user_id, progress)
+                raise
+            except Exception as e:
+                logger.exception(f"Bulk delete job {job_id} failed")
+                progress.status = "failed"
+                progress.error = str(e)
+                await self._save(user_id, progress)
+            finally:
+                self._tasks.pop(job_id, None)
+
+        self._tasks[job_id] = asyncio.create_task(run())
+        return progress.to_dict()
+
+    async def get_status(self, user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブ状態を取得（存在しない場合None）"""
+        if not self._is_valid_job_id(job_id):
+            return None
+        try:
+            document = await self.deleter.container_client.read_item(
+                item=self._document_id(job_id), partition_key=user_id
+            )
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+        if document.get("type") != JOB_DOCUMENT_TYPE:
+            return None
+        return {key: document.get(key) for key in BulkDeleteProgress.__dataclass_fields__}
+
+    async def aclose(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        # cancelled の最終状態を書き込むまで待つ
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
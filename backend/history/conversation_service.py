@@ -11,11 +11,34 @@
 - 依存性注入：CosmosDBクライアントを外部から注入
 - フレームワーク非依存：純粋なビジネスロジック
 """
+import asyncio
 import logging
+import os
 import uuid
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
+# 生成タイトルの結果を保持する時間（秒）。ストリーム末尾のメタデータで参照される
+TITLE_RESULT_RETENTION = float(os.environ.get("TITLE_RESULT_RETENTION", "120"))
+DEFAULT_CONVERSATION_TITLE = "新しい会話"
+
+
+def provisional_title(messages: List[Dict[str, Any]], max_length: int = 20) -> str:
+    """最初のユーザーメッセージを切り詰めた暫定タイトル"""
+    content = ""
+    for message in messages or []:
+        if isinstance(message, dict) and message.get("role", "user") == "user":
+            content = message.get("content") or ""
+            break
+    if not isinstance(content, str):
+        content = ""
+    content = " ".join(content.split())
+    if not content:
+        return DEFAULT_CONVERSATION_TITLE
+    if len(content) > max_length:
+        return content[:max_length - 3] + "..."
+    return content
+
 
 class ConversationHistoryService:
     """
@@ -34,18 +57,25 @@ class ConversationHistoryService:
         """
         self.cosmos_client = cosmos_client
         self.logger = logging.getLogger(__name__)
+        # conversation_id → バックグラウンドのタイトル生成タスク
+        self._title_tasks: Dict[str, asyncio.Task] = {}
     
     async def create_conversation_with_message(
         self, 
         user_id: str, 
         messages: List[Dict[str, Any]], 
         conversation_id: Optional[str] = None,
-        title_generator_func = None
+        title_generator_func = None,
+        allocated_metadata: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
         会話作成またはメッセージ追加
         
         既存のadd_conversationとadd_conversation_modern_rag関数のロジックを共通化して移植
+        
+        Args:
+            allocated_metadata: allocate_conversation_metadata で事前に払い出した
+                新規会話の ID・暫定タイトル・作成日時（応答と並行して保存する場合）
         """
         try:
             # CosmosDB設定確認
@@ -55,19 +85,24 @@ class ConversationHistoryService:
             # 履歴メタデータの準備
             history_metadata = {}
             
-            # 新規会話の場合
+            # 新規会話の場合（暫定タイトルで即時作成し、生成タイトルはバックグラウンドで反映）
             if not conversation_id:
-                if title_generator_func:
-                    title = await title_generator_func(messages)
-                else:
-                    title = "新しい会話"
+                allocated = allocated_metadata or {}
+                title = allocated.get("title") or provisional_title(messages)
                 
                 conversation_dict = await self.cosmos_client.create_conversation(
-                    user_id=user_id, title=title
+                    user_id=user_id,
+                    title=title,
+                    conversation_id=allocated.get("conversation_id"),
+                    created_at=allocated.get("date")
                 )
                 conversation_id = conversation_dict["id"]
                 history_metadata["title"] = title
                 history_metadata["date"] = conversation_dict["createdAt"]
+                
+                if title_generator_func:
+                    self._start_title_generation(user_id, conversation_id, messages, title, title_generator_func)
+                    history_metadata["title_pending"] = True
             
             # メッセージをCosmosDBに保存
             if len(messages) > 0 and messages[-1]["role"] == "user":
@@ -95,6 +130,84 @@ class ConversationHistoryService:
             self.logger.exception("Exception in create_conversation_with_message")
             raise e
     
+    def allocate_conversation_metadata(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        新規会話の ID・暫定タイトル・作成日時を保存前に払い出す
+        
+        応答ストリームを Cosmos DB への書き込み完了前に開始するために使う。
+        """
+        return {
+            "conversation_id": str(uuid.uuid4()),
+            "title": provisional_title(messages),
+            "date": datetime.utcnow().isoformat(),
+        }
+    
+    def _start_title_generation(
+        self,
+        user_id: str,
+        conversation_id: str,
+        messages: List[Dict[str, Any]],
+        provisional: str,
+        title_generator_func
+    ) -> None:
+        """タイトル生成をバックグラウンドタスクとして開始（結果は TITLE_RESULT_RETENTION 秒保持）"""
+        task = asyncio.create_task(
+            self._apply_generated_title(user_id, conversation_id, list(messages), provisional, title_generator_func)
+        )
+        self._title_tasks[conversation_id] = task
+        
+        def forget(_task):
+            loop = asyncio.get_running_loop()
+            loop.call_later(TITLE_RESULT_RETENTION, self._forget_title_task, conversation_id, task)
+        
+        task.add_done_callback(forget)
+    
+    def _forget_title_task(self, conversation_id: str, task: asyncio.Task) -> None:
+        if self._title_tasks.get(conversation_id) is task:
+            self._title_tasks.pop(conversation_id, None)
+    
+    async def _apply_generated_title(
+        self,
+        user_id: str,
+        conversation_id: str,
+        messages: List[Dict[str, Any]],
+        provisional: str,
+        title_generator_func
+    ) -> Optional[str]:
+        """タイトルを生成して会話に反映（失敗時は暫定タイトルのまま None を返す）"""
+        try:
+            title = (await title_generator_func(messages) or "").strip()
+            if not title or title == provisional:
+                return None
+            await self.cosmos_client.rename_conversation(user_id, conversation_id, title)
+            return title
+        except Exception as e:
+            self.logger.warning(f"Background title generation failed for {conversation_id}: {e}")
+            return None
+    
+    async def get_generated_title(self, conversation_id: str, timeout: float = 0) -> Optional[str]:
+        """
+        バックグラウンドで生成されたタイトルを取得
+        
+        Args:
+            conversation_id: 会話ID
+            timeout: 生成完了を待つ最大秒数（0 なら完了済みの場合のみ返す）
+            
+        Returns:
+            生成タイトル（未開始・未完了・失敗時は None）
+        """
+        task = self._title_tasks.get(conversation_id)
+        if task is None:
+            return None
+        if not task.done():
+            if timeout <= 0:
+                return None
+            try:
+                await asyncio.wait_for(asyncio.shield(task), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return task.result() if not task.cancelled() else None
+    
     async def get_user_conversations(
         self, 
         user_id: str, 
@@ -118,28 +231,59 @@ class ConversationHistoryService:
         
         return conversations
     
+    async def get_user_conversations_page(
+        self, 
+        user_id: str, 
+        limit: int = 25, 
+        continuation_token: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        ユーザーの会話一覧を継続トークンで1ページ取得
+        
+        OFFSET を使わないため、深いページでも RU・レイテンシが増えない
+        
+        Returns:
+            {"conversations": [...], "continuation_token": 次ページのトークン（最終ページはNone）}
+        """
+        if not self.cosmos_client:
+            raise Exception("CosmosDB is not configured or not working")
+        
+        conversations, next_token = await self.cosmos_client.get_conversations_page(
+            user_id, limit=limit, continuation_token=continuation_token
+        )
+        
+        return {
+            "conversations": conversations,
+            "continuation_token": next_token
+        }
+    
     async def get_conversation_with_messages(
         self, 
         user_id: str, 
-        conversation_id: str
+        conversation_id: str,
+        limit: Optional[int] = None,
+        before: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         会話の詳細とメッセージを取得
         
         既存のget_conversation関数のロジックを移植
+        limit 指定時は before（前回の next_cursor）より古い直近 limit 件のみ返す
         """
         if not self.cosmos_client:
             raise Exception("CosmosDB is not configured or not working")
         
-        # 会話の存在確認
-        conversation = await self.cosmos_client.get_conversation(user_id, conversation_id)
-        if not conversation:
-            raise Exception(
-                f"Conversation {conversation_id} was not found. It either does not exist or the logged in user does not have access to it."
-            )
+        # 会話の存在確認（ポイント読み取り、存在しない場合 ConversationNotFoundError）
+        conversation = await self.cosmos_client.get_conversation_or_raise(user_id, conversation_id)
         
         # メッセージ取得
-        conversation_messages = await self.cosmos_client.get_messages(user_id, conversation_id)
+        next_cursor = None
+        if limit:
+            conversation_messages, next_cursor = await self.cosmos_client.get_messages_window(
+                user_id, conversation_id, limit, before
+            )
+        else:
+            conversation_messages = await self.cosmos_client.get_messages(user_id, conversation_id)
         
         # フロントエンド形式に整形
         messages = [
@@ -153,10 +297,13 @@ class ConversationHistoryService:
             for msg in conversation_messages
         ]
         
-        return {
+        result = {
             "conversation_id": conversation_id,
             "messages": messages
         }
+        if limit:
+            result["next_cursor"] = next_cursor
+        return result
     
     async def delete_conversation_and_messages(
         self, 
@@ -180,7 +327,7 @@ class ConversationHistoryService:
         return {
             "message": "Successfully deleted conversation and messages",
             "conversation_id": conversation_id,
-            "deleted_messages_count": len(deleted_messages) if deleted_messages else 0,
+            "deleted_messages_count": deleted_messages or 0,
             "deleted_conversation": bool(deleted_conversation)
         }
     
@@ -201,18 +348,8 @@ class ConversationHistoryService:
         if not new_title:
             raise ValueError("title is required")
         
-        # 会話の存在確認
-        conversation = await self.cosmos_client.get_conversation(user_id, conversation_id)
-        if not conversation:
-            raise Exception(
-                f"Conversation {conversation_id} was not found. It either does not exist or the logged in user does not have access to it."
-            )
-        
-        # タイトル更新
-        conversation["title"] = new_title
-        updated_conversation = await self.cosmos_client.upsert_conversation(conversation)
-        
-        return updated_conversation
+        # タイトルのみ部分更新（存在しない場合 ConversationNotFoundError）
+        return await self.cosmos_client.rename_conversation(user_id, conversation_id, new_title)
     
     async def clear_conversation_messages(
         self, 
@@ -232,7 +369,7 @@ class ConversationHistoryService:
         return {
             "message": "Successfully deleted messages in conversation",
             "conversation_id": conversation_id,
-            "deleted_messages_count": len(deleted_messages) if deleted_messages else 0
+            "deleted_messages_count": deleted_messages or 0
         }
     
     async def delete_all_user_conversations(
@@ -243,31 +380,38 @@ class ConversationHistoryService:
         ユーザーの全会話を削除
         
         既存のdelete_all_conversations関数のロジックを移植
+        一括削除エンジン（BulkDeleter）で id 射影・並列削除を行う
         """
-        if not self.cosmos_client:
-            raise Exception("CosmosDB is not configured or not working")
-        
-        # ユーザーの全会話を取得
-        conversations = await self.cosmos_client.get_conversations(
-            user_id, offset=0, limit=None
-        )
-        
-        if not conversations:
-            raise Exception(f"No conversations for {user_id} were found")
+        progress = None
+        async for progress in self.iter_delete_all_user_conversations(user_id):
+            pass
         
-        deleted_count = 0
-        # 各会話を削除
-        for conversation in conversations:
-            # メッセージを削除
-            await self.cosmos_client.delete_messages(conversation["id"], user_id)
-            # 会話を削除
-            await self.cosmos_client.delete_conversation(user_id, conversation["id"])
-            deleted_count += 1
+        if progress.status == "failed":
+            raise Exception(progress.error)
         
         return {
             "message": "Successfully deleted all conversations and messages",
-            "deleted_conversations_count": deleted_count
+            "deleted_conversations_count": progress.deleted_conversations,
+            "deleted_messages_count": progress.deleted_messages
         }
+    
+    async def iter_delete_all_user_conversations(self, user_id: str):
+        """
+        ユーザーの全会話を削除し、ページごとの進捗（BulkDeleteProgress）を返す
+        
+        冪等なため、中断後に再実行すると残りから再開される
+        """
+        if not self.cosmos_client:
+            raise Exception("CosmosDB is not configured or not working")
+        
+        async for progress in self.cosmos_client.bulk_deleter.iter_delete_all(user_id):
+            yield progress
+    
+    def get_bulk_delete_jobs(self):
+        """全会話削除のバックグラウンドジョブマネージャ（BulkDeleteJobManager）"""
+        if not self.cosmos_client:
+            raise Exception("CosmosDB is not configured or not working")
+        return self.cosmos_client.bulk_delete_jobs
 
     # ============================================
     # TDD Phase 3.1: 履歴管理機能拡張 (Green Phase)
@@ -379,6 +523,54 @@ class ConversationHistoryService:
                 f"Exception while deleting messages: conv_id={conversation_id}, user_id={user_id}, error={e}"
             )
             raise
+    
+    async def get_agent_thread_id(
+        self, 
+        user_id: str, 
+        conversation_id: str
+    ) -> Optional[str]:
+        """
+        会話に紐づく Azure AI Agents スレッドIDを取得
+        
+        Args:
+            conversation_id: 会話ID
+            user_id: ユーザーID
+            
+        Returns:
+            スレッドID（未保存の場合はNone）
+        """
+        if not self.cosmos_client:
+            return None
+        
+        conversation = await self.cosmos_client.get_conversation(user_id, conversation_id)
+        if not conversation:
+            return None
+        return conversation.get("agentThreadId")
+    
+    async def set_agent_thread_id(
+        self, 
+        user_id: str, 
+        conversation_id: str, 
+        thread_id: str
+    ) -> bool:
+        """
+        会話ドキュメントに Azure AI Agents スレッドIDを保存（部分更新）
+        
+        Args:
+            conversation_id: 会話ID
+            user_id: ユーザーID
+            thread_id: スレッドID
+            
+        Returns:
+            保存できた場合True
+        """
+        if not self.cosmos_client:
+            return False
+        
+        updated = await self.cosmos_client.update_conversation_fields(
+            user_id, conversation_id, {"agentThreadId": thread_id}
+        )
+        return bool(updated)
 
 
 class ConversationTitleGenerator:
@@ -390,12 +582,14 @@ class ConversationTitleGenerator:
     - フォールバック処理
     """
     
-    def __init__(self, openai_client):
+    def __init__(self, openai_client, model: str = "turbo"):
         """
         Args:
             openai_client: Azure OpenAIクライアント
+            model: タイトル生成に使うデプロイメント名
         """
         self.openai_client = openai_client
+        self.model = model
         self.logger = logging.getLogger(__name__)
     
     async def generate_title(self, messages: List[Dict[str, Any]]) -> str:
@@ -421,7 +615,7 @@ class ConversationTitleGenerator:
                 })
             
             response = await self.openai_client.chat.completions.create(
-                model="turbo",  # デプロイメント名
+                model=self.model,  # デプロイメント名
                 messages=title_prompt,
                 temperature=0.3,
                 max_tokens=50
@@ -433,9 +627,4 @@ class ConversationTitleGenerator:
         except Exception as e:
             self.logger.exception("Exception while generating title: %s", e)
             # フォールバック: メッセージの一部またはデフォルトタイトル
-            if messages and len(messages) > 0:
-                content = messages[0].get("content", "")
-                if len(content) > 20:
-                    return content[:17] + "..."
-                return content if content else "新しい会話"
-            return "新しい会話"
+            return provisional_title(messages)
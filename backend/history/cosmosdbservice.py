@@ -1,11 +1,175 @@
 import uuid
+import json
+import time
+import base64
+import asyncio
+import logging
+from collections import OrderedDict
 from datetime import datetime
 from azure.cosmos.aio import CosmosClient
 from azure.cosmos import exceptions
-  
+from backend.history.bulk_delete import BulkDeleter, BulkDeleteJobManager
+from backend.history import queries
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationNotFoundError(Exception):
+    ## raised when a by-id lookup finds no conversation in the user's partition
+    ## (missing, deleted, or owned by another user)
+
+    def __init__(self, conversation_id):
+        self.conversation_id = conversation_id
+        super().__init__(
+            f"Conversation {conversation_id} was not found. It either does not exist or the logged in user does not have access to it."
+        )
+
+
+class RequestChargeTracker():
+    ## cumulative request units (x-ms-request-charge) per logical operation
+
+    def __init__(self):
+        self._stats = {}
+
+    def record(self, operation, headers):
+        try:
+            charge = float((headers or {}).get('x-ms-request-charge', 0) or 0)
+        except (TypeError, ValueError):
+            charge = 0.0
+        stats = self._stats.setdefault(operation, {'count': 0, 'request_units': 0.0})
+        stats['count'] += 1
+        stats['request_units'] += charge
+
+    def hook(self, operation):
+        ## response_hook for point operations
+        return lambda headers, _result: self.record(operation, headers)
+
+    def query_hook(self, operation):
+        ## response_hook for queries: the SDK calls it with each fetched page body (a dict) and the
+        ## headers of that request, plus once with the pager itself on creation, which is skipped
+        def record_page(headers, result):
+            if isinstance(result, dict):
+                self.record(operation, headers)
+        return record_page
+
+    def snapshot(self):
+        return {
+            operation: {
+                'count': stats['count'],
+                'request_units': round(stats['request_units'], 2),
+                'avg_request_units': round(stats['request_units'] / stats['count'], 2) if stats['count'] else 0.0,
+            }
+            for operation, stats in self._stats.items()
+        }
+
+
+def encode_messages_cursor(created_at, seen_ids):
+    ## opaque cursor for get_messages_window: the oldest createdAt of the window plus the ids
+    ## already returned with exactly that createdAt (tie-break for messages written concurrently)
+    payload = json.dumps({'t': created_at, 'ids': list(seen_ids)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_messages_cursor(cursor):
+    ## returns (createdAt, seen ids); a plain createdAt string (older cursor format) has no seen ids
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return payload['t'], list(payload.get('ids') or [])
+    except (ValueError, TypeError, KeyError):
+        return cursor, []
+
+
+class UpdatedAtCoalescer():
+    ## write-behind buffer for conversation updatedAt bumps: rapid create_message calls
+    ## on the same conversation collapse into one patch per flush interval
+    ## only conversations whose existence was confirmed recently (is_known) are written behind;
+    ## if a flush finds the conversation gone, the messages written since the last flush are deleted
+
+    def __init__(self, container_client, flush_interval: float = 1.0,
+                 known_ttl: float = 300.0, known_size: int = 10000):
+        self.container_client = container_client
+        self.flush_interval = flush_interval
+        self.known_ttl = known_ttl
+        self.known_size = max(known_size, 1)
+        self._pending = {}
+        self._pending_messages = {}
+        self._known = OrderedDict()
+        self._flush_task = None
+
+    def is_known(self, user_id, conversation_id):
+        key = (user_id, conversation_id)
+        expires_at = self._known.get(key)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            del self._known[key]
+            return False
+        return True
+
+    def remember(self, user_id, conversation_id):
+        ## the conversation was just confirmed to exist (synchronous updatedAt patch succeeded)
+        key = (user_id, conversation_id)
+        self._known[key] = time.monotonic() + self.known_ttl
+        self._known.move_to_end(key)
+        while len(self._known) > self.known_size:
+            self._known.popitem(last=False)
+
+    def forget(self, user_id, conversation_id):
+        self._known.pop((user_id, conversation_id), None)
+
+    def touch(self, user_id, conversation_id, updated_at, message_id=None):
+        key = (user_id, conversation_id)
+        if updated_at > self._pending.get(key, ''):
+            self._pending[key] = updated_at
+        if message_id:
+            self._pending_messages.setdefault(key, []).append(message_id)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        pending_messages, self._pending_messages = self._pending_messages, {}
+        if not pending:
+            return
+        results = await asyncio.gather(*[
+            self.container_client.patch_item(
+                item=conversation_id,
+                partition_key=user_id,
+                patch_operations=[{'op': 'set', 'path': '/updatedAt', 'value': updated_at}]
+            )
+            for (user_id, conversation_id), updated_at in pending.items()
+        ], return_exceptions=True)
+        for key, result in zip(pending, results):
+            if isinstance(result, exceptions.CosmosResourceNotFoundError):
+                ## the conversation was deleted after it was confirmed: remove the orphaned messages
+                self.forget(*key)
+                await self._delete_orphans(key[0], key[1], pending_messages.get(key, []))
+            elif isinstance(result, Exception):
+                logger.warning(f"Failed to flush conversation updatedAt: {result}")
+
+    async def _delete_orphans(self, user_id, conversation_id, message_ids):
+        for message_id in message_ids:
+            try:
+                await self.container_client.delete_item(item=message_id, partition_key=user_id)
+            except exceptions.CosmosResourceNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"Failed to delete orphaned message {message_id} of conversation {conversation_id}: {e}")
+
+    async def aclose(self):
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+
+
 class CosmosConversationClient():
     
-    def __init__(self, cosmosdb_endpoint: str, credential: any, database_name: str, container_name: str, enable_message_feedback: bool = False):
+    def __init__(self, cosmosdb_endpoint: str, credential: any, database_name: str, container_name: str, enable_message_feedback: bool = False,
+                 updated_at_write_behind: bool = False, updated_at_flush_interval: float = 1.0):
         self.cosmosdb_endpoint = cosmosdb_endpoint
         self.credential = credential
         self.database_name = database_name
@@ -28,6 +192,22 @@ class CosmosConversationClient():
             self.container_client = self.database_client.get_container_client(container_name)
         except exceptions.CosmosResourceNotFoundError:
             raise ValueError("Invalid CosmosDB container name") 
+
+        self.updated_at_coalescer = (
+            UpdatedAtCoalescer(self.container_client, updated_at_flush_interval)
+            if updated_at_write_behind else None
+        )
+        self.bulk_deleter = BulkDeleter(self.container_client)
+        self.request_charges = RequestChargeTracker()
+        ## set by check_indexing_policy(); multi-property ORDER BY requires the composite indexes
+        self.composite_indexes_ready = False
+        self.bulk_delete_jobs = BulkDeleteJobManager(self.bulk_deleter)
+
+    async def aclose(self):
+        await self.bulk_delete_jobs.aclose()
+        if self.updated_at_coalescer:
+            await self.updated_at_coalescer.aclose()
+        await self.cosmosdb_client.close()
         
 
     async def ensure(self):
@@ -45,12 +225,32 @@ class CosmosConversationClient():
             
         return True, "CosmosDB client initialized successfully"
 
-    async def create_conversation(self, user_id, title = ''):
+    async def check_indexing_policy(self):
+        ## compare the container indexing policy with the composite indexes the history queries need
+        ## returns the names of the missing indexes (empty when all are present)
+        try:
+            container_info = await self.container_client.read()
+        except Exception as e:
+            logger.warning(f"Could not read indexing policy of container {self.container_name}: {e}")
+            return [index.name for index in queries.REQUIRED_COMPOSITE_INDEXES]
+
+        missing = queries.missing_composite_indexes(container_info.get('indexingPolicy'))
+        self.composite_indexes_ready = not missing
+        for index in missing:
+            logger.warning(
+                f"Container {self.container_name} is missing composite index {index.name}: "
+                f"{index.to_policy()}. History queries fall back to single-property ORDER BY."
+            )
+        return [index.name for index in missing]
+
+    async def create_conversation(self, user_id, title = '', conversation_id = None, created_at = None):
+        ## conversation_id / created_at may be allocated up front so callers can stream before the write completes
+        created_at = created_at or datetime.utcnow().isoformat()
         conversation = {
-            'id': str(uuid.uuid4()),  
+            'id': conversation_id or str(uuid.uuid4()),  
             'type': 'conversation',
-            'createdAt': datetime.utcnow().isoformat(),  
-            'updatedAt': datetime.utcnow().isoformat(),  
+            'createdAt': created_at,  
+            'updatedAt': created_at,  
             'userId': user_id,
             'title': title
         }
@@ -62,30 +262,58 @@ class CosmosConversationClient():
             return False
     
     async def upsert_conversation(self, conversation):
-        resp = await self.container_client.upsert_item(conversation)
+        resp = await self.container_client.upsert_item(
+            conversation, response_hook=self.request_charges.hook('upsert_conversation')
+        )
         if resp:
             return resp
         else:
             return False
 
+    async def update_conversation_fields(self, user_id, conversation_id, fields: dict):
+        ## partial update of top-level conversation fields (single round trip, no read)
+        ## the predicate keeps the patch off other document types (412 is treated as not found)
+        patch_operations = [
+            {'op': 'set', 'path': f'/{name}', 'value': value}
+            for name, value in fields.items()
+        ]
+        try:
+            return await self.container_client.patch_item(
+                item=conversation_id,
+                partition_key=user_id,
+                patch_operations=patch_operations,
+                filter_predicate="FROM c WHERE c.type = 'conversation'",
+                response_hook=self.request_charges.hook('update_conversation_fields')
+            )
+        except (exceptions.CosmosResourceNotFoundError, exceptions.CosmosAccessConditionFailedError):
+            return None
+
+    async def rename_conversation(self, user_id, conversation_id, title):
+        ## patch only the title; raises ConversationNotFoundError when the conversation is missing
+        conversation = await self.update_conversation_fields(user_id, conversation_id, {'title': title})
+        if conversation is None:
+            raise ConversationNotFoundError(conversation_id)
+        return conversation
+
     async def delete_conversation(self, user_id, conversation_id):
-        conversation = await self.container_client.read_item(item=conversation_id, partition_key=user_id)        
-        if conversation:
-            resp = await self.container_client.delete_item(item=conversation_id, partition_key=user_id)
-            return resp
-        else:
-            return True
+        ## point delete without a preceding read; an already deleted conversation is not an error
+        if self.updated_at_coalescer:
+            self.updated_at_coalescer.forget(user_id, conversation_id)
+        try:
+            await self.container_client.delete_item(
+                item=conversation_id,
+                partition_key=user_id,
+                response_hook=self.request_charges.hook('delete_conversation')
+            )
+        except exceptions.CosmosResourceNotFoundError:
+            pass
+        return True
 
         
     async def delete_messages(self, conversation_id, user_id):
-        ## get a list of all the messages in the conversation
-        messages = await self.get_messages(user_id, conversation_id)
-        response_list = []
-        if messages:
-            for message in messages:
-                resp = await self.container_client.delete_item(item=message['id'], partition_key=user_id)
-                response_list.append(resp)
-            return response_list
+        ## delete all messages of the conversation in pages of ids (bounded concurrency / batches)
+        ## returns the number of deleted messages
+        return await self.bulk_deleter.delete_conversation_messages(user_id, conversation_id)
 
 
     async def get_conversations(self, user_id, limit, sort_order = 'DESC', offset = 0):
@@ -95,37 +323,70 @@ class CosmosConversationClient():
                 'value': user_id
             }
         ]
-        query = f"SELECT * FROM c where c.userId = @userId and c.type='conversation' order by c.updatedAt {sort_order}"
-        if limit is not None:
-            query += f" offset {offset} limit {limit}" 
-        
-        conversations = []
-        async for item in self.container_client.query_items(query=query, parameters=parameters):
-            conversations.append(item)
+        query = queries.conversation_list_query(
+            sort_order, offset=offset, limit=limit, composite=self.composite_indexes_ready
+        )
         
-        return conversations
+        return await self._query_all('get_conversations', query, parameters, partition_key=user_id)
 
-    async def get_conversation(self, user_id, conversation_id):
+    async def get_conversations_page(self, user_id, limit, continuation_token=None, sort_order='DESC'):
+        ## one page of the sidebar listing; cost does not grow with how deep the user has paged
+        ## returns (conversations, next continuation token or None)
         parameters = [
-            {
-                'name': '@conversationId',
-                'value': conversation_id
-            },
             {
                 'name': '@userId',
                 'value': user_id
             }
         ]
-        query = f"SELECT * FROM c where c.id = @conversationId and c.type='conversation' and c.userId = @userId"
+        query = queries.conversation_list_query(sort_order, composite=self.composite_indexes_ready)
+        pager = self.container_client.query_items(
+            query=query,
+            parameters=parameters,
+            partition_key=user_id,
+            max_item_count=limit,
+            response_hook=self.request_charges.query_hook('get_conversations_page')
+        )
+        page_iterator = pager.by_page(continuation_token)
         conversations = []
-        async for item in self.container_client.query_items(query=query, parameters=parameters):
-            conversations.append(item)
+        async for page in page_iterator:
+            async for item in page:
+                conversations.append(item)
+            break
+        return conversations, page_iterator.continuation_token
 
-        ## if no conversations are found, return None
-        if len(conversations) == 0:
+    async def get_conversation(self, user_id, conversation_id):
+        ## point read by id + partition key (userId); returns None if not found
+        try:
+            conversation = await self.container_client.read_item(
+                item=conversation_id,
+                partition_key=user_id,
+                response_hook=self.request_charges.hook('get_conversation')
+            )
+        except exceptions.CosmosResourceNotFoundError:
             return None
-        else:
-            return conversations[0]
+        if conversation.get('type') != 'conversation':
+            return None
+        return conversation
+
+    async def get_conversation_or_raise(self, user_id, conversation_id):
+        conversation = await self.get_conversation(user_id, conversation_id)
+        if conversation is None:
+            raise ConversationNotFoundError(conversation_id)
+        return conversation
+
+    async def _query_all(self, operation, query, parameters, **kwargs):
+        ## drain a query, recording the request charge of every page through the response hook
+        ## (the shared client_connection.last_response_headers is overwritten by concurrent requests)
+        items = []
+        pager = self.container_client.query_items(
+            query=query,
+            parameters=parameters,
+            response_hook=self.request_charges.query_hook(operation),
+            **kwargs
+        )
+        async for item in pager:
+            items.append(item)
+        return items
  
     async def create_message(self, uuid, conversation_id, user_id, input_message: dict):
         message = {
@@ -154,28 +415,81 @@ class CosmosConversationClient():
         if self.enable_message_feedback:
             message['feedback'] = ''
         
-        resp = await self.container_client.upsert_item(message)  
-        if resp:
-            ## update the parent conversations's updatedAt field with the current message's createdAt datetime value
-            conversation = await self.get_conversation(user_id, conversation_id)
-            if not conversation:
-                return "Conversation not found"
-            conversation['updatedAt'] = message['createdAt']
-            await self.upsert_conversation(conversation)
-            return resp
-        else:
-            return False
+        ## update the parent conversations's updatedAt field with the current message's createdAt datetime value
+        ## write-behind only for a conversation confirmed to exist recently; otherwise the synchronous
+        ## patch below checks it (and returns "Conversation not found") and marks it as known
+        coalescer = self.updated_at_coalescer
+        if coalescer and coalescer.is_known(user_id, conversation_id):
+            resp = await self.container_client.upsert_item(message)
+            if resp:
+                coalescer.touch(user_id, conversation_id, message['createdAt'], message['id'])
+            return resp if resp else False
+
+        updated_at_patch = [{'op': 'set', 'path': '/updatedAt', 'value': message['createdAt']}]
+
+        if hasattr(self.container_client, 'execute_item_batch'):
+            ## transactional batch: message write + conversation patch commit atomically in one round trip
+            try:
+                results = await self.container_client.execute_item_batch(
+                    batch_operations=[
+                        ('upsert', (message,)),
+                        ('patch', (conversation_id, updated_at_patch)),
+                    ],
+                    partition_key=user_id
+                )
+            except exceptions.CosmosBatchOperationError as e:
+                failed = e.operation_responses[e.error_index] if e.operation_responses else {}
+                if e.error_index == 1 and failed.get('statusCode') == 404:
+                    return "Conversation not found"
+                raise
+            resp = results[0].get('resourceBody')
+            if coalescer:
+                coalescer.remember(user_id, conversation_id)
+            return resp if resp else False
+
+        ## no batch support in this SDK: write message and patch conversation concurrently
+        resp, patched = await asyncio.gather(
+            self.container_client.upsert_item(message),
+            self.container_client.patch_item(
+                item=conversation_id,
+                partition_key=user_id,
+                patch_operations=updated_at_patch
+            ),
+            return_exceptions=True
+        )
+        if isinstance(patched, exceptions.CosmosResourceNotFoundError):
+            ## parent conversation is missing: remove the orphaned message
+            if not isinstance(resp, Exception):
+                try:
+                    await self.container_client.delete_item(item=message['id'], partition_key=user_id)
+                except exceptions.CosmosResourceNotFoundError:
+                    pass
+            return "Conversation not found"
+        for result in (resp, patched):
+            if isinstance(result, Exception):
+                raise result
+        if coalescer:
+            coalescer.remember(user_id, conversation_id)
+        return resp if resp else False
     
     async def update_message_feedback(self, user_id, message_id, feedback):
-        message = await self.container_client.read_item(item=message_id, partition_key=user_id)
-        if message:
-            message['feedback'] = feedback
-            resp = await self.container_client.upsert_item(message)
-            return resp
-        else:
+        ## patch only the feedback field (no read-modify-write round trip)
+        ## the predicate keeps the patch off conversations and job documents (412 is treated as not found)
+        try:
+            return await self.container_client.patch_item(
+                item=message_id,
+                partition_key=user_id,
+                patch_operations=[{'op': 'set', 'path': '/feedback', 'value': feedback}],
+                filter_predicate="FROM c WHERE c.type = 'message'",
+                response_hook=self.request_charges.hook('update_message_feedback')
+            )
+        except (exceptions.CosmosResourceNotFoundError, exceptions.CosmosAccessConditionFailedError):
             return False
 
-    async def get_messages(self, user_id, conversation_id):
+    async def get_messages_window(self, user_id, conversation_id, limit, before=None):
+        ## newest `limit` messages older than the `before` cursor, returned oldest first
+        ## the cursor is (createdAt, ids seen at that createdAt) so messages sharing a timestamp are not skipped
+        ## returns (messages, cursor for the next older window or None)
         parameters = [
             {
                 'name': '@conversationId',
@@ -184,12 +498,38 @@ class CosmosConversationClient():
             {
                 'name': '@userId',
                 'value': user_id
+            },
+            {
+                'name': '@limit',
+                'value': limit
             }
         ]
-        query = f"SELECT * FROM c WHERE c.conversationId = @conversationId AND c.type='message' AND c.userId = @userId ORDER BY c.timestamp ASC"
-        messages = []
-        async for item in self.container_client.query_items(query=query, parameters=parameters):
-            messages.append(item)
+        query = queries.messages_window_query(before=bool(before), composite=self.composite_indexes_ready)
+        before_at, seen_ids = decode_messages_cursor(before) if before else (None, [])
+        if before:
+            parameters.append({'name': '@before', 'value': before_at})
+            parameters.append({'name': '@seenIds', 'value': seen_ids})
+        messages = await self._query_all('get_messages_window', query, parameters, partition_key=user_id)
+        messages.reverse()
+        if len(messages) < limit:
+            return messages, None
+        oldest = messages[0]['createdAt']
+        boundary_ids = [m['id'] for m in messages if m['createdAt'] == oldest]
+        if oldest == before_at:
+            boundary_ids = seen_ids + boundary_ids
+        return messages, encode_messages_cursor(oldest, boundary_ids)
 
-        return messages
+    async def get_messages(self, user_id, conversation_id):
+        parameters = [
+            {
+                'name': '@conversationId',
+                'value': conversation_id
+            },
+            {
+                'name': '@userId',
+                'value': user_id
+            }
+        ]
+        query = queries.messages_query(composite=self.composite_indexes_ready)
+        return await self._query_all('get_messages', query, parameters, partition_key=user_id)
 
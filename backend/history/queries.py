@@ -0,0 +1,137 @@
+"""
+履歴コンテナ（conversations）のクエリ定義
+
+目的:
+- 各クエリの ORDER BY を実際に書き込まれているフィールド（createdAt / updatedAt）に揃える
+- クエリが前提とする複合インデックスを宣言し、コンテナのインデックスポリシーと照合できるようにする
+
+設計:
+- 複合インデックスを使わせるため、ORDER BY にはフィルタ対象のプロパティを先頭に含める
+  （フィルタ値は固定なので並び順は変わらない）
+- 複数プロパティの ORDER BY は複合インデックスが無いとクエリ自体が失敗するため、
+  起動時チェックでインデックスが確認できた場合のみ composite=True で使う
+  （確認できない場合は単一プロパティの ORDER BY で既定の範囲インデックスを使う）
+- 複合インデックスは全パスの昇順/降順を反転した ORDER BY にも使えるため、宣言は昇順のみ
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 会話一覧（サイドバー）に必要なフィールド
+CONVERSATION_LIST_FIELDS = ('id', 'type', 'userId', 'title', 'createdAt', 'updatedAt')
+# 会話読み取り時にクライアントへ返すフィールド
+MESSAGE_READ_FIELDS = ('id', 'role', 'content', 'createdAt', 'feedback')
+
+
+@dataclass(frozen=True)
+class CompositeIndex:
+    """複合インデックス定義（パスと昇順/降順の組）"""
+    name: str
+    paths: Tuple[Tuple[str, str], ...]
+
+    def to_policy(self) -> List[Dict[str, str]]:
+        """indexingPolicy.compositeIndexes の1要素の形式に変換"""
+        return [{"path": path, "order": order} for path, order in self.paths]
+
+    def is_satisfied_by(self, policy_entry: Sequence[Dict[str, Any]]) -> bool:
+        """ポリシー上の複合インデックスがこの定義（または全反転）と一致するか"""
+        actual = tuple(
+            (entry.get("path"), (entry.get("order") or "ascending").lower())
+            for entry in policy_entry
+        )
+        if len(actual) != len(self.paths):
+            return False
+        if actual == self.paths:
+            return True
+        flip = {"ascending": "descending", "descending": "ascending"}
+        return actual == tuple((path, flip[order]) for path, order in self.paths)
+
+
+# 会話一覧: WHERE userId/type + ORDER BY updatedAt
+CONVERSATIONS_BY_UPDATED_AT = CompositeIndex(
+    name="conversations_by_updated_at",
+    paths=(("/userId", "ascending"), ("/type", "ascending"), ("/updatedAt", "ascending")),
+)
+# 会話内メッセージ: WHERE conversationId + ORDER BY createdAt
+MESSAGES_BY_CREATED_AT = CompositeIndex(
+    name="messages_by_created_at",
+    paths=(("/conversationId", "ascending"), ("/createdAt", "ascending")),
+)
+
+REQUIRED_COMPOSITE_INDEXES = (CONVERSATIONS_BY_UPDATED_AT, MESSAGES_BY_CREATED_AT)
+
+
+def _projection(fields: Optional[Iterable[str]]) -> str:
+    if not fields:
+        return '*'
+    return ', '.join(f'c.{name}' for name in fields)
+
+
+def _sort_order(sort_order: str) -> str:
+    order = (sort_order or 'DESC').upper()
+    if order not in ('ASC', 'DESC'):
+        raise ValueError(f"Invalid sort order: {sort_order}")
+    return order
+
+
+def conversation_list_query(
+    sort_order: str = 'DESC',
+    offset: Optional[int] = None,
+    limit: Optional[int] = None,
+    composite: bool = False
+) -> str:
+    """会話一覧クエリ（composite=True で CONVERSATIONS_BY_UPDATED_AT を使用）"""
+    order = _sort_order(sort_order)
+    order_by = (
+        f"c.userId {order}, c.type {order}, c.updatedAt {order}" if composite
+        else f"c.updatedAt {order}"
+    )
+    query = (
+        f"SELECT {_projection(CONVERSATION_LIST_FIELDS)} FROM c "
+        f"WHERE c.userId = @userId AND c.type = 'conversation' "
+        f"ORDER BY {order_by}"
+    )
+    if limit is not None:
+        query += f" OFFSET {int(offset or 0)} LIMIT {int(limit)}"
+    return query
+
+
+def messages_query(fields: Optional[Iterable[str]] = None, composite: bool = False) -> str:
+    """会話内の全メッセージを古い順に取得するクエリ（composite=True で MESSAGES_BY_CREATED_AT を使用）"""
+    order_by = "c.conversationId ASC, c.createdAt ASC" if composite else "c.createdAt ASC"
+    return (
+        f"SELECT {_projection(fields)} FROM c "
+        f"WHERE c.conversationId = @conversationId AND c.type = 'message' AND c.userId = @userId "
+        f"ORDER BY {order_by}"
+    )
+
+
+def messages_window_query(before: bool = False, composite: bool = False) -> str:
+    """
+    直近 @limit 件のメッセージを新しい順に取得するクエリ（composite=True で MESSAGES_BY_CREATED_AT を使用）
+
+    before=True の場合は @before より古いメッセージと、@before と同じ createdAt のうち
+    前のウィンドウで返していない（@seenIds に含まれない）メッセージを対象にする。
+    """
+    query = (
+        f"SELECT TOP @limit {_projection(MESSAGE_READ_FIELDS)} FROM c "
+        f"WHERE c.conversationId = @conversationId AND c.type = 'message' AND c.userId = @userId"
+    )
+    if before:
+        query += (
+            " AND (c.createdAt < @before"
+            " OR (c.createdAt = @before AND NOT ARRAY_CONTAINS(@seenIds, c.id)))"
+        )
+    order_by = "c.conversationId DESC, c.createdAt DESC" if composite else "c.createdAt DESC"
+    return query + f" ORDER BY {order_by}"
+
+
+def missing_composite_indexes(
+    indexing_policy: Optional[Dict[str, Any]],
+    required: Sequence[CompositeIndex] = REQUIRED_COMPOSITE_INDEXES
+) -> List[CompositeIndex]:
+    """インデックスポリシーに不足している複合インデックスを返す"""
+    existing = (indexing_policy or {}).get("compositeIndexes") or []
+    return [
+        index for index in required
+        if not any(index.is_satisfied_by(entry) for entry in existing)
+    ]
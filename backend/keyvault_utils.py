@@ -5,13 +5,30 @@ and integrate them with the application's settings.
 """
 
 import os
+import time
+import asyncio
 import logging
-from typing import Dict, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Any
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
 from azure.keyvault.secrets import SecretClient
+from azure.keyvault.secrets.aio import SecretClient as AsyncSecretClient
 from azure.identity import DefaultAzureCredential, ManagedIdentityCredential
+from azure.identity.aio import (
+    DefaultAzureCredential as AsyncDefaultAzureCredential,
+    ManagedIdentityCredential as AsyncManagedIdentityCredential,
+)
 from pydantic import BaseModel, Field
 
 
+# Seconds a cached secret (or a cached "not found") is considered fresh
+KEYVAULT_SECRET_TTL = float(os.environ.get("KEYVAULT_SECRET_TTL", "900"))
+# Interval of the background refresh that picks up rotated secrets
+KEYVAULT_REFRESH_INTERVAL = float(os.environ.get("KEYVAULT_REFRESH_INTERVAL", "300"))
+# Maximum number of secrets fetched concurrently
+KEYVAULT_MAX_CONCURRENCY = int(os.environ.get("KEYVAULT_MAX_CONCURRENCY", "8"))
+
+
 class KeyVaultConfig(BaseModel):
     """Configuration for Azure Key Vault integration."""
     
@@ -47,14 +64,13 @@ class KeyVaultSecretManager:
                     # ローカル環境用：Managed Identityを除外してAzure CLI認証を使用
                     credential = DefaultAzureCredential(exclude_managed_identity_credential=True)
                 
+                # No connection test here: the first get_secret surfaces connectivity errors
+                # without an extra blocking list_properties_of_secrets round trip
                 self._client = SecretClient(
                     vault_url=self.config.vault_url,
                     credential=credential
                 )
-                
-                # Test connection
-                list(self._client.list_properties_of_secrets(max_page_size=1))
-                logging.info(f"Successfully connected to Key Vault: {self.config.vault_name}")
+                logging.info(f"Key Vault client created: {self.config.vault_name}")
                 
             except Exception as e:
                 logging.error(f"Failed to connect to Key Vault: {str(e)}")
@@ -101,12 +117,14 @@ class KeyVaultSecretManager:
         Returns:
             Dictionary of {local_name: secret_value}
         """
-        results = {}
+        if not secret_names:
+            return {}
         
-        for local_name, kv_secret_name in secret_names.items():
-            results[local_name] = self.get_secret(kv_secret_name)
+        # Fetch concurrently: each get_secret is an independent HTTP round trip
+        with ThreadPoolExecutor(max_workers=min(KEYVAULT_MAX_CONCURRENCY, len(secret_names))) as executor:
+            values = list(executor.map(self.get_secret, secret_names.values()))
             
-        return results
+        return dict(zip(secret_names.keys(), values))
     
     def clear_cache(self):
         """Clear the secret cache."""
@@ -114,6 +132,146 @@ class KeyVaultSecretManager:
         logging.debug("Key Vault secret cache cleared")
 
 
+def _is_secret_removed(error: Exception) -> bool:
+    """True if Key Vault reports the secret as deleted or disabled (not a transient failure)."""
+    if isinstance(error, ResourceNotFoundError):
+        return True
+    if isinstance(error, HttpResponseError) and error.status_code == 403:
+        odata_error = getattr(error, "error", None)
+        inner_error = getattr(odata_error, "innererror", None) or {}
+        return inner_error.get("code") == "SecretDisabled"
+    return False
+
+
+class AsyncKeyVaultSecretStore:
+    """
+    Non-blocking secret store built on azure.keyvault.secrets.aio.
+    
+    Secrets are fetched concurrently, cached with a TTL (misses are cached too), and
+    re-fetched by a background task so rotated values are picked up without any
+    request waiting on Key Vault.
+    """
+    
+    def __init__(
+        self,
+        config: KeyVaultConfig,
+        ttl: float = KEYVAULT_SECRET_TTL,
+        refresh_interval: float = KEYVAULT_REFRESH_INTERVAL,
+        max_concurrency: int = KEYVAULT_MAX_CONCURRENCY,
+        env_mappings: Optional[Dict[str, str]] = None
+    ):
+        self.config = config
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.max_concurrency = max(max_concurrency, 1)
+        # {env var: secret name}; refreshed values are written back to os.environ
+        self.env_mappings = env_mappings or {}
+        self._client: Optional[AsyncSecretClient] = None
+        self._credential = None
+        self._cache: Dict[str, tuple] = {}  # secret name -> (value or None, fetched_at)
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.logger = logging.getLogger(__name__)
+    
+    def _get_client(self) -> AsyncSecretClient:
+        if self._client is None:
+            if self.config.use_managed_identity:
+                self._credential = AsyncManagedIdentityCredential(client_id=self.config.client_id) \
+                    if self.config.client_id else AsyncManagedIdentityCredential()
+            else:
+                self._credential = AsyncDefaultAzureCredential(exclude_managed_identity_credential=True)
+            self._client = AsyncSecretClient(vault_url=self.config.vault_url, credential=self._credential)
+        return self._client
+    
+    def has(self, secret_name: str) -> bool:
+        """True if the secret (or its absence) is cached and still fresh."""
+        entry = self._cache.get(secret_name)
+        return entry is not None and time.monotonic() - entry[1] < self.ttl
+    
+    def get_cached(self, secret_name: str, default_value: Optional[str] = None) -> Optional[str]:
+        """Cached value without any I/O (stale values are still returned)."""
+        entry = self._cache.get(secret_name)
+        if entry is None or entry[0] is None:
+            return default_value
+        return entry[0]
+    
+    async def fetch(self, secret_name: str) -> Optional[str]:
+        """Fetch one secret from Key Vault and cache the result (None when missing or disabled)."""
+        try:
+            secret = await self._get_client().get_secret(secret_name)
+            properties = getattr(secret, "properties", None)
+            value = None if getattr(properties, "enabled", True) is False else secret.value
+        except Exception as e:
+            self.logger.warning(f"Failed to retrieve secret '{secret_name}': {str(e)}")
+            # Keep serving the last known value only if the vault is temporarily unreachable
+            value = None if _is_secret_removed(e) else self.get_cached(secret_name)
+        if value is None:
+            self._clear_env(secret_name)
+        self._cache[secret_name] = (value, time.monotonic())
+        return value
+    
+    def _clear_env(self, secret_name: str):
+        """Remove env vars this store populated from a secret that is now deleted or disabled."""
+        previous = self.get_cached(secret_name)
+        if previous is None:
+            return
+        for env_var, mapped_name in self.env_mappings.items():
+            if mapped_name == secret_name and os.environ.get(env_var) == previous:
+                del os.environ[env_var]
+    
+    async def get_secret(self, secret_name: str, default_value: Optional[str] = None) -> Optional[str]:
+        """Cached value if fresh, otherwise fetch it."""
+        if not self.has(secret_name):
+            await self.fetch(secret_name)
+        return self.get_cached(secret_name, default_value)
+    
+    async def load_all(self, secret_names: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Fetch all given secrets in one concurrent batch."""
+        names = list(dict.fromkeys(secret_names))
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def fetch_one(name: str) -> Optional[str]:
+            async with semaphore:
+                return await self.fetch(name)
+        
+        values = await asyncio.gather(*(fetch_one(name) for name in names))
+        self._apply_env_mappings()
+        return dict(zip(names, values))
+    
+    def _apply_env_mappings(self):
+        for env_var, secret_name in self.env_mappings.items():
+            value = self.get_cached(secret_name)
+            if value is not None and os.environ.get(env_var) != value:
+                os.environ[env_var] = value
+    
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.load_all(list(self._cache.keys()))
+                self.logger.debug(f"Refreshed {len(self._cache)} Key Vault secrets")
+            except Exception as e:
+                self.logger.warning(f"Key Vault background refresh failed: {e}")
+    
+    def start_background_refresh(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+    
+    async def aclose(self):
+        if self._refresh_task and not self._refresh_task.done():
+            self._refresh_task.cancel()
+        self._refresh_task = None
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        if self._credential is not None:
+            await self._credential.close()
+            self._credential = None
+
+
+# Shared store, set once KeyVaultService.start() has warmed it
+_shared_secret_store: Optional[AsyncKeyVaultSecretStore] = None
+
+
 # Secret name mappings for Key Vault
 SECRET_MAPPINGS = {
     # Azure AD Authentication
@@ -198,6 +356,10 @@ def get_secret(secret_name: str, default_value: Optional[str] = None) -> Optiona
     Returns:
         Secret value or default value
     """
+    # Serve from the warmed async store when available (no blocking I/O)
+    if _shared_secret_store is not None and _shared_secret_store.has(secret_name):
+        return _shared_secret_store.get_cached(secret_name, default_value)
+    
     vault_url = os.environ.get("AZURE_KEYVAULT_URL")
     if not vault_url:
         logging.warning("AZURE_KEYVAULT_URL not configured, returning default value")
@@ -238,8 +400,21 @@ class KeyVaultService:
     TDD Phase 4: app.pyのKey Vault機能を段階的に移行するためのサービス層
     """
     
-    def __init__(self, secret_manager: KeyVaultSecretManager):
+    # 起動時にまとめて取得し、バックグラウンドで更新するシークレット
+    PRELOAD_SECRETS = (
+        "openai-api-key",
+        "openai-endpoint",
+        "openai-deployment",
+        "AZURE-AI-AGENT-KEY",
+    )
+    
+    def __init__(
+        self,
+        secret_manager: KeyVaultSecretManager,
+        secret_store: Optional[AsyncKeyVaultSecretStore] = None
+    ):
         self.secret_manager = secret_manager
+        self.secret_store = secret_store
         self.logger = logging.getLogger(__name__)
     
     @classmethod
@@ -263,20 +438,66 @@ class KeyVaultService:
         )
         
         secret_manager = KeyVaultSecretManager(config)
-        return cls(secret_manager)
+        secret_store = AsyncKeyVaultSecretStore(config, env_mappings=SECRET_MAPPINGS)
+        return cls(secret_manager, secret_store)
+    
+    async def start(self) -> Dict[str, Optional[str]]:
+        """
+        シークレットを一括で非同期取得し、バックグラウンド更新を開始する
+        
+        以降の get_secret はキャッシュから返すため、リクエスト処理中に Key Vault を待たない
+        """
+        global _shared_secret_store
+        if not self.secret_store:
+            return {}
+        
+        names = list(SECRET_MAPPINGS.values()) + list(self.PRELOAD_SECRETS)
+        secrets = await self.secret_store.load_all(names)
+        self.secret_store.start_background_refresh()
+        _shared_secret_store = self.secret_store
+        self.logger.info(
+            f"Key Vault secrets preloaded: {len([v for v in secrets.values() if v is not None])}/{len(secrets)}"
+        )
+        return secrets
+    
+    async def aclose(self):
+        """バックグラウンド更新と非同期クライアントを停止"""
+        global _shared_secret_store
+        if self.secret_store:
+            if _shared_secret_store is self.secret_store:
+                _shared_secret_store = None
+            await self.secret_store.aclose()
     
     def get_secret(self, secret_name: str) -> Optional[str]:
         """
         app.pyのget_secret_from_keyvault関数の代替
         
+        非同期ストアにキャッシュ済みならI/Oなしで返し、未取得の場合のみ同期取得する
+        
         Args:
             secret_name: Key Vaultのシークレット名
             
         Returns:
             シークレット値またはNone
         """
+        if self.secret_store and self.secret_store.has(secret_name):
+            return self.secret_store.get_cached(secret_name)
         return self.secret_manager.get_secret(secret_name)
     
+    async def aget_secret(self, secret_name: str) -> Optional[str]:
+        """
+        シークレットの非同期取得（イベントループをブロックしない）
+        
+        Args:
+            secret_name: Key Vaultのシークレット名
+            
+        Returns:
+            シークレット値またはNone
+        """
+        if self.secret_store:
+            return await self.secret_store.get_secret(secret_name)
+        return await asyncio.to_thread(self.secret_manager.get_secret, secret_name)
+    
     def get_openai_configuration(self) -> Dict[str, Any]:
         """
         OpenAI設定をKey Vaultから取得
@@ -17,8 +17,11 @@ import html as html_utils
 import os
 import aiohttp
 import json
-from typing import Dict, List, Optional, Any
+import contextlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, AsyncIterator, Tuple
 from dataclasses import dataclass
+from types import SimpleNamespace
 
 # デバッグ制御用環境変数
 # 注意: 本番環境（Azure）では絶対に設定しないでください
@@ -28,12 +31,41 @@ DEBUG_CITATION_EXTRACTION = os.environ.get("DEBUG_CITATION_EXTRACTION", "false")
 DEBUG_BING_GROUNDING = os.environ.get("DEBUG_BING_GROUNDING", "false").lower() in ("true", "1", "yes")
 DEBUG_RESPONSE_PROCESSING = os.environ.get("DEBUG_RESPONSE_PROCESSING", "false").lower() in ("true", "1", "yes")
 
+# Run完了待ちポーリング（ストリーミング不可時のフォールバック）の間隔設定
+# 初回は短い間隔で確認し、完了しない場合は指数バックオフで間隔を延ばす
+RUN_POLL_INITIAL_INTERVAL = float(os.environ.get("MODERN_RAG_POLL_INITIAL_INTERVAL", "0.2"))
+RUN_POLL_MAX_INTERVAL = float(os.environ.get("MODERN_RAG_POLL_MAX_INTERVAL", "2.0"))
+RUN_POLL_BACKOFF_FACTOR = float(os.environ.get("MODERN_RAG_POLL_BACKOFF_FACTOR", "1.5"))
+
+# Run の終了状態
+TERMINAL_RUN_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete")
+
+# Search Proxy (Azure Functions) 接続プール設定
+# Functions フロントエンドのアイドルタイムアウト(約230秒)より十分短いkeep-aliveで再利用する
+SEARCH_PROXY_MAX_CONNECTIONS = int(os.environ.get("SEARCH_PROXY_MAX_CONNECTIONS", "100"))
+SEARCH_PROXY_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("SEARCH_PROXY_MAX_CONNECTIONS_PER_HOST", "20"))
+SEARCH_PROXY_DNS_CACHE_TTL = int(os.environ.get("SEARCH_PROXY_DNS_CACHE_TTL", "300"))
+SEARCH_PROXY_KEEPALIVE_TIMEOUT = float(os.environ.get("SEARCH_PROXY_KEEPALIVE_TIMEOUT", "60"))
+SEARCH_PROXY_REQUEST_TIMEOUT = float(os.environ.get("SEARCH_PROXY_REQUEST_TIMEOUT", "30"))
+# バッチ検索エンドポイント（未指定時は SEARCH_PROXY_URL + "/batch"）。"false" でバッチ無効
+SEARCH_PROXY_BATCH_URL = os.environ.get("SEARCH_PROXY_BATCH_URL", "")
+
+# requires_action 時のツール呼び出し並列実行設定
+TOOL_CALL_MAX_CONCURRENCY = int(os.environ.get("MODERN_RAG_TOOL_CALL_CONCURRENCY", "4"))
+TOOL_CALL_TIMEOUT = float(os.environ.get("MODERN_RAG_TOOL_CALL_TIMEOUT", "30"))
+
+# conversation_id → Agents thread_id キャッシュ設定
+THREAD_CACHE_MAX_SIZE = int(os.environ.get("MODERN_RAG_THREAD_CACHE_SIZE", "1000"))
+THREAD_CACHE_TTL = float(os.environ.get("MODERN_RAG_THREAD_CACHE_TTL", "3600"))
+
 # ログレベルを強制的にINFOに設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-from azure.identity.aio import DefaultAzureCredential
+from backend.auth.credential_registry import get_credential_registry
+from backend.agent_identity import agent_definition_hash, create_agent_identity_store
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
 from backend.settings import app_settings
 
 # Conditional import for Azure AI Agents (preview package)
@@ -63,6 +95,17 @@ except ImportError as e:
 # 既存のloggerを削除して上で設定したloggerを使用
 
 
+if hasattr(asyncio, "timeout"):
+    async def _next_before_deadline(iterator: AsyncIterator[Any], remaining: float) -> Any:
+        """次のイベントを remaining 秒以内に受け取る（超過時は asyncio.TimeoutError）"""
+        async with asyncio.timeout(remaining):
+            return await iterator.__anext__()
+else:  # Python 3.10
+    async def _next_before_deadline(iterator: AsyncIterator[Any], remaining: float) -> Any:
+        """次のイベントを remaining 秒以内に受け取る（超過時は asyncio.TimeoutError）"""
+        return await asyncio.wait_for(iterator.__anext__(), remaining)
+
+
 @dataclass
 class SearchProxyClient:
     """
@@ -82,9 +125,79 @@ class SearchProxyClient:
             raise ValueError("SEARCH_PROXY_URL environment variable is required")
         if not self.proxy_key:
             raise ValueError("SEARCH_PROXY_KEY environment variable is required")
+        
+        # 共有セッション（初回リクエスト時にイベントループ上で生成）
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_lock = asyncio.Lock()
+        self._request_count = 0
+        self._error_count = 0
+        self._batch_count = 0
+        
+        # バッチ非対応のプロキシ（404/405）を検出したら以後は個別リクエストにフォールバック
+        self.batch_url = SEARCH_PROXY_BATCH_URL or self.proxy_url.split("?")[0].rstrip("/") + "/batch"
+        self._batch_supported = SEARCH_PROXY_BATCH_URL.lower() != "false"
             
         logger.info(f"SearchProxyClient initialized with endpoint: {self.proxy_url}")
     
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Get or create the shared session (DNS cache + per-host keep-alive pool)"""
+        if self._session is not None and not self._session.closed:
+            return self._session
+        
+        async with self._session_lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=SEARCH_PROXY_MAX_CONNECTIONS,
+                    limit_per_host=SEARCH_PROXY_MAX_CONNECTIONS_PER_HOST,
+                    ttl_dns_cache=SEARCH_PROXY_DNS_CACHE_TTL,
+                    use_dns_cache=True,
+                    keepalive_timeout=SEARCH_PROXY_KEEPALIVE_TIMEOUT,
+                    enable_cleanup_closed=True,
+                )
+                self._session = aiohttp.ClientSession(
+                    connector=connector,
+                    timeout=aiohttp.ClientTimeout(total=SEARCH_PROXY_REQUEST_TIMEOUT),
+                    headers={"x-functions-key": self.proxy_key},
+                )
+                logger.info("SearchProxyClient shared session created")
+        
+        return self._session
+    
+    async def aclose(self):
+        """Close the shared session and its connection pool"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """
+        Connection pool statistics for health checks
+        
+        Returns:
+            Dict: pool limits, active/idle connections and request counters
+        """
+        stats = {
+            "session_open": bool(self._session is not None and not self._session.closed),
+            "limit": SEARCH_PROXY_MAX_CONNECTIONS,
+            "limit_per_host": SEARCH_PROXY_MAX_CONNECTIONS_PER_HOST,
+            "dns_cache_ttl": SEARCH_PROXY_DNS_CACHE_TTL,
+            "keepalive_timeout": SEARCH_PROXY_KEEPALIVE_TIMEOUT,
+            "requests": self._request_count,
+            "errors": self._error_count,
+            "batches": self._batch_count,
+            "batch_supported": self._batch_supported,
+            "active_connections": 0,
+            "idle_connections": 0,
+        }
+        if stats["session_open"]:
+            connector = self._session.connector
+            # aiohttp は公開APIを持たないため内部状態を参照（存在しない場合は0）
+            stats["active_connections"] = len(getattr(connector, "_acquired", ()) or ())
+            stats["idle_connections"] = sum(
+                len(conns) for conns in (getattr(connector, "_conns", {}) or {}).values()
+            )
+        return stats
+    
     async def search(self, query: str, top: int = 5, filters: Optional[Dict] = None) -> Dict[str, Any]:
         """
         Perform search through Azure Functions proxy
@@ -105,32 +218,140 @@ class SearchProxyClient:
         if filters:
             search_request["filters"] = filters
             
-        headers = {
-            "Content-Type": "application/json",
-            "x-functions-key": self.proxy_key
-        }
-        
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.proxy_url,
-                    json=search_request,
-                    headers=headers,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        logger.info(f"Search proxy returned {len(result.get('results', []))} results")
-                        return result
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Search proxy error {response.status}: {error_text}")
-                        raise Exception(f"Search proxy failed with status {response.status}: {error_text}")
+            session = await self._get_session()
+            self._request_count += 1
+            async with session.post(self.proxy_url, json=search_request) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    logger.info(f"Search proxy returned {len(result.get('results', []))} results")
+                    return result
+                else:
+                    error_text = await response.text()
+                    logger.error(f"Search proxy error {response.status}: {error_text}")
+                    raise Exception(f"Search proxy failed with status {response.status}: {error_text}")
                         
         except Exception as e:
+            self._error_count += 1
             logger.error(f"Search proxy client error: {e}")
             raise
     
+    async def _search_individually(self, queries: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Fallback for proxies without batch support: one request per query, concurrently"""
+        outcomes = await asyncio.gather(
+            *(self.search(q["query"], q.get("top", 5), q.get("filters")) for q in queries),
+            return_exceptions=True
+        )
+        return {
+            q["id"]: (outcome if not isinstance(outcome, BaseException) else {"error": str(outcome), "results": []})
+            for q, outcome in zip(queries, outcomes)
+        }
+    
+    async def batch_search(self, queries: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Perform several searches in one proxy request (/search/batch)
+        
+        Args:
+            queries: [{"id", "query", "top"?, "filters"?}] (ids must be unique)
+            
+        Returns:
+            Dict: id -> single-search style result ({"results": [...], "count"} or {"error", "results": []})
+        """
+        if len(queries) <= 1 or not self._batch_supported:
+            return await self._search_individually(queries)
+        
+        batch_request = {
+            "queries": [
+                {
+                    "id": q["id"],
+                    "search_text": q["query"],
+                    "top": q.get("top", 5),
+                    **({"filters": q["filters"]} if q.get("filters") else {})
+                }
+                for q in queries
+            ]
+        }
+        
+        try:
+            session = await self._get_session()
+            self._request_count += 1
+            async with session.post(self.batch_url, json=batch_request) as response:
+                if response.status in (404, 405):
+                    logger.warning(f"Search proxy does not support batch requests ({response.status}); falling back")
+                    self._batch_supported = False
+                    return await self._search_individually(queries)
+                if response.status >= 500:
+                    # 一時的な障害はこの呼び出しだけ個別検索に切り替える（バッチは無効化しない）
+                    error_text = await response.text()
+                    self._error_count += 1
+                    logger.warning(
+                        f"Search proxy batch failed with status {response.status}; retrying queries individually: {error_text}"
+                    )
+                    return await self._search_individually(queries)
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise Exception(f"Search proxy batch failed with status {response.status}: {error_text}")
+                payload = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._error_count += 1
+            logger.warning(f"Search proxy batch request failed; retrying queries individually: {e}")
+            return await self._search_individually(queries)
+        except Exception as e:
+            self._error_count += 1
+            logger.error(f"Search proxy batch error: {e}")
+            raise
+        
+        self._batch_count += 1
+        documents = payload.get("documents", {})
+        errors = payload.get("errors", {})
+        results: Dict[str, Dict[str, Any]] = {}
+        for q in queries:
+            entry = payload.get("results", {}).get(q["id"])
+            if entry is None:
+                error = errors.get(q["id"], {})
+                results[q["id"]] = {"error": error.get("message", "Search failed"), "results": []}
+                continue
+            # 参照のスコア項目と共有された本文から、単一検索と同じ形の結果に戻す
+            hits = []
+            for ref in entry["results"]:
+                doc_key = ref.get("doc", ref.get("id"))
+                scores = {key: value for key, value in ref.items() if key != "doc"}
+                hits.append({**scores, **documents.get(doc_key, {})})
+            results[q["id"]] = {"results": hits, "count": len(hits)}
+        logger.info(
+            f"Search proxy batch returned {len(queries)} queries with {len(documents)} unique documents"
+        )
+        return results
+    
+    async def execute_batch_tool_calls(self, calls: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, str]:
+        """
+        Execute several search_internal_documents tool calls with one batch request
+        
+        Each output has the same shape as execute_tool_call would return for that call.
+        
+        Args:
+            calls: [(tool_call_id, arguments)]
+            
+        Returns:
+            Dict: tool_call_id -> JSON output string
+        """
+        queries = [
+            {
+                "id": call_id,
+                "query": arguments.get("query", ""),
+                "top": arguments.get("top", 5),
+                "filters": arguments.get("filters")
+            }
+            for call_id, arguments in calls
+        ]
+        try:
+            results = await self.batch_search(queries)
+        except Exception as e:
+            error_output = json.dumps({"error": str(e), "results": []}, ensure_ascii=False)
+            return {call_id: error_output for call_id, _ in calls}
+        
+        return {call_id: json.dumps(results[call_id], ensure_ascii=False) for call_id, _ in calls}
+    
     def get_tool_definition(self) -> Dict[str, Any]:
         """
         Generate Azure AI Agents tool definition for the search proxy
@@ -230,6 +451,7 @@ class ModernRagResponse:
     run_id: Optional[str] = None
     source: str = "azure_ai_agents"
     error: Optional[str] = None
+    thread_created: bool = False
     
     def to_dict(self):
         """Convert to dictionary for JSON serialization"""
@@ -244,6 +466,59 @@ class ModernRagResponse:
         }
 
 
+class AgentThreadCache:
+    """
+    conversation_id → Agents thread_id の TTL/LRU キャッシュ（ワーカープロセス単位）
+    
+    キーはユーザーIDと会話IDの組で、他ユーザーのスレッドを参照しないようにする。
+    同一会話のターンを直列化するためのロックも提供する（実行中Runのある
+    スレッドにはメッセージを追加できないため）。
+    """
+    
+    def __init__(self, max_size: int = THREAD_CACHE_MAX_SIZE, ttl_seconds: float = THREAD_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+    
+    @staticmethod
+    def make_key(user_id: Optional[str], conversation_id: str) -> str:
+        return f"{user_id or 'anonymous'}:{conversation_id}"
+    
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        thread_id, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            self.discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return thread_id
+    
+    def set(self, key: str, thread_id: str) -> None:
+        self._entries[key] = (thread_id, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            evicted_key, _ = self._entries.popitem(last=False)
+            lock = self._locks.get(evicted_key)
+            if lock is not None and not lock.locked():
+                del self._locks[evicted_key]
+    
+    def discard(self, key: str) -> None:
+        self._entries.pop(key, None)
+    
+    def lock(self, key: str) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
 class ModernBingGroundingAgentService:
     """
     Modern Azure AI Agents implementation with RAG + Web Search combination
@@ -263,7 +538,18 @@ class ModernBingGroundingAgentService:
         self.credential = None
         self.agents_client: Optional[AgentsClient] = None
         self.agent_cache: Dict[str, Agent] = {}
+        # 定義ハッシュ → agent_id の永続ストア（ワーカー間・再起動後の再利用）
+        self.agent_store = create_agent_identity_store()
+        self._agent_lock = asyncio.Lock()
+        self._agent_definition_hash: Optional[str] = None
+        self.thread_cache = AgentThreadCache()
         self._client_lock = asyncio.Lock()
+        self.tool_call_stats: Dict[str, float] = {
+            "batches": 0,
+            "calls": 0,
+            "wall_clock_seconds": 0.0,
+            "saved_seconds": 0.0,
+        }
         
         # Load settings from environment variables and Key Vault
         import os
@@ -314,8 +600,8 @@ class ModernBingGroundingAgentService:
         """Factory method for async initialization"""
         self = cls()
         
-        # Use DefaultAzureCredential (it automatically chooses the best auth method)
-        self.credential = await DefaultAzureCredential().__aenter__()
+        # Shared worker credential with per-scope token cache (also used by Cosmos / OpenAI)
+        self.credential = get_credential_registry().get_credential()
         
         # Validate required settings
         if not self.agent_endpoint:
@@ -344,23 +630,25 @@ class ModernBingGroundingAgentService:
     
     async def aclose(self):
         """Cleanup resources"""
+        if self.search_proxy_client:
+            await self.search_proxy_client.aclose()
         if self.agents_client:
             await self.agents_client.close()
-        # Cleanup DefaultAzureCredential
-        if self.credential and hasattr(self.credential, '__aexit__'):
-            await self.credential.__aexit__(None, None, None)
+        # The shared credential is closed by the CredentialRegistry
+        self.credential = None
         
         return self.agents_client
     
-    async def create_corp_web_rag_agent(self) -> Agent:
+    def build_agent_definition(self) -> Dict[str, Any]:
         """
-        Create RAG + Web search integration agent
+        Build the RAG + Web search agent definition (name, model, instructions, tools)
+        
+        The definition is hashed to identify a reusable remote agent, so it must
+        be deterministic for the same configuration.
         
         Returns:
-            Agent: Configured agent with both RAG and Web search tools
+            Dict: create_agent keyword arguments
         """
-        client = await self._get_agents_client()
-        
         # Configure Bing Grounding tool (Web search)
         bing_tool = BingGroundingTool(
             connection_id=self.bing_grounding_conn_id,
@@ -445,16 +733,41 @@ class ModernBingGroundingAgentService:
             model_for_agent = "turbo"  # Use deployment name directly for Azure AI Agents
         
         logger.info(f"Using model for Azure AI Agents: {model_for_agent} (original: {model_name})")
-        logger.info(f"Creating agent with {len(tools)} tools and tool_resources: {bool(tool_resources)}")
+        
+        return {
+            "name": "corp-web-rag-agent",
+            "model": model_for_agent,
+            "instructions": instructions,
+            "tools": tools,
+            "tool_resources": tool_resources
+        }
+    
+    async def create_corp_web_rag_agent(
+        self,
+        definition: Optional[Dict[str, Any]] = None,
+        definition_hash: Optional[str] = None
+    ) -> Agent:
+        """
+        Create RAG + Web search integration agent
+        
+        Args:
+            definition: Agent definition (built from the current settings when omitted)
+            definition_hash: Stored in the agent metadata to trace reused agents
+        
+        Returns:
+            Agent: Configured agent with both RAG and Web search tools
+        """
+        client = await self._get_agents_client()
+        if definition is None:
+            definition = self.build_agent_definition()
+        tools = definition["tools"]
+        logger.info(f"Creating agent with {len(tools)} tools and tool_resources: {bool(definition['tool_resources'])}")
 
         # Create agent
         try:            
             agent = await client.create_agent(
-                name="corp-web-rag-agent",
-                model=model_for_agent,
-                instructions=instructions,
-                tools=tools,
-                tool_resources=tool_resources
+                **definition,
+                metadata={"definitionHash": definition_hash} if definition_hash else None
             )
             
             logger.info(f"Created agent: {agent.id} with {len(tools)} tools")
@@ -462,23 +775,298 @@ class ModernBingGroundingAgentService:
             
         except Exception as e:
             logger.error(f"Failed to create agent: {e}")
-            logger.error(f"Model: {model_for_agent}, Tools count: {len(tools)}, Tool resources: {tool_resources}")
+            logger.error(f"Model: {definition['model']}, Tools count: {len(tools)}, Tool resources: {definition['tool_resources']}")
             raise
 
+    async def _load_persisted_agent(self, definition_hash: str) -> Optional[Agent]:
+        """Fetch the agent stored for this definition (None if absent or deleted remotely)"""
+        agent_id = await self.agent_store.get(definition_hash)
+        if not agent_id:
+            return None
+        client = await self._get_agents_client()
+        try:
+            agent = await client.get_agent(agent_id)
+        except ResourceNotFoundError:
+            logger.warning(f"Persisted agent {agent_id} no longer exists; a new agent will be created")
+            await self.agent_store.delete(definition_hash)
+            return None
+        logger.info(f"Reusing persisted agent: {agent_id}")
+        return agent
+    
+    async def _create_and_persist_agent(self, definition: Dict[str, Any], definition_hash: str) -> Agent:
+        """
+        Create the agent once across workers and persist its id
+        
+        The store lock serializes workers on the same host; if another host
+        persisted first, the freshly created agent is deleted and the winner reused.
+        """
+        async with self.agent_store.locked():
+            agent = await self._load_persisted_agent(definition_hash)
+            if agent is not None:
+                return agent
+            
+            agent = await self.create_corp_web_rag_agent(definition, definition_hash)
+            try:
+                winner_id = await self.agent_store.set(definition_hash, agent.id)
+            except Exception as e:
+                logger.warning(f"Failed to persist agent {agent.id}: {e}")
+                return agent
+            if winner_id == agent.id:
+                return agent
+            
+            client = await self._get_agents_client()
+            logger.info(f"Agent {winner_id} was persisted concurrently; deleting duplicate {agent.id}")
+            try:
+                await client.delete_agent(agent.id)
+            except Exception as e:
+                logger.warning(f"Failed to delete duplicate agent {agent.id}: {e}")
+            return await client.get_agent(winner_id)
+    
+    def get_agent_definition_hash(self) -> str:
+        """
+        Hash of build_agent_definition() (computed once; the definition is fixed for the configuration)
+        """
+        if self._agent_definition_hash is None:
+            self._agent_definition_hash = agent_definition_hash(self.build_agent_definition())
+        return self._agent_definition_hash
     
     async def _get_or_create_agent(self) -> Agent:
-        """Get cached agent or create new one"""
+        """
+        Get cached agent, reuse the persisted one, or create a new one
+        
+        Concurrent callers in this process share one lookup/creation.
+        """
         agent_key = "corp-web-rag-agent"
         
-        if agent_key not in self.agent_cache:
-            self.agent_cache[agent_key] = await self.create_corp_web_rag_agent()
+        if agent_key in self.agent_cache:
+            return self.agent_cache[agent_key]
+        
+        async with self._agent_lock:
+            if agent_key in self.agent_cache:
+                return self.agent_cache[agent_key]
+            
+            if self.agent_store is None:
+                self.agent_cache[agent_key] = await self.create_corp_web_rag_agent()
+                return self.agent_cache[agent_key]
+            
+            definition = self.build_agent_definition()
+            definition_hash = agent_definition_hash(definition)
+            try:
+                agent = await self._load_persisted_agent(definition_hash)
+                store_available = True
+            except Exception as e:
+                # ストア障害時も応答は継続（プロセス内キャッシュのみで動作）
+                logger.warning(f"Agent identity store unavailable, creating a process-local agent: {e}")
+                agent = None
+                store_available = False
+            
+            if agent is None:
+                if store_available:
+                    agent = await self._create_and_persist_agent(definition, definition_hash)
+                else:
+                    agent = await self.create_corp_web_rag_agent(definition, definition_hash)
+            
+            self.agent_cache[agent_key] = agent
         
         return self.agent_cache[agent_key]
     
+    async def _execute_single_tool_call(self, tool_call: Any) -> Dict[str, str]:
+        """
+        Execute one custom function tool call and build its tool output
+        
+        Failures (including timeouts) are returned as error outputs so that
+        the other calls of the same batch can still be submitted.
+        """
+        logger.info(f"Processing tool call: {tool_call.id} - {tool_call.function.name}")
+        
+        try:
+            # Handle search proxy tool calls
+            if (tool_call.function.name == "search_internal_documents" and 
+                self.search_proxy_client):
+                
+                arguments = json.loads(tool_call.function.arguments)
+                result = await asyncio.wait_for(
+                    self.search_proxy_client.execute_tool_call(
+                        tool_call.function.name, 
+                        arguments
+                    ),
+                    timeout=TOOL_CALL_TIMEOUT
+                )
+                logger.info(f"Search proxy tool call completed: {tool_call.id}")
+                return {
+                    "tool_call_id": tool_call.id,
+                    "output": result
+                }
+            
+            # Unknown tool call
+            logger.warning(f"Unknown tool call: {tool_call.function.name}")
+            error = f"Unknown tool function: {tool_call.function.name}"
+        
+        except asyncio.TimeoutError:
+            logger.error(f"Tool call {tool_call.id} timed out after {TOOL_CALL_TIMEOUT} seconds")
+            error = f"Tool call timed out after {TOOL_CALL_TIMEOUT} seconds"
+        except Exception as e:
+            logger.error(f"Tool call {tool_call.id} failed: {e}")
+            error = str(e)
+        
+        return {
+            "tool_call_id": tool_call.id,
+            "output": json.dumps({
+                "error": error,
+                "results": []
+            }, ensure_ascii=False)
+        }
+    
+    async def _execute_tool_calls(self, tool_calls: List[Any]) -> List[Dict[str, str]]:
+        """
+        Execute custom function tool calls requested by the agent run
+        
+        Calls are dispatched concurrently (bounded by MODERN_RAG_TOOL_CALL_CONCURRENCY)
+        and returned in request order so they can be submitted in one batch.
+        
+        Args:
+            tool_calls: Tool calls from run.required_action.submit_tool_outputs
+            
+        Returns:
+            List[Dict]: Tool outputs ready for submit_tool_outputs
+        """
+        if not tool_calls:
+            return []
+        
+        logger.info(f"Processing {len(tool_calls)} tool calls")
+        
+        # バッチ検索の時間も含めて計測する（ツール待ち時間の大半を占めるため）
+        batch_start = time.perf_counter()
+        durations: List[float] = []
+        
+        # 複数の search_internal_documents 呼び出しは1回のバッチ検索にまとめ、
+        # 他のツール呼び出しと並行して実行する
+        async def run_search_batch() -> Dict[str, str]:
+            outputs = await self._execute_search_batch(tool_calls)
+            if outputs:
+                durations.append(time.perf_counter() - batch_start)
+            return outputs
+        
+        batch_task = asyncio.ensure_future(run_search_batch())
+        semaphore = asyncio.Semaphore(max(TOOL_CALL_MAX_CONCURRENCY, 1))
+        
+        async def run_bounded(tool_call: Any) -> Dict[str, str]:
+            if tool_call.function.name == "search_internal_documents":
+                batched_outputs = await batch_task
+                if tool_call.id in batched_outputs:
+                    return {"tool_call_id": tool_call.id, "output": batched_outputs[tool_call.id]}
+            async with semaphore:
+                call_start = time.perf_counter()
+                try:
+                    return await self._execute_single_tool_call(tool_call)
+                finally:
+                    durations.append(time.perf_counter() - call_start)
+        
+        try:
+            tool_outputs = list(await asyncio.gather(*(run_bounded(tc) for tc in tool_calls)))
+        finally:
+            if not batch_task.done():
+                batch_task.cancel()
+        wall_clock = time.perf_counter() - batch_start
+        
+        # 逐次実行した場合との差分（並列化による短縮時間）を記録
+        sequential = sum(durations)
+        self.tool_call_stats["batches"] += 1
+        self.tool_call_stats["calls"] += len(tool_calls)
+        self.tool_call_stats["wall_clock_seconds"] += wall_clock
+        self.tool_call_stats["saved_seconds"] += max(sequential - wall_clock, 0.0)
+        logger.info(
+            f"Executed {len(tool_calls)} tool calls in {wall_clock:.2f}s "
+            f"(sequential {sequential:.2f}s, saved {max(sequential - wall_clock, 0.0):.2f}s)"
+        )
+        
+        return tool_outputs
+    
+    async def _execute_search_batch(self, tool_calls: List[Any]) -> Dict[str, str]:
+        """
+        Run all search proxy tool calls of one requires_action step as a single batch
+        
+        Returns:
+            Dict: tool_call_id -> output (empty when there is nothing to batch)
+        """
+        execute_batch = getattr(self.search_proxy_client, "execute_batch_tool_calls", None)
+        if execute_batch is None:
+            return {}
+        
+        calls = []
+        for tool_call in tool_calls:
+            if tool_call.function.name != "search_internal_documents":
+                continue
+            try:
+                calls.append((tool_call.id, json.loads(tool_call.function.arguments)))
+            except (TypeError, ValueError):
+                # 引数が不正な呼び出しは個別実行側でエラー出力にする
+                continue
+        if len(calls) < 2:
+            return {}
+        
+        try:
+            outputs = await asyncio.wait_for(
+                execute_batch(calls),
+                timeout=TOOL_CALL_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"Batched search of {len(calls)} tool calls timed out after {TOOL_CALL_TIMEOUT} seconds")
+            error_output = json.dumps(
+                {"error": f"Tool call timed out after {TOOL_CALL_TIMEOUT} seconds", "results": []},
+                ensure_ascii=False
+            )
+            return {call_id: error_output for call_id, _ in calls}
+        
+        logger.info(f"Executed {len(calls)} search tool calls as one batch")
+        return outputs
+    
+    async def _find_active_run(self, client: Any, thread_id: str) -> Optional[ThreadRun]:
+        """Return the newest non-terminal run of the thread, or None"""
+        try:
+            async for run in client.runs.list(thread_id=thread_id, limit=5, order="desc"):
+                if str(run.status).lower() not in TERMINAL_RUN_STATUSES:
+                    return run
+        except Exception as e:
+            logger.warning(f"Could not list runs of thread {thread_id}: {e}")
+        return None
+    
+    async def _start_or_reuse_run(self, client: Any, thread_id: str, agent_id: str) -> ThreadRun:
+        """
+        Start a run for the polling fallback unless the thread already has an active one
+        
+        A stream that fails before its first ThreadRun event may still have started
+        the run on the server; creating another would fail or duplicate the answer.
+        """
+        run = await self._find_active_run(client, thread_id)
+        if run is not None:
+            logger.info(f"Reusing active run {run.id} on thread {thread_id} for polling")
+            return run
+        try:
+            return await client.runs.create(thread_id=thread_id, agent_id=agent_id)
+        except HttpResponseError:
+            # run が作成直後で一覧に出ていなかった場合（active run が既にあるエラー）
+            run = await self._find_active_run(client, thread_id)
+            if run is None:
+                raise
+            logger.info(f"Reusing active run {run.id} on thread {thread_id} after create conflict")
+            return run
+    
+    @staticmethod
+    def _get_required_tool_calls(run: ThreadRun) -> List[Any]:
+        """Return pending function tool calls of a requires_action run (empty if none)"""
+        required_action = getattr(run, 'required_action', None)
+        submit_tool_outputs = getattr(required_action, 'submit_tool_outputs', None) if required_action else None
+        return list(getattr(submit_tool_outputs, 'tool_calls', None) or [])
+    
     async def _wait_for_completion(self, run: ThreadRun, thread_id: str, timeout: Optional[int] = None) -> ThreadRun:
         """
         Wait for agent run completion with timeout and handle custom tool calls
         
+        ポーリング間隔は RUN_POLL_INITIAL_INTERVAL から開始し、状態が変わらない間は
+        RUN_POLL_BACKOFF_FACTOR 倍ずつ RUN_POLL_MAX_INTERVAL まで延ばす。
+        ツール出力の送信後は再び短い間隔に戻す。
+        
         Args:
             run: The run to wait for
             thread_id: Thread ID
@@ -493,6 +1081,7 @@ class ModernBingGroundingAgentService:
             
         client = await self._get_agents_client()
         start_time = time.time()
+        poll_interval = RUN_POLL_INITIAL_INTERVAL
         
         while True:
             try:
@@ -500,60 +1089,9 @@ class ModernBingGroundingAgentService:
 
                 # Handle required actions (tool calls)
                 if current_run.status.lower() == "requires_action":
-                    if (hasattr(current_run, 'required_action') and 
-                        current_run.required_action and
-                        hasattr(current_run.required_action, 'submit_tool_outputs') and
-                        current_run.required_action.submit_tool_outputs and
-                        hasattr(current_run.required_action.submit_tool_outputs, 'tool_calls')):
-                        
-                        tool_calls = current_run.required_action.submit_tool_outputs.tool_calls
-                        tool_outputs = []
-                        
-                        logger.info(f"Processing {len(tool_calls)} tool calls")
-                        
-                        for tool_call in tool_calls:
-                            logger.info(f"Processing tool call: {tool_call.id} - {tool_call.function.name}")
-                            
-                            try:
-                                # Handle search proxy tool calls
-                                if (tool_call.function.name == "search_internal_documents" and 
-                                    self.search_proxy_client):
-                                    
-                                    arguments = json.loads(tool_call.function.arguments)
-                                    result = await self.search_proxy_client.execute_tool_call(
-                                        tool_call.function.name, 
-                                        arguments
-                                    )
-                                    
-                                    tool_outputs.append({
-                                        "tool_call_id": tool_call.id,
-                                        "output": result
-                                    })
-                                    logger.info(f"Search proxy tool call completed: {tool_call.id}")
-                                else:
-                                    # Unknown tool call
-                                    error_output = json.dumps({
-                                        "error": f"Unknown tool function: {tool_call.function.name}",
-                                        "results": []
-                                    }, ensure_ascii=False)
-                                    
-                                    tool_outputs.append({
-                                        "tool_call_id": tool_call.id,
-                                        "output": error_output
-                                    })
-                                    logger.warning(f"Unknown tool call: {tool_call.function.name}")
-                                    
-                            except Exception as e:
-                                logger.error(f"Tool call {tool_call.id} failed: {e}")
-                                error_output = json.dumps({
-                                    "error": str(e),
-                                    "results": []
-                                }, ensure_ascii=False)
-                                
-                                tool_outputs.append({
-                                    "tool_call_id": tool_call.id,
-                                    "output": error_output
-                                })
+                    tool_calls = self._get_required_tool_calls(current_run)
+                    if tool_calls:
+                        tool_outputs = await self._execute_tool_calls(tool_calls)
                         
                         # Submit tool outputs
                         if tool_outputs:
@@ -564,8 +1102,9 @@ class ModernBingGroundingAgentService:
                                 tool_outputs=tool_outputs
                             )
                             logger.info("Tool outputs submitted successfully")
+                            poll_interval = RUN_POLL_INITIAL_INTERVAL
                 
-                elif current_run.status.lower() in ["completed", "failed", "cancelled", "expired"]:
+                elif current_run.status.lower() in TERMINAL_RUN_STATUSES:
                     logger.info(f"Run {run.id} completed with status: {current_run.status}")
                     return current_run
                 
@@ -575,8 +1114,9 @@ class ModernBingGroundingAgentService:
                     logger.error(f"Run {run.id} timed out after {elapsed:.2f} seconds")
                     raise TimeoutError(f"Agent run timed out after {timeout} seconds")
                 
-                # Wait before next check
-                await asyncio.sleep(1.0)
+                # Wait before next check (adaptive backoff, never past the deadline)
+                await asyncio.sleep(min(poll_interval, max(timeout - elapsed, 0.0)))
+                poll_interval = min(poll_interval * RUN_POLL_BACKOFF_FACTOR, RUN_POLL_MAX_INTERVAL)
                 
             except Exception as e:
                 logger.error(f"Error checking run status: {e}")
@@ -964,17 +1504,102 @@ class ModernBingGroundingAgentService:
                 title=f"Citation extraction failed: {str(e)}"
             )]
     
-    async def process_user_query(self, user_message: str, user_id: str = None) -> ModernRagResponse:
+    def get_cached_thread_id(self, conversation_id: Optional[str], user_id: str = None) -> Optional[str]:
+        """Return the Agents thread_id cached for a conversation (None if unknown)"""
+        if not conversation_id:
+            return None
+        return self.thread_cache.get(AgentThreadCache.make_key(user_id, conversation_id))
+    
+    def _conversation_lock(self, conversation_id: Optional[str], user_id: str = None):
+        """Serialize turns of the same conversation (no-op without conversation_id)"""
+        if not conversation_id:
+            return contextlib.nullcontext()
+        return self.thread_cache.lock(AgentThreadCache.make_key(user_id, conversation_id))
+    
+    async def _prepare_thread(
+        self,
+        client: AgentsClient,
+        user_message: str,
+        user_id: Optional[str],
+        conversation_id: Optional[str],
+        thread_id: Optional[str]
+    ) -> Tuple[str, ThreadMessage, bool]:
+        """
+        Append the user message to the conversation's existing thread, or create one
+        
+        Args:
+            client: Agents client
+            user_message: User's question/query
+            user_id: Optional user identifier
+            conversation_id: History conversation id (enables thread reuse)
+            thread_id: Thread id persisted for the conversation (used on cache miss)
+            
+        Returns:
+            Tuple: (thread_id, created user message, whether a new thread was created)
+        """
+        cache_key = AgentThreadCache.make_key(user_id, conversation_id) if conversation_id else None
+        candidate = (self.thread_cache.get(cache_key) if cache_key else None) or thread_id
+        
+        if candidate:
+            try:
+                message = await client.messages.create(
+                    thread_id=candidate,
+                    role="user",
+                    content=user_message
+                )
+                if cache_key:
+                    self.thread_cache.set(cache_key, candidate)
+                if DEBUG_RESPONSE_PROCESSING:
+                    logger.debug(f"Reusing thread: {candidate}")
+                return candidate, message, False
+            except (ResourceNotFoundError, HttpResponseError) as e:
+                # スレッド削除済み・期限切れ・実行中Runありの場合は新規スレッドへ
+                logger.info(f"Existing agent thread unavailable, creating a new one: {e}")
+                self.thread_cache.discard(cache_key)
+        
+        thread = await client.threads.create()
+        if DEBUG_RESPONSE_PROCESSING:
+            logger.debug(f"Created thread: {thread.id}")
+        message = await client.messages.create(
+            thread_id=thread.id,
+            role="user",
+            content=user_message
+        )
+        if cache_key:
+            self.thread_cache.set(cache_key, thread.id)
+        return thread.id, message, True
+    
+    async def process_user_query(
+        self,
+        user_message: str,
+        user_id: str = None,
+        conversation_id: Optional[str] = None,
+        thread_id: Optional[str] = None
+    ) -> ModernRagResponse:
         """
         Process user query with integrated RAG + Web search
         
         Args:
             user_message: User's question/query
             user_id: Optional user identifier
+            conversation_id: Optional history conversation id; follow-up turns
+                append to the conversation's existing Agents thread
+            thread_id: Optional thread id persisted for the conversation
             
         Returns:
             ModernRagResponse: Integrated response with citations
         """
+        async with self._conversation_lock(conversation_id, user_id):
+            return await self._process_user_query(user_message, user_id, conversation_id, thread_id)
+    
+    async def _process_user_query(
+        self,
+        user_message: str,
+        user_id: Optional[str],
+        conversation_id: Optional[str],
+        thread_id: Optional[str]
+    ) -> ModernRagResponse:
+        """process_user_query body (called while holding the conversation lock)"""
         try:
             preview = html_utils.escape(user_message[:20])
             logger.info(f"Processing query preview='{preview}...' (len={len(user_message)})")
@@ -983,17 +1608,11 @@ class ModernBingGroundingAgentService:
             agent = await self._get_or_create_agent()
             client = await self._get_agents_client()
             
-            # Create thread for conversation
-            thread = await client.threads.create()
-            if DEBUG_RESPONSE_PROCESSING:
-                logger.debug(f"Created thread: {thread.id}")
-            
-            # Send user message
-            message = await client.messages.create(
-                thread_id=thread.id,
-                role="user", 
-                content=user_message
+            # Reuse the conversation's thread (or create one) and send user message
+            thread_id, message, thread_created = await self._prepare_thread(
+                client, user_message, user_id, conversation_id, thread_id
             )
+            thread = SimpleNamespace(id=thread_id)
             if DEBUG_RESPONSE_PROCESSING:
                 logger.debug(f"Created message: {message.id}")
             
@@ -1024,7 +1643,8 @@ class ModernBingGroundingAgentService:
                     citations=citations,
                     thread_id=thread.id,
                     run_id=completed_run.id,
-                    source="azure_ai_agents"
+                    source="azure_ai_agents",
+                    thread_created=thread_created
                 )
             else:
                 # Log detailed error information for failed runs
@@ -1086,6 +1706,212 @@ class ModernBingGroundingAgentService:
                 error=str(e)
             )
     
+    async def stream_user_query(
+        self,
+        user_message: str,
+        user_id: str = None,
+        conversation_id: Optional[str] = None,
+        thread_id: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process user query and yield incremental events from the Agents run stream
+        
+        Yields dict events:
+            {"type": "delta", "content": str}                          - answer tokens
+            {"type": "tool", "tool_call_id", "name", "status"}         - tool-call progress
+            {"type": "final", "result": ModernRagResponse, "citations_html": str}
+        
+        If run streaming is unavailable (or the stream breaks), falls back to
+        adaptive polling via _wait_for_completion and emits the remaining text.
+        
+        Args:
+            user_message: User's question/query
+            user_id: Optional user identifier
+            conversation_id: Optional history conversation id (thread reuse)
+            thread_id: Optional thread id persisted for the conversation
+        """
+        async with self._conversation_lock(conversation_id, user_id):
+            async for event in self._stream_user_query(user_message, user_id, conversation_id, thread_id):
+                yield event
+    
+    async def _stream_user_query(
+        self,
+        user_message: str,
+        user_id: Optional[str],
+        conversation_id: Optional[str],
+        thread_id: Optional[str]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """stream_user_query body (called while holding the conversation lock)"""
+        start_time = time.time()
+        emitted_parts: List[str] = []
+        seen_tool_events = set()
+        thread_created = False
+        run_id = None
+        final_run = None
+        used_polling_fallback = False
+        
+        def tool_event(tool_call_id: str, name: str, status: str) -> Optional[Dict[str, Any]]:
+            key = (tool_call_id, status)
+            if key in seen_tool_events:
+                return None
+            seen_tool_events.add(key)
+            return {"type": "tool", "tool_call_id": tool_call_id, "name": name, "status": status}
+        
+        try:
+            preview = html_utils.escape(user_message[:20])
+            logger.info(f"Streaming query preview='{preview}...' (len={len(user_message)})")
+            
+            agent = await self._get_or_create_agent()
+            client = await self._get_agents_client()
+            
+            thread_id, message, thread_created = await self._prepare_thread(
+                client, user_message, user_id, conversation_id, thread_id
+            )
+            thread = SimpleNamespace(id=thread_id)
+            
+            try:
+                async with await client.runs.stream(thread_id=thread.id, agent_id=agent.id) as stream:
+                    events = stream.__aiter__()
+                    while True:
+                        # イベントが届かなくても response_timeout で打ち切る（会話ロックを持ち続けないため）
+                        remaining = self.response_timeout - (time.time() - start_time)
+                        try:
+                            if remaining <= 0:
+                                raise asyncio.TimeoutError
+                            event_type, event_data, _ = await _next_before_deadline(events, remaining)
+                        except StopAsyncIteration:
+                            break
+                        except asyncio.TimeoutError:
+                            raise TimeoutError(f"Agent run timed out after {self.response_timeout} seconds")
+                        
+                        if event_type == "thread.message.delta":
+                            text = getattr(event_data, "text", "")
+                            if text:
+                                emitted_parts.append(text)
+                                yield {"type": "delta", "content": text}
+                        
+                        elif isinstance(event_data, ThreadRun):
+                            run_id = event_data.id
+                            if event_type == "thread.run.requires_action":
+                                tool_calls = self._get_required_tool_calls(event_data)
+                                for tool_call in tool_calls:
+                                    event = tool_event(tool_call.id, tool_call.function.name, "started")
+                                    if event:
+                                        yield event
+                                tool_outputs = await self._execute_tool_calls(tool_calls)
+                                for tool_call in tool_calls:
+                                    event = tool_event(tool_call.id, tool_call.function.name, "completed")
+                                    if event:
+                                        yield event
+                                if tool_outputs:
+                                    # 新しいストリームは同じイベントハンドラに連結される
+                                    await client.runs.submit_tool_outputs_stream(
+                                        thread_id=thread.id,
+                                        run_id=event_data.id,
+                                        tool_outputs=tool_outputs,
+                                        event_handler=stream
+                                    )
+                            elif event_data.status.lower() in TERMINAL_RUN_STATUSES:
+                                final_run = event_data
+                        
+                        elif event_type.startswith("thread.run.step."):
+                            # Server-side tools (Bing grounding / AI Search) progress
+                            step_details = getattr(event_data, "step_details", None)
+                            for tool_call in getattr(step_details, "tool_calls", None) or []:
+                                if not getattr(tool_call, "id", None) or not getattr(tool_call, "type", None):
+                                    continue
+                                status = "completed" if event_type == "thread.run.step.completed" else "started"
+                                event = tool_event(tool_call.id, tool_call.type, status)
+                                if event:
+                                    yield event
+                        
+                        elif event_type == "error":
+                            raise RuntimeError(f"Agent run stream error: {event_data}")
+            
+            except TimeoutError:
+                raise
+            except Exception as stream_error:
+                # ストリーミング不可: ポーリングにフォールバック
+                logger.warning(f"Agent run streaming unavailable, falling back to polling: {stream_error}")
+                used_polling_fallback = True
+                if run_id:
+                    run = await client.runs.get(thread_id=thread.id, run_id=run_id)
+                else:
+                    # ThreadRun イベント前に失敗しても、サーバー側で run が開始済みの場合はそれを待つ
+                    run = await self._start_or_reuse_run(client, thread.id, agent.id)
+                run_id = run.id
+                remaining = max(self.response_timeout - (time.time() - start_time), 1)
+                final_run = await self._wait_for_completion(run, thread.id, timeout=remaining)
+            
+            if final_run is None and run_id:
+                final_run = await client.runs.get(thread_id=thread.id, run_id=run_id)
+            
+            if final_run is None or final_run.status.lower() != "completed":
+                status = final_run.status if final_run is not None else "unknown"
+                last_error = getattr(final_run, "last_error", None) if final_run is not None else None
+                error_msg = f"Agent execution failed with status: {status}"
+                if last_error:
+                    error_msg += f". Details: Last error: {last_error}"
+                logger.error(error_msg)
+                yield {
+                    "type": "final",
+                    "result": ModernRagResponse(
+                        status="error", response="", citations=[],
+                        thread_id=thread_id, run_id=run_id, error=error_msg
+                    ),
+                    "citations_html": ""
+                }
+                return
+            
+            # ストリームで受信できなかった残りのテキストを補完
+            response_text = "".join(emitted_parts)
+            if used_polling_fallback or not response_text:
+                full_text = await self._extract_response(thread.id, message.created_at.timestamp())
+                if full_text.startswith(response_text) and len(full_text) > len(response_text):
+                    yield {"type": "delta", "content": full_text[len(response_text):]}
+                    response_text = full_text
+                elif not response_text:
+                    yield {"type": "delta", "content": full_text}
+                    response_text = full_text
+            
+            citations = await self._extract_modern_citations(final_run, thread.id)
+            
+            yield {
+                "type": "final",
+                "result": ModernRagResponse(
+                    status="success",
+                    response=response_text,
+                    citations=citations,
+                    thread_id=thread.id,
+                    run_id=final_run.id,
+                    source="azure_ai_agents",
+                    thread_created=thread_created
+                ),
+                "citations_html": self.format_citations_html(citations)
+            }
+        
+        except TimeoutError as e:
+            logger.error(f"Streaming query timeout: {e}")
+            yield {
+                "type": "final",
+                "result": ModernRagResponse(
+                    status="timeout", response="", citations=[],
+                    thread_id=thread_id, run_id=run_id, error=str(e)
+                ),
+                "citations_html": ""
+            }
+        
+        except Exception as e:
+            logger.error(f"Streaming query processing error: {e}")
+            yield {
+                "type": "final",
+                "result": ModernRagResponse(
+                    status="error", response="", citations=[],
+                    thread_id=thread_id, run_id=run_id, error=str(e)
+                ),
+                "citations_html": ""
+            }
+    
     def format_citations_html(self, citations: List[CitationInfo]) -> str:
         """
         Format citations as HTML for frontend display
@@ -1155,8 +1981,14 @@ class ModernBingGroundingAgentService:
                 "ai_search_configured": bool(self.ai_search_conn_id and self.ai_search_index_name),
                 "search_proxy_configured": bool(self.search_proxy_client),
                 "search_method": "proxy" if self.search_proxy_client else ("direct" if self.ai_search_conn_id else "none"),
-                "cached_agents": len(self.agent_cache)
+                "cached_agents": len(self.agent_cache),
+                "agent_store": type(self.agent_store).__name__ if self.agent_store else None,
+                "cached_threads": len(self.thread_cache)
             }
+            if self.search_proxy_client:
+                test_result["search_proxy_pool"] = self.search_proxy_client.get_pool_stats()
+            test_result["tool_call_stats"] = dict(self.tool_call_stats)
+            test_result["token_metrics"] = get_credential_registry().metrics()
             
             # Try to create a test agent to verify configuration
             try:
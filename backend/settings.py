@@ -20,6 +20,7 @@ from typing import List, Literal, Optional
 from typing_extensions import Self
 from quart import Request
 from backend.utils import parse_multi_columns, generateFilterString
+from backend.auth.graph_groups import get_group_resolver
 
 DOTENV_PATH = os.environ.get(
     "DOTENV_PATH",
@@ -66,6 +67,10 @@ class _ChatHistorySettings(BaseSettings):
     account_key: Optional[str] = None
     conversations_container: str
     enable_feedback: bool = False
+    # create_message 時の会話 updatedAt 更新を遅延・集約する（ストリーミング中の連続書き込み向け）
+    # 会話の存在は最初の書き込みで同期的に確認し、以後の書き込みのみ遅延させる
+    updated_at_write_behind: bool = False
+    updated_at_flush_interval: float = 1.0
 
 
 class _PromptflowSettings(BaseSettings):
@@ -150,6 +155,14 @@ class _AzureOpenAISettings(BaseSettings):
     function_call_azure_functions_tools_base_url: Optional[str] = None
     function_call_azure_functions_tool_key: Optional[str] = None
     function_call_azure_functions_tool_base_url: Optional[str] = None
+    # 共有クライアントの接続プール設定（ワーカープロセス単位）
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 30.0
+    http2_enabled: bool = True
+    http_timeout: float = 600.0
+    http_connect_timeout: float = 5.0
+    client_refresh_interval: float = 300.0
     
     @field_validator('tools', mode='before')
     @classmethod
@@ -351,11 +364,36 @@ class _AzureSearchSettings(BaseSettings, DatasourcePayloadConstructor):
                     "Document-level access control is enabled, but user access token could not be fetched."
                 )
 
-            filter_string = generateFilterString(user_token)
+            # 非同期に解決済み（resolve_filter_string）ならキャッシュを使い、Graph を同期呼び出ししない
+            filter_string = get_group_resolver().get_cached_filter_string(user_token)
+            if filter_string is None:
+                filter_string = generateFilterString(user_token)
             logging.debug(f"FILTER: {filter_string}")
             return filter_string
         
         return None
+    
+    async def resolve_filter_string(self, request: Request) -> Optional[str]:
+        """
+        グループフィルタを非同期に解決（イベントループをブロックしない）
+        
+        construct_payload_configuration の前に await しておくと、
+        同期パスはキャッシュ済みのフィルタ文字列を使う。
+        現在このツリーには construct_payload_configuration の呼び出し元が無いため、
+        データソース経由の呼び出しを追加する際にここを await すること。
+        """
+        if not self.permitted_groups_column:
+            return None
+        
+        user_token = request.headers.get("X-MS-TOKEN-AAD-ACCESS-TOKEN", "")
+        if not user_token:
+            raise ValueError(
+                "Document-level access control is enabled, but user access token could not be fetched."
+            )
+        
+        filter_string = await get_group_resolver().get_filter_string(user_token)
+        logging.debug(f"FILTER: {filter_string}")
+        return filter_string
             
     def construct_payload_configuration(
         self,
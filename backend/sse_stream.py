@@ -0,0 +1,203 @@
+"""
+チャット応答ストリームの Server-Sent Events 転送と再開
+
+目的:
+- 長い応答の途中で接続が切れても、生成をやり直さずに続きから受け取れるようにする
+- 無通信のストリームがフロントエンド（Azure Front Door / App Service）に切られないようにする
+
+設計:
+- 応答の NDJSON 行は接続とは独立したタスクでストリームごとのリングバッファに書き込む
+  （クライアントが切断しても生成と履歴保存は最後まで進む）
+- SSE の各イベントは id: <stream_id>.<seq>、data: <NDJSON 1行>。終了時は event: done を送る
+- 無通信が SSE_HEARTBEAT_SECONDS 続いたらコメント行（": heartbeat"）を送る
+- 再接続は Last-Event-ID（<stream_id>.<seq>）を指定し、その次のイベントから送り直す
+- バッファはワーカープロセス内のメモリのみ。完了後 SSE_RETENTION_SECONDS で破棄し、
+  別ワーカーへの再接続や破棄済み・溢れたイベントからの再開は StreamResumeError になる
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", "15"))
+# ストリームごとに保持するイベント数の上限と、完了後の保持時間（秒）
+SSE_BUFFER_EVENTS = int(os.environ.get("SSE_BUFFER_EVENTS", "2048"))
+SSE_RETENTION_SECONDS = float(os.environ.get("SSE_RETENTION_SECONDS", "60"))
+# ワーカーあたりの保持ストリーム数の上限（完了済みの古いものから破棄）
+SSE_MAX_STREAMS = int(os.environ.get("SSE_MAX_STREAMS", "500"))
+# EventSource の再接続間隔（ミリ秒）
+SSE_RETRY_MS = int(os.environ.get("SSE_RETRY_MS", "3000"))
+
+
+class StreamResumeError(Exception):
+    """ストリームを再開できない（不明な ID・他ユーザー・バッファから溢れたイベント）"""
+
+
+def wants_sse(accept: Optional[str]) -> bool:
+    """Accept ヘッダーで SSE が要求されたか"""
+    return "text/event-stream" in (accept or "").lower()
+
+
+def parse_last_event_id(value: Optional[str]) -> Tuple[str, int]:
+    """
+    Last-Event-ID（<stream_id>.<seq>）を分解
+
+    Raises:
+        StreamResumeError: 形式が不正
+    """
+    stream_id, _, seq = (value or "").strip().rpartition(".")
+    if not stream_id or not seq.isdigit():
+        raise StreamResumeError("Last-Event-ID must be '<stream_id>.<seq>'")
+    return stream_id, int(seq)
+
+
+class ResumableStream:
+    """1応答分のイベントのリングバッファ"""
+
+    def __init__(self, stream_id: str, owner: Optional[str], max_events: int = SSE_BUFFER_EVENTS):
+        self.stream_id = stream_id
+        self.owner = owner
+        self.events: Deque[Tuple[int, str]] = deque(maxlen=max(max_events, 1))
+        self.next_seq = 0
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, data: str) -> None:
+        async with self._changed:
+            self.events.append((self.next_seq, data))
+            self.next_seq += 1
+            self._changed.notify_all()
+
+    async def finish(self) -> None:
+        async with self._changed:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._changed.notify_all()
+
+    def events_after(self, seq: int) -> List[Tuple[int, str]]:
+        """seq より後のイベント（必要なイベントが既にバッファから溢れていれば StreamResumeError）"""
+        if self.events and self.events[0][0] > seq + 1:
+            raise StreamResumeError(f"Events after {self.stream_id}.{seq} are no longer buffered")
+        return [event for event in self.events if event[0] > seq]
+
+    async def wait(self, seq: int, timeout: float) -> bool:
+        """seq より後のイベントか終了を待つ（タイムアウトしたら False）"""
+        async with self._changed:
+            if self.done or self.next_seq > seq + 1:
+                return True
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+
+class StreamRegistry:
+    """ワーカー内の再開可能ストリームの管理"""
+
+    def __init__(
+        self,
+        max_streams: int = SSE_MAX_STREAMS,
+        retention_seconds: float = SSE_RETENTION_SECONDS,
+        max_events: int = SSE_BUFFER_EVENTS
+    ):
+        self.max_streams = max_streams
+        self.retention_seconds = retention_seconds
+        self.max_events = max_events
+        self._streams: "OrderedDict[str, ResumableStream]" = OrderedDict()
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for stream_id, stream in list(self._streams.items()):
+            if stream.done and now - stream.finished_at > self.retention_seconds:
+                del self._streams[stream_id]
+        while len(self._streams) > self.max_streams:
+            finished = next((key for key, stream in self._streams.items() if stream.done), None)
+            if finished is None:
+                break
+            del self._streams[finished]
+
+    def start(self, lines: AsyncIterator[str], owner: Optional[str] = None) -> ResumableStream:
+        """NDJSON 行のストリームをバッファへ書き込むタスクを開始"""
+        self._evict()
+        stream = ResumableStream(uuid.uuid4().hex, owner, self.max_events)
+        self._streams[stream.stream_id] = stream
+
+        async def pump():
+            try:
+                async for text in lines:
+                    for line in text.splitlines():
+                        if line:
+                            await stream.publish(line)
+            except Exception as e:
+                logger.exception(f"Resumable stream {stream.stream_id} failed: {e}")
+            finally:
+                await stream.finish()
+
+        stream.task = asyncio.ensure_future(pump())
+        return stream
+
+    def resume(self, last_event_id: Optional[str], owner: Optional[str] = None) -> Tuple[ResumableStream, int]:
+        """
+        Last-Event-ID からストリームと再開位置を取得
+
+        Raises:
+            StreamResumeError: 不明な ID・所有者の不一致・バッファから溢れたイベント
+        """
+        self._evict()
+        stream_id, seq = parse_last_event_id(last_event_id)
+        stream = self._streams.get(stream_id)
+        if stream is None or stream.owner != owner:
+            raise StreamResumeError(f"Stream {stream_id} is not available on this worker")
+        stream.events_after(seq)
+        return stream, seq
+
+
+def _format_event(stream_id: str, seq: int, data: str) -> str:
+    return f"id: {stream_id}.{seq}\ndata: {data}\n\n"
+
+
+async def sse_events(
+    stream: ResumableStream,
+    after_seq: int = -1,
+    heartbeat_seconds: float = SSE_HEARTBEAT_SECONDS
+) -> AsyncIterator[str]:
+    """
+    ストリームのイベントを SSE 形式で送る（after_seq より後から）
+
+    接続が切れてもバッファへの書き込みは続く。
+    """
+    yield f"retry: {SSE_RETRY_MS}\n\n"
+    seq = after_seq
+    while True:
+        try:
+            events = stream.events_after(seq)
+        except StreamResumeError as e:
+            yield f"event: error\ndata: {e}\n\n"
+            return
+        for event_seq, data in events:
+            yield _format_event(stream.stream_id, event_seq, data)
+            seq = event_seq
+        if stream.done and seq >= stream.next_seq - 1:
+            yield f"event: done\nid: {stream.stream_id}.{seq}\ndata: {{}}\n\n"
+            return
+        if not await stream.wait(seq, heartbeat_seconds):
+            yield ": heartbeat\n\n"
+
+
+_registry: Optional[StreamRegistry] = None
+
+
+def get_stream_registry() -> StreamRegistry:
+    """プロセス共有の StreamRegistry を取得"""
+    global _registry
+    if _registry is None:
+        _registry = StreamRegistry()
+    return _registry
@@ -0,0 +1,319 @@
+"""
+チャット応答ストリームの NDJSON エンコーダ
+
+目的:
+- トークンごとに id / model / created / history_metadata などの同じエンベロープを組み立て・シリアライズしない
+- 細かいトークンをまとめて送り、行数とバイト数を減らす
+
+設計:
+- エンベロープ（choices 以外）はストリームごとに1回だけシリアライズし、トークン行は文字列連結で組み立てる
+- 本文だけのトークンは TokenChunk としてバッファし、STREAM_COALESCE_BYTES 以上たまるか
+  最初のトークンから STREAM_COALESCE_MS 経過した時点で1行にまとめて送る（上流が止まっても待ち続けない）
+- context / tool_calls / ツール進捗 / エラーなどの通常イベントは、バッファを送ってからそのまま送る
+- シリアライズは backend.utils.dumps_json（orjson があれば使用）
+
+コンパクト形式（Accept: application/x-ndjson; profile=compact または ?stream_format=compact で選択）:
+- 各行は "t" で種別を表し、エンベロープは最初の meta 行にだけ載せる
+    {"t":"meta","id":...,"model":...,"created":...,"object":...,"history_metadata":{...},"apim-request-id":...}
+    {"t":"d","c":"本文の差分"}
+    {"t":"tc","tool_calls":{...}}        ツール呼び出しの差分
+    {"t":"ctx","context":"..."}         引用などのコンテキスト
+    {"t":"tool","tool_progress":{...}}  Modern RAG のツール進捗
+    {"t":"err","error":"..."}
+    {"t":"end","finish_reason":"stop","usage":{...}}  最終行（usage は上流が返した場合のみ）
+- history_metadata の更新（生成タイトル等）や history_error は差分のある meta 行で送る
+- 応答には X-Stream-Format: compact を付け、クライアントはこれを見てデコーダを切り替える
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Union
+
+from backend.utils import dumps_json, format_modern_rag_stream_response, format_stream_response
+
+logger = logging.getLogger(__name__)
+
+# トークン結合の時間窓（ミリ秒、0 で結合しない）とバイト数の上限
+STREAM_COALESCE_MS = float(os.environ.get("STREAM_COALESCE_MS", "20"))
+STREAM_COALESCE_BYTES = int(os.environ.get("STREAM_COALESCE_BYTES", "64"))
+
+COMPACT_STREAM_FORMAT = "compact"
+STREAM_FORMAT_HEADER = "X-Stream-Format"
+# meta 行に載せるエンベロープのキー
+_META_KEYS = ("id", "model", "created", "object", "history_metadata", "apim-request-id", "history_error")
+
+
+def wants_compact_stream(accept: Optional[str], stream_format: Optional[str] = None) -> bool:
+    """Accept ヘッダー（profile=compact）またはクエリ（stream_format=compact）でコンパクト形式が要求されたか"""
+    if stream_format:
+        return stream_format.strip().lower() == COMPACT_STREAM_FORMAT
+    for media_range in (accept or "").split(","):
+        parts = [part.strip().lower() for part in media_range.split(";")]
+        if parts[0] == "application/x-ndjson" and f"profile={COMPACT_STREAM_FORMAT}" in parts[1:]:
+            return True
+    return False
+
+
+def stream_format_headers(compact: bool) -> Dict[str, str]:
+    """ストリーム応答に付けるヘッダー（形式は Accept で変わるため Vary を付ける）"""
+    headers = {"Vary": "Accept"}
+    if compact:
+        headers[STREAM_FORMAT_HEADER] = COMPACT_STREAM_FORMAT
+    return headers
+
+
+class StreamEnvelope:
+    """
+    シリアライズ済みのチャンクエンベロープ
+
+    fields はストリーム開始時点の値で固定される（途中で history_metadata を更新する場合は
+    通常イベントとして送る）。
+    """
+
+    def __init__(self, fields: Dict[str, Any]):
+        self.fields = fields
+        head = dumps_json(fields)[:-1]
+        self._prefix = head + ("," if fields else "") + '"choices":[{"messages":[{"role":"assistant","content":'
+        self._suffix = "}]}]}\n"
+
+    def token_line(self, content: str) -> str:
+        """本文だけのチャンク1行（改行付き）"""
+        return self._prefix + dumps_json(content) + self._suffix
+
+
+class TokenChunk(NamedTuple):
+    """結合対象の本文トークン"""
+    envelope: StreamEnvelope
+    content: str
+
+
+class StreamEnd(NamedTuple):
+    """終了理由と使用量（コンパクト形式の end 行でのみ送る）"""
+    finish_reason: Optional[str]
+    usage: Optional[Dict[str, Any]] = None
+
+
+StreamItem = Union[TokenChunk, StreamEnd, Dict[str, Any]]
+
+
+class _CompactWriter:
+    """通常イベントをコンパクト形式の行に変換する（送信済みの meta を覚えて差分だけ送る）"""
+
+    def __init__(self):
+        self._sent_meta: Dict[str, str] = {}
+
+    def meta(self, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        changed = {}
+        for key in _META_KEYS:
+            if key not in fields:
+                continue
+            # history_metadata は同じ dict が更新されるため、シリアライズ結果で比較する
+            encoded = dumps_json(fields[key])
+            if self._sent_meta.get(key) != encoded:
+                self._sent_meta[key] = encoded
+                changed[key] = fields[key]
+        return {"t": "meta", **changed} if changed else None
+
+    def events(self, event: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if "error" in event and "choices" not in event:
+            return [{"t": "err", "error": event["error"]}]
+        compact = []
+        meta = self.meta(event)
+        if meta:
+            compact.append(meta)
+        if event.get("tool_progress"):
+            compact.append({"t": "tool", "tool_progress": event["tool_progress"]})
+        for message in (event.get("choices") or [{}])[0].get("messages", []):
+            if message.get("tool_calls"):
+                compact.append({"t": "tc", "tool_calls": message["tool_calls"]})
+            if message.get("context"):
+                compact.append({"t": "ctx", "context": message["context"]})
+            if message.get("content"):
+                compact.append({"t": "d", "c": message["content"]})
+        return compact
+
+    def token_line(self, envelope: StreamEnvelope, content: str) -> str:
+        meta = self.meta(envelope.fields)
+        line = '{"t":"d","c":' + dumps_json(content) + "}\n"
+        return dumps_json(meta) + "\n" + line if meta else line
+
+
+async def openai_stream_items(
+    chunks: AsyncIterator[Any],
+    history_metadata: Dict[str, Any],
+    apim_request_id: str
+) -> AsyncIterator[StreamItem]:
+    """
+    Chat Completions のストリームチャンクを StreamItem に変換
+
+    本文だけのデルタは TokenChunk、それ以外は format_stream_response と同じイベントにし、
+    最後に終了理由と使用量（stream_options.include_usage 指定時のみ）を StreamEnd で返す。
+    """
+    envelope: Optional[StreamEnvelope] = None
+    envelope_key = None
+    finish_reason = None
+    usage = None
+    async for chunk in chunks:
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage.model_dump() if hasattr(chunk.usage, "model_dump") else chunk.usage
+        if chunk.choices and getattr(chunk.choices[0], "finish_reason", None):
+            finish_reason = chunk.choices[0].finish_reason
+        delta = chunk.choices[0].delta if chunk.choices else None
+        if delta and delta.content and not delta.tool_calls and not hasattr(delta, "context"):
+            key = (chunk.id, chunk.model, chunk.created, chunk.object)
+            if key != envelope_key:
+                envelope_key = key
+                envelope = StreamEnvelope({
+                    "id": chunk.id,
+                    "model": chunk.model,
+                    "created": chunk.created,
+                    "object": chunk.object,
+                    "history_metadata": history_metadata,
+                    "apim-request-id": apim_request_id,
+                })
+            yield TokenChunk(envelope, delta.content)
+            continue
+        event = format_stream_response(chunk, history_metadata, apim_request_id)
+        if event:
+            yield event
+    yield StreamEnd(finish_reason, usage)
+
+
+async def modern_rag_stream_items(
+    events: AsyncIterator[Dict[str, Any]],
+    response_id: str,
+    model: str,
+    history_metadata: Dict[str, Any]
+) -> AsyncIterator[StreamItem]:
+    """ModernBingGroundingAgentService.stream_user_query のイベントを StreamItem に変換"""
+    envelope = StreamEnvelope({
+        "id": response_id,
+        "model": model,
+        "created": int(time.time()),
+        "object": "chat.completion.chunk",
+        "history_metadata": history_metadata,
+    })
+    async for event in events:
+        if event.get("type") == "delta" and event.get("content"):
+            yield TokenChunk(envelope, event["content"])
+            continue
+        response_obj = format_modern_rag_stream_response(event, response_id, model, history_metadata)
+        if response_obj:
+            yield response_obj
+        if event.get("type") == "final":
+            yield StreamEnd("stop" if event["result"].status == "success" else "error")
+
+
+async def encode_ndjson_stream(
+    items: AsyncIterator[StreamItem],
+    window_ms: float = STREAM_COALESCE_MS,
+    window_bytes: int = STREAM_COALESCE_BYTES,
+    compact: bool = False
+) -> AsyncIterator[str]:
+    """
+    StreamItem を NDJSON 行に変換（本文トークンは時間窓・サイズで結合）
+
+    compact=True の場合はコンパクト形式で出力し、StreamEnd は全アイテムの後に end 行として送る。
+
+    上流はタスクでキューに読み込み、到着済みのアイテムは待たずに取り出す。
+    キューが空のときの取り出しは1つの待機タスクを時間窓をまたいで使い回す
+    （アイテムや待機のたびにタスクを作り直さない。Python 3.10 でも動くよう asyncio.timeout は使わない）。
+    format_as_ndjson と同様、途中の例外はエラー行として送って終了する。
+    """
+    window = max(window_ms, 0) / 1000
+    queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+    end_of_stream = object()
+    buffer = []
+    buffered_bytes = 0
+    buffer_envelope: Optional[StreamEnvelope] = None
+    buffer_started = 0.0
+    writer = _CompactWriter() if compact else None
+    stream_end: Optional[StreamEnd] = None
+
+    async def produce():
+        try:
+            async for item in items:
+                await queue.put(item)
+        except Exception as error:
+            await queue.put(error)
+        await queue.put(end_of_stream)
+
+    def flush() -> Optional[str]:
+        nonlocal buffered_bytes, buffer_envelope
+        if not buffer:
+            return None
+        content = "".join(buffer)
+        line = writer.token_line(buffer_envelope, content) if writer else buffer_envelope.token_line(content)
+        buffer.clear()
+        buffered_bytes = 0
+        buffer_envelope = None
+        return line
+
+    producer = asyncio.ensure_future(produce())
+    getter: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if getter is None and not queue.empty():
+                item = queue.get_nowait()
+            else:
+                if getter is None:
+                    getter = asyncio.ensure_future(queue.get())
+                if buffer:
+                    # 結合待ちのトークンは時間窓を過ぎたら次のイベントを待たずに送る
+                    # （待機タスクはキャンセルせず、次の待機でそのまま使う）
+                    remaining = window - (time.monotonic() - buffer_started)
+                    if remaining > 0:
+                        await asyncio.wait((getter,), timeout=remaining)
+                    if not getter.done():
+                        yield flush()
+                        continue
+                item = await getter
+                getter = None
+
+            if item is end_of_stream:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            if isinstance(item, TokenChunk):
+                if buffer and item.envelope is not buffer_envelope:
+                    yield flush()
+                if not buffer:
+                    buffer_envelope = item.envelope
+                    buffer_started = time.monotonic()
+                buffer.append(item.content)
+                buffered_bytes += len(item.content.encode("utf-8"))
+                if buffered_bytes >= window_bytes or time.monotonic() - buffer_started >= window:
+                    yield flush()
+                continue
+
+            if isinstance(item, StreamEnd):
+                stream_end = item
+                continue
+
+            line = flush()
+            if line:
+                yield line
+            if writer:
+                for event in writer.events(item):
+                    yield dumps_json(event) + "\n"
+            else:
+                yield dumps_json(item) + "\n"
+
+        line = flush()
+        if line:
+            yield line
+        if writer and stream_end:
+            yield dumps_json({"t": "end", "finish_reason": stream_end.finish_reason, "usage": stream_end.usage}) + "\n"
+    except Exception as error:
+        logger.exception("Exception while generating response stream: %s", error)
+        line = flush()
+        if line:
+            yield line
+        yield dumps_json({"t": "err", "error": str(error)} if writer else {"error": str(error)}) + "\n"
+    finally:
+        if getter is not None and not getter.done():
+            getter.cancel()
+        if not producer.done():
+            producer.cancel()
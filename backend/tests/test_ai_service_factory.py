@@ -0,0 +1,69 @@
+"""
+AIServiceFactory 共有クライアントのテスト
+
+検証内容:
+1. get_azure_openai_client() がワーカー内で同一クライアントを再利用すること
+2. キーのローテーション時のみクライアントを再生成すること
+3. 置き換えた旧クライアントは HTTP タイムアウトに合わせた猶予の後に閉じられること
+"""
+
+import asyncio
+import os
+
+os.environ.setdefault("AZURE_OPENAI_MODEL", "gpt-4o")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com/")
+
+import pytest
+from unittest.mock import patch
+
+from backend.settings import app_settings
+from infrastructure.factories import ai_service_factory
+from infrastructure.factories.ai_service_factory import AIServiceFactory
+
+
+class TestSharedAzureOpenAIClient:
+    """共有 AsyncAzureOpenAI クライアントのテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_client_is_reused_across_calls(self):
+        """同一設定では同じクライアントが返されること"""
+        factory = AIServiceFactory()
+        with patch.object(factory, "_resolve_api_key", return_value="key-1"):
+            first = await factory.get_azure_openai_client()
+            factory.invalidate_azure_openai_client()
+            second = await factory.get_azure_openai_client()
+
+        assert first is second
+        await factory.aclose()
+
+    @pytest.mark.asyncio
+    async def test_client_is_rebuilt_on_key_rotation(self):
+        """キーが変わった場合のみクライアントが再生成されること"""
+        factory = AIServiceFactory()
+        with patch.object(factory, "_resolve_api_key", return_value="key-1"):
+            first = await factory.get_azure_openai_client()
+        factory.invalidate_azure_openai_client()
+        with patch.object(factory, "_resolve_api_key", return_value="key-2"):
+            second = await factory.get_azure_openai_client()
+
+        assert first is not second
+        assert second.api_key == "key-2"
+        await factory.aclose()
+
+    @pytest.mark.asyncio
+    async def test_retired_client_closed_after_http_timeout(self):
+        """旧クライアントは http_timeout が過ぎるまで閉じられないこと"""
+        factory = AIServiceFactory()
+        with patch.object(app_settings.azure_openai, "http_timeout", 0.1), \
+                patch.object(ai_service_factory, "RETIRED_CLIENT_GRACE_MARGIN_SECONDS", 0.0):
+            with patch.object(factory, "_resolve_api_key", return_value="key-1"):
+                first = await factory.get_azure_openai_client()
+            factory.invalidate_azure_openai_client()
+            with patch.object(factory, "_resolve_api_key", return_value="key-2"):
+                await factory.get_azure_openai_client()
+
+            await asyncio.sleep(0.05)
+            assert not first.is_closed()
+            await asyncio.sleep(0.1)
+            assert first.is_closed()
+        await factory.aclose()
@@ -0,0 +1,144 @@
+"""
+回答キャッシュのテスト
+
+検証内容:
+1. 正規化後に同じ会話は完全一致でヒットし、単一の質問は埋め込みの類似度でもヒットすること
+2. ストリームの回答は正常終了時のみ引用（context）付きで保存され、ヒット時に同じ形で再生されること
+3. TTL 切れ・他ワーカーでのパージ（インデックスバージョン変更）で回答が使われなくなること
+4. パージの確認は一定間隔に1回だけ行われ、エージェント定義が変わるとスコープが分かれること
+"""
+
+import json
+
+import pytest
+
+from backend.answer_cache import AnswerCache, cached_answer_items
+from backend.stream_encoder import StreamEnd, StreamEnvelope, TokenChunk
+
+PARAMS = {"model": "gpt-4o", "temperature": 0}
+
+
+class _FakeEmbedder:
+    """質問ごとに固定の埋め込みを返す"""
+
+    VECTORS = {
+        "経費精算の締め日は?": [1.0, 0.0, 0.0],
+        "経費精算の締切日は?": [0.98, 0.2, 0.0],
+        "交通費の上限は?": [0.0, 1.0, 0.0],
+    }
+
+    async def embed(self, text):
+        return self.VECTORS[text]
+
+
+def _cache(tmp_path, **overrides):
+    options = {"endpoints": ["conversation"], "purge_marker": str(tmp_path / "purge.json")}
+    options.update(overrides)
+    return AnswerCache(**options)
+
+
+def _messages(question, history=()):
+    return [{"role": "system", "content": "assistant"}, *history, {"role": "user", "content": question}]
+
+
+class TestAnswerCache:
+    """回答キャッシュのテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_exact_then_semantic_match(self, tmp_path):
+        """表記揺れは完全一致、言い換えは類似度でヒットし、別の質問はヒットしないこと"""
+        cache = _cache(tmp_path, embedder=_FakeEmbedder(), similarity=0.95)
+        lookup = cache.prepare("conversation", _messages("経費精算の締め日は？"), PARAMS)
+        assert await cache.lookup(lookup) is None
+        await cache.store_answer(lookup, "毎月25日です。")
+
+        exact = await cache.lookup(cache.prepare("conversation", _messages(" 経費精算の締め日は? "), PARAMS))
+        semantic = await cache.lookup(cache.prepare("conversation", _messages("経費精算の締切日は?"), PARAMS))
+        other = await cache.lookup(cache.prepare("conversation", _messages("交通費の上限は?"), PARAMS))
+
+        assert exact.match == "exact" and exact.answer.content == "毎月25日です。"
+        assert semantic.match == "semantic"
+        assert semantic.headers()["X-Answer-Cache"] == "HIT"
+        assert other is None
+        follow_up = cache.prepare(
+            "conversation", _messages("経費精算の締切日は?", [{"role": "user", "content": "こんにちは"}]), PARAMS
+        )
+        assert follow_up.semantic is False
+        assert cache.prepare("modern_rag_web", _messages("経費精算の締め日は？"), PARAMS) is None
+
+    @pytest.mark.asyncio
+    async def test_stream_recorded_with_citations(self, tmp_path):
+        """正常終了したストリームは引用付きで保存され、ヒット時は本文と引用が再生されること"""
+        cache = _cache(tmp_path)
+        fields = {"id": "resp-1", "model": "gpt-4o", "created": 0, "object": "chat.completion.chunk"}
+        context = json.dumps({"citations": [{"title": "経費精算規程", "url": "https://example.com/rule"}]})
+
+        async def items(finish_reason):
+            envelope = StreamEnvelope(fields)
+            yield TokenChunk(envelope, "毎月")
+            yield TokenChunk(envelope, "25日です。")
+            yield {**fields, "choices": [{"messages": [{"role": "assistant", "content": "", "context": context}]}]}
+            yield StreamEnd(finish_reason)
+
+        truncated = cache.prepare("conversation", _messages("途中で終わる質問"), PARAMS)
+        [item async for item in cache.record(truncated, items("length"))]
+        lookup = cache.prepare("conversation", _messages("経費精算の締め日は？"), PARAMS)
+        passed = [item async for item in cache.record(lookup, items("stop"))]
+
+        hit = await cache.lookup(cache.prepare("conversation", _messages("経費精算の締め日は？"), PARAMS))
+        replayed = [item async for item in cached_answer_items(hit.answer, fields)]
+
+        assert len(passed) == 4
+        assert await cache.lookup(truncated) is None
+        assert hit.answer.content == "毎月25日です。" and hit.answer.context == context
+        assert replayed[0].content == "毎月25日です。"
+        assert replayed[1]["choices"][0]["messages"][0]["context"] == context
+        assert replayed[2] == StreamEnd("stop")
+
+    @pytest.mark.asyncio
+    async def test_ttl_and_purge_across_workers(self, tmp_path):
+        """TTL 切れは無効、他ワーカーのパージとインデックスバージョン変更が反映されること"""
+        expired = _cache(tmp_path, ttl=0)
+        lookup = expired.prepare("conversation", _messages("経費精算の締め日は？"), PARAMS)
+        await expired.store_answer(lookup, "毎月25日です。")
+        assert await expired.lookup(lookup) is None
+
+        worker_a = _cache(tmp_path, index_version="v1", purge_check_interval=0)
+        worker_b = _cache(tmp_path, index_version="v1", purge_check_interval=0)
+        await worker_a.lookup(lookup)
+        await worker_a.store_answer(lookup, "毎月25日です。")
+        assert await worker_a.lookup(lookup) is not None
+
+        await worker_b.purge()
+        assert await worker_a.lookup(lookup) is None
+
+        await worker_a.store_answer(lookup, "毎月25日です。")
+        await worker_b.purge(index_version="v2")
+
+        assert await worker_a.lookup(lookup) is None
+        assert worker_a.index_version == "v2"
+
+    @pytest.mark.asyncio
+    async def test_purge_check_throttled(self, tmp_path):
+        """他ワーカーのパージは確認間隔が過ぎるまで照会ごとには確認しないこと"""
+        worker_a = _cache(tmp_path, purge_check_interval=60)
+        worker_b = _cache(tmp_path)
+        lookup = worker_a.prepare("conversation", _messages("経費精算の締め日は？"), PARAMS)
+        await worker_a.store_answer(lookup, "毎月25日です。")
+
+        await worker_b.purge()
+        assert await worker_a.lookup(lookup) is not None
+
+        worker_a._marker_checked_at -= 60
+        assert await worker_a.lookup(lookup) is None
+
+    def test_agent_definition_separates_scope(self, tmp_path):
+        """エージェント定義のハッシュが異なる場合は別のスコープになること"""
+        cache = _cache(tmp_path, endpoints=["modern_rag_web"])
+        messages = [{"role": "user", "content": "経費精算の締め日は？"}]
+
+        first = cache.prepare("modern_rag_web", messages, {"model": "gpt-4o", "agent_definition": "hash-1"})
+        second = cache.prepare("modern_rag_web", messages, {"model": "gpt-4o", "agent_definition": "hash-2"})
+
+        assert first.scope != second.scope
+        assert first.key != second.key
@@ -0,0 +1,115 @@
+"""
+Chat Completions シングルフライトのテスト
+
+検証内容:
+1. 決定的な設定の同一要求は上流を1回だけ呼び、全員が同じチャンク列を受け取ること（途中参加を含む）
+2. temperature が 0 でない要求・内容の異なる要求はまとめないこと
+3. 上流のエラーは相乗りした要求にも送出されること
+"""
+
+import asyncio
+
+import pytest
+
+from backend import completion_singleflight
+from backend.completion_singleflight import create_chat_completion, single_flight_key
+
+
+def _request(content="経費精算の締め日は？", temperature=0, stream=True):
+    return {
+        "model": "gpt-4o",
+        "messages": [{"role": "system", "content": "assistant"}, {"role": "user", "content": content}],
+        "temperature": temperature,
+        "top_p": 0,
+        "max_tokens": 1000,
+        "stream": stream,
+    }
+
+
+class _FakeClient:
+    """chat.completions.create の呼び出し回数を数えるクライアント"""
+
+    def __init__(self, chunks=("締め日", "は", "25日です"), error=None):
+        self.calls = 0
+        self.chunks = chunks
+        self.error = error
+        self.chat = self
+        self.completions = self
+
+    async def create(self, **request):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if not request["stream"]:
+            return f"result-{self.calls}"
+
+        async def stream():
+            for chunk in self.chunks:
+                await asyncio.sleep(0.01)
+                yield chunk
+            if self.error:
+                raise self.error
+
+        return stream()
+
+
+async def _read(request, client, delay=0.0):
+    await asyncio.sleep(delay)
+    return [chunk async for chunk in await create_chat_completion(client, request)]
+
+
+@pytest.fixture(autouse=True)
+def _fresh_single_flight(monkeypatch):
+    monkeypatch.setattr(completion_singleflight, "_single_flight", None)
+
+
+class TestCompletionSingleFlight:
+    """シングルフライトのテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_identical_streams_share_one_upstream_call(self):
+        """同時・途中参加の同一要求は1回の呼び出しを共有すること"""
+        client = _FakeClient()
+
+        results = await asyncio.gather(
+            _read(_request(), client),
+            _read(_request(" 経費精算の締め日は？ "), client),
+            _read(_request(), client, delay=0.025),
+        )
+
+        assert client.calls == 1
+        assert results == [["締め日", "は", "25日です"]] * 3
+
+        # 完了後の同一要求は新しく呼び出す（結果はキャッシュしない）
+        await _read(_request(), client)
+        assert client.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_non_deterministic_and_different_requests_not_coalesced(self):
+        """temperature > 0 や内容の異なる要求はそれぞれ呼び出すこと"""
+        client = _FakeClient()
+
+        await asyncio.gather(
+            _read(_request(temperature=0.7), client),
+            _read(_request(temperature=0.7), client),
+            _read(_request("交通費の上限は？"), client),
+        )
+        results = await asyncio.gather(
+            create_chat_completion(client, _request(stream=False)),
+            create_chat_completion(client, _request(stream=False)),
+        )
+
+        assert single_flight_key(_request(temperature=0.7)) is None
+        assert client.calls == 4
+        assert results[0] == results[1]
+
+    @pytest.mark.asyncio
+    async def test_upstream_error_reaches_all_subscribers(self):
+        """上流が途中で失敗した場合、相乗りした要求も同じエラーになること"""
+        client = _FakeClient(error=RuntimeError("upstream failed"))
+
+        results = await asyncio.gather(
+            _read(_request(), client), _read(_request(), client), return_exceptions=True
+        )
+
+        assert client.calls == 1
+        assert all(isinstance(result, RuntimeError) for result in results)
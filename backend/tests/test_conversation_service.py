@@ -0,0 +1,65 @@
+"""
+ConversationHistoryService のテスト
+
+検証内容:
+1. 新規会話はタイトル生成を待たずに暫定タイトル（最初のメッセージの切り詰め）で作成されること
+2. 生成タイトルはバックグラウンドで会話に反映され、後から取得できること
+3. 事前に払い出した会話ID・作成日時で保存されること（応答と並行した保存）
+"""
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+
+from backend.history.conversation_service import ConversationHistoryService
+
+
+class TestBackgroundTitle:
+    """タイトル生成のバックグラウンド化のテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_conversation_created_before_title_is_generated(self):
+        """LLM によるタイトル生成の完了前に会話とメッセージが作成されること"""
+        cosmos = AsyncMock()
+        cosmos.create_conversation.return_value = {"id": "conv-1", "createdAt": "2024-01-01T00:00:00"}
+        cosmos.create_message.return_value = {"id": "msg-1"}
+        service = ConversationHistoryService(cosmos)
+        release = asyncio.Event()
+
+        async def generate_title(messages):
+            await release.wait()
+            return "経費精算の締め日"
+
+        result = await asyncio.wait_for(service.create_conversation_with_message(
+            "user-1",
+            [{"role": "user", "content": "経費精算の締め日はいつですか？　交通費も含めて教えてください"}],
+            title_generator_func=generate_title
+        ), timeout=1)
+
+        metadata = result["history_metadata"]
+        assert metadata["title"] == "経費精算の締め日はいつですか？ 交..."
+        assert metadata["title_pending"] is True
+        cosmos.create_conversation.assert_awaited_once()
+        assert cosmos.create_conversation.await_args.kwargs["title"] == metadata["title"]
+        assert await service.get_generated_title("conv-1") is None
+
+        release.set()
+        assert await service.get_generated_title("conv-1", timeout=1) == "経費精算の締め日"
+        cosmos.rename_conversation.assert_awaited_once_with("user-1", "conv-1", "経費精算の締め日")
+
+    @pytest.mark.asyncio
+    async def test_allocated_metadata_used_for_creation(self):
+        """応答に先に載せたメタデータと同じ ID・タイトル・日時で会話が作成されること"""
+        cosmos = AsyncMock()
+        cosmos.create_conversation.side_effect = lambda **kwargs: {
+            "id": kwargs["conversation_id"], "createdAt": kwargs["created_at"]
+        }
+        cosmos.create_message.return_value = {"id": "msg-1"}
+        service = ConversationHistoryService(cosmos)
+        messages = [{"role": "user", "content": "こんにちは"}]
+
+        allocated = service.allocate_conversation_metadata(messages)
+        result = await service.create_conversation_with_message("user-1", messages, allocated_metadata=allocated)
+
+        assert result["history_metadata"] == allocated
+        assert cosmos.create_message.await_args.kwargs["conversation_id"] == allocated["conversation_id"]
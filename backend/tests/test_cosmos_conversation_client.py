@@ -0,0 +1,375 @@
+"""
+CosmosConversationClient のテスト
+
+検証内容:
+1. create_message がメッセージ書き込みと会話 updatedAt の部分更新を並行して行うこと
+2. 親会話が存在しない場合に孤立メッセージを削除すること
+3. write-behind 有効時に updatedAt 更新が集約され、会話の存在確認と孤立メッセージの削除が保たれること
+4. 一括削除が同時実行数を制限して並列に行われ、削除済み(404)を成功として扱うこと
+   ジョブドキュメントは会話と衝突しない id で保存され、中断時は cancelled を記録すること
+5. ID指定の参照・更新がクエリではなくポイント操作で行われ、RU消費が記録されること
+   部分更新は対象の type に限定され、クエリの RU はページごとの応答ヘッダーから記録されること
+6. メッセージ取得を直近N件のウィンドウとカーソルで分割できること
+7. インデックスポリシーの複合インデックス不足を検出し、ORDER BY を切り替えること
+"""
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock
+from azure.cosmos import exceptions
+
+from backend.history import queries
+from backend.history.bulk_delete import BulkDeleter, BulkDeleteJobManager
+from backend.history.cosmosdbservice import (
+    ConversationNotFoundError,
+    CosmosConversationClient,
+    RequestChargeTracker,
+    UpdatedAtCoalescer,
+    decode_messages_cursor,
+)
+
+
+def _build_client(container, write_behind=False):
+    client = object.__new__(CosmosConversationClient)
+    client.container_client = container
+    client.enable_message_feedback = False
+    client.updated_at_coalescer = UpdatedAtCoalescer(container, flush_interval=60) if write_behind else None
+    client.request_charges = RequestChargeTracker()
+    client.composite_indexes_ready = False
+    return client
+
+
+def _container():
+    container = Mock(spec=["upsert_item", "patch_item", "delete_item", "query_items"])
+    container.upsert_item = AsyncMock(side_effect=lambda item: item)
+    container.patch_item = AsyncMock(return_value={"id": "conv-1"})
+    container.delete_item = AsyncMock(return_value=None)
+    container.query_items = Mock(side_effect=AssertionError("get_conversation should not be called"))
+    return container
+
+
+class TestCreateMessage:
+    """create_message の高速パスのテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_message_written_with_updated_at_patch(self):
+        """会話を再読込せず updatedAt を部分更新すること"""
+        container = _container()
+        client = _build_client(container)
+
+        resp = await client.create_message("msg-1", "conv-1", "user-1", {"role": "user", "content": "hi"})
+
+        assert resp["id"] == "msg-1"
+        patch_kwargs = container.patch_item.await_args.kwargs
+        assert patch_kwargs["item"] == "conv-1"
+        assert patch_kwargs["partition_key"] == "user-1"
+        assert patch_kwargs["patch_operations"][0]["path"] == "/updatedAt"
+        assert patch_kwargs["patch_operations"][0]["value"] == resp["createdAt"]
+
+    @pytest.mark.asyncio
+    async def test_missing_conversation_removes_orphan_message(self):
+        """親会話が無い場合は 'Conversation not found' を返しメッセージを削除すること"""
+        container = _container()
+        container.patch_item = AsyncMock(side_effect=exceptions.CosmosResourceNotFoundError(message="missing"))
+        client = _build_client(container)
+
+        resp = await client.create_message("msg-1", "conv-x", "user-1", {"role": "user", "content": "hi"})
+
+        assert resp == "Conversation not found"
+        container.delete_item.assert_awaited_once_with(item="msg-1", partition_key="user-1")
+
+    @pytest.mark.asyncio
+    async def test_write_behind_coalesces_updated_at(self):
+        """write-behind 有効時は最初の書き込みで会話を確認し、以後の updatedAt 更新が1回に集約されること"""
+        container = _container()
+        client = _build_client(container, write_behind=True)
+
+        for i in range(5):
+            await client.create_message(f"msg-{i}", "conv-1", "user-1", {"role": "assistant", "content": str(i)})
+        assert container.patch_item.await_count == 1
+
+        await client.updated_at_coalescer.aclose()
+
+        assert container.patch_item.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_write_behind_keeps_conversation_not_found_contract(self):
+        """write-behind でも未確認の会話は 'Conversation not found' を返し、確認後に削除された会話の孤立メッセージは削除されること"""
+        container = _container()
+        container.patch_item = AsyncMock(side_effect=exceptions.CosmosResourceNotFoundError(message="missing"))
+        client = _build_client(container, write_behind=True)
+
+        resp = await client.create_message("msg-x", "conv-x", "user-1", {"role": "user", "content": "hi"})
+        assert resp == "Conversation not found"
+
+        client.updated_at_coalescer.remember("user-1", "conv-1")
+        await client.create_message("msg-1", "conv-1", "user-1", {"role": "user", "content": "hi"})
+        await client.updated_at_coalescer.aclose()
+
+        deleted = [call.kwargs["item"] for call in container.delete_item.await_args_list]
+        assert deleted == ["msg-x", "msg-1"]
+        assert client.updated_at_coalescer.is_known("user-1", "conv-1") is False
+
+
+class _Pager:
+    """query_items が返す AsyncItemPaged 相当（by_page 対応）"""
+
+    def __init__(self, items, page_size):
+        self._pages = [items[i:i + page_size] for i in range(0, len(items), page_size)]
+        self._items = items
+
+    def __aiter__(self):
+        return self._iterate(self._items)
+
+    def by_page(self):
+        return self._iterate([self._iterate(page) for page in self._pages])
+
+    async def _iterate(self, values):
+        for value in values:
+            yield value
+
+
+class TestBulkDelete:
+    """BulkDeleter のテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_delete_all_bounded_concurrency_and_idempotent(self):
+        """同時実行数を守って並列削除し、404 は削除済みとして進捗に計上すること"""
+        documents = {
+            "message": [{"id": f"m-{i}"} for i in range(7)],
+            "conversation": [{"id": "c-1"}, {"id": "c-2"}],
+        }
+
+        def query_items(query, parameters, partition_key, max_item_count=None):
+            if "COUNT(1)" in query:
+                return _Pager([2], 1)
+            doc_type = next(p["value"] for p in parameters if p["name"] == "@type")
+            return _Pager(documents[doc_type], max_item_count)
+
+        active = 0
+        peak = 0
+
+        async def delete_item(item, partition_key):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            if item == "m-3":
+                raise exceptions.CosmosResourceNotFoundError(message="already deleted")
+
+        container = Mock(spec=["query_items", "delete_item"])
+        container.query_items = Mock(side_effect=query_items)
+        container.delete_item = AsyncMock(side_effect=delete_item)
+        deleter = BulkDeleter(container, max_concurrency=3, page_size=4)
+
+        events = [p.to_dict() for p in [p async for p in deleter.iter_delete_all("user-1")]]
+
+        assert peak == 3
+        assert container.delete_item.await_count == 9
+        assert len(events) == 4  # メッセージ2ページ + 会話1ページ + 完了
+        assert events[-1]["status"] == "completed"
+        assert events[-1]["total_conversations"] == 2
+        assert events[-1]["deleted_messages"] == 7
+        assert events[-1]["deleted_conversations"] == 2
+
+    @pytest.mark.asyncio
+    async def test_job_documents_namespaced_and_cancelled_on_close(self):
+        """任意の job_id は拒否し、ジョブ状態は deleteJob-<id> に保存、終了時は cancelled になること"""
+        saved = {}
+        container = Mock(spec=["read", "query_items", "upsert_item", "read_item"])
+        container.read = AsyncMock(return_value={"id": "conversations"})
+        container.upsert_item = AsyncMock(side_effect=lambda document: saved.update({document["id"]: document}))
+
+        async def never_ending_count(query, parameters, partition_key):
+            await asyncio.sleep(10)
+            yield 0
+
+        container.query_items = Mock(side_effect=never_ending_count)
+        container.read_item = AsyncMock(side_effect=lambda item, partition_key: saved[item])
+        jobs = BulkDeleteJobManager(BulkDeleter(container))
+
+        with pytest.raises(ValueError):
+            await jobs.start("user-1", job_id="conv-1")
+        assert await jobs.get_status("user-1", "conv-1") is None
+
+        job = await jobs.start("user-1")
+        await asyncio.sleep(0)
+        await jobs.aclose()
+
+        document_id = f"deleteJob-{job['job_id']}"
+        assert list(saved) == [document_id]
+        assert saved[document_id]["type"] == "deleteJob"
+        assert (await jobs.get_status("user-1", job["job_id"]))["status"] == "cancelled"
+
+
+class TestPointOperations:
+    """ID指定操作のポイント読み取り・部分更新のテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_get_conversation_uses_point_read_and_records_charge(self):
+        """get_conversation が read_item を使い、RU 消費を操作ごとに記録すること"""
+        container = Mock(spec=["read_item", "query_items"])
+
+        async def read_item(item, partition_key, response_hook):
+            document = {"id": item, "type": "conversation", "userId": partition_key}
+            response_hook({"x-ms-request-charge": "1.0"}, document)
+            return document
+
+        container.read_item = AsyncMock(side_effect=read_item)
+        container.query_items = Mock(side_effect=AssertionError("query should not be used"))
+        client = _build_client(container)
+
+        conversation = await client.get_conversation("user-1", "conv-1")
+
+        assert conversation["id"] == "conv-1"
+        assert client.request_charges.snapshot()["get_conversation"] == {
+            "count": 1, "request_units": 1.0, "avg_request_units": 1.0
+        }
+
+    @pytest.mark.asyncio
+    async def test_rename_missing_conversation_raises_typed_error(self):
+        """存在しない会話のリネームは ConversationNotFoundError になること"""
+        container = _container()
+        container.patch_item = AsyncMock(side_effect=exceptions.CosmosResourceNotFoundError(message="missing"))
+        client = _build_client(container)
+
+        with pytest.raises(ConversationNotFoundError):
+            await client.rename_conversation("user-1", "conv-x", "新しいタイトル")
+
+        assert container.patch_item.await_args.kwargs["patch_operations"] == [
+            {"op": "set", "path": "/title", "value": "新しいタイトル"}
+        ]
+        assert container.patch_item.await_args.kwargs["filter_predicate"] == "FROM c WHERE c.type = 'conversation'"
+
+    @pytest.mark.asyncio
+    async def test_feedback_patch_limited_to_messages(self):
+        """フィードバックはメッセージのみに適用され、型が違う場合(412)は見つからない扱いになること"""
+        container = _container()
+        container.patch_item = AsyncMock(
+            side_effect=exceptions.CosmosAccessConditionFailedError(message="precondition failed")
+        )
+        client = _build_client(container)
+
+        assert await client.update_message_feedback("user-1", "conv-1", "positive") is False
+        assert container.patch_item.await_args.kwargs["filter_predicate"] == "FROM c WHERE c.type = 'message'"
+
+    @pytest.mark.asyncio
+    async def test_query_charges_recorded_per_page_from_hook(self):
+        """クエリの RU は各ページの応答ヘッダーから記録し、ページャー生成時の呼び出しは数えないこと"""
+        container = Mock(spec=["query_items"])
+
+        def query_items(query, parameters, response_hook, **kwargs):
+            pages = [{"Documents": [{"id": "c-1"}]}, {"Documents": [{"id": "c-2"}]}]
+
+            async def iterate():
+                for charge, page in zip(("2.5", "1.5"), pages):
+                    response_hook({"x-ms-request-charge": charge}, page)
+                    for item in page["Documents"]:
+                        yield item
+
+            pager = iterate()
+            response_hook({"x-ms-request-charge": "99"}, pager)
+            return pager
+
+        container.query_items = Mock(side_effect=query_items)
+        client = _build_client(container)
+
+        conversations = await client.get_conversations("user-1", limit=10)
+
+        assert [c["id"] for c in conversations] == ["c-1", "c-2"]
+        assert client.request_charges.snapshot()["get_conversations"] == {
+            "count": 2, "request_units": 4.0, "avg_request_units": 2.0
+        }
+
+
+class TestMessageWindow:
+    """get_messages_window のテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_window_returns_latest_messages_oldest_first_with_cursor(self):
+        """直近N件を古い順で返し、さらに古いメッセージ用のカーソルを返すこと"""
+        newest_first = [{"id": f"m-{i}", "createdAt": f"2024-01-01T00:00:0{i}"} for i in (5, 4, 3)]
+        container = Mock(spec=["query_items"])
+        container.query_items = Mock(return_value=_Pager(newest_first, 10))
+        client = _build_client(container)
+
+        messages, cursor = await client.get_messages_window("user-1", "conv-1", 3, before="2024-01-01T00:00:06")
+
+        assert [m["id"] for m in messages] == ["m-3", "m-4", "m-5"]
+        assert decode_messages_cursor(cursor) == ("2024-01-01T00:00:03", ["m-3"])
+        kwargs = container.query_items.call_args.kwargs
+        assert "c.createdAt < @before" in kwargs["query"]
+        assert kwargs["partition_key"] == "user-1"
+
+    @pytest.mark.asyncio
+    async def test_messages_sharing_created_at_are_not_skipped(self):
+        """境界と同じ createdAt のメッセージも次のウィンドウで返ること"""
+        stored = [
+            {"id": "m-1", "createdAt": "2024-01-01T00:00:01"},
+            {"id": "m-2a", "createdAt": "2024-01-01T00:00:02"},
+            {"id": "m-2b", "createdAt": "2024-01-01T00:00:02"},
+            {"id": "m-3", "createdAt": "2024-01-01T00:00:03"},
+        ]
+
+        def query_items(query, parameters, partition_key, response_hook):
+            values = {p["name"]: p["value"] for p in parameters}
+            matched = [
+                m for m in stored
+                if "@before" not in values or m["createdAt"] < values["@before"]
+                or (m["createdAt"] == values["@before"] and m["id"] not in values["@seenIds"])
+            ]
+            matched.sort(key=lambda m: m["createdAt"], reverse=True)
+            return _Pager(matched[:values["@limit"]], 10)
+
+        container = Mock(spec=["query_items"])
+        container.query_items = Mock(side_effect=query_items)
+        client = _build_client(container)
+
+        seen, cursor = [], None
+        while True:
+            messages, cursor = await client.get_messages_window("user-1", "conv-1", 2, before=cursor)
+            seen = messages + seen
+            if cursor is None:
+                break
+
+        assert sorted(m["id"] for m in seen) == ["m-1", "m-2a", "m-2b", "m-3"]
+        assert len(seen) == 4
+
+
+class TestIndexingPolicyCheck:
+    """check_indexing_policy のテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_missing_index_keeps_single_property_order_by(self):
+        """複合インデックスが不足している場合は警告対象を返し、単一プロパティで並べること"""
+        container = Mock(spec=["read"])
+        container.read = AsyncMock(return_value={"indexingPolicy": {"compositeIndexes": [[
+            {"path": "/conversationId", "order": "descending"},
+            {"path": "/createdAt", "order": "descending"},
+        ]]}})
+        client = _build_client(container)
+        client.container_name = "conversations"
+        client.composite_indexes_ready = False
+
+        missing = await client.check_indexing_policy()
+
+        assert missing == ["conversations_by_updated_at"]
+        assert client.composite_indexes_ready is False
+        assert queries.messages_query().endswith("ORDER BY c.createdAt ASC")
+
+    @pytest.mark.asyncio
+    async def test_all_indexes_present_enables_composite_order_by(self):
+        """必要な複合インデックスが揃っていれば複合 ORDER BY を使うこと"""
+        container = Mock(spec=["read"])
+        container.read = AsyncMock(return_value={"indexingPolicy": {"compositeIndexes": [
+            index.to_policy() for index in queries.REQUIRED_COMPOSITE_INDEXES
+        ]}})
+        client = _build_client(container)
+        client.container_name = "conversations"
+
+        assert await client.check_indexing_policy() == []
+        assert client.composite_indexes_ready is True
+        assert "ORDER BY c.userId DESC, c.type DESC, c.updatedAt DESC" in queries.conversation_list_query(
+            composite=True
+        )
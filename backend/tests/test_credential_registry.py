@@ -0,0 +1,69 @@
+"""
+CachingCredential / CredentialRegistry のテスト
+
+検証内容:
+1. 同一スコープのトークンはキャッシュされ、同時取得は1回にまとめられること
+2. 有効期限が近いトークンは返しつつバックグラウンドで更新されること
+"""
+
+import asyncio
+import time
+
+import pytest
+from azure.core.credentials import AccessToken
+
+from backend.auth.credential_registry import CachingCredential
+
+
+class _FakeCredential:
+    def __init__(self, lifetime):
+        self.lifetime = lifetime
+        self.calls = 0
+        self.closed = False
+
+    async def get_token(self, *scopes, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return AccessToken(f"token-{self.calls}", int(time.time() + self.lifetime))
+
+    async def close(self):
+        self.closed = True
+
+
+class TestCachingCredential:
+    """トークンキャッシュのテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_fetch(self):
+        """同時取得は1回の取得にまとめられ、以後はキャッシュを返すこと"""
+        inner = _FakeCredential(lifetime=3600)
+        credential = CachingCredential(inner, refresh_margin=300)
+
+        tokens = await asyncio.gather(*(credential.get_token("scope/.default") for _ in range(5)))
+        again = await credential.get_token("scope/.default")
+
+        assert inner.calls == 1
+        assert {t.token for t in tokens} == {"token-1"}
+        assert again.token == "token-1"
+        metrics = credential.metrics()["scope/.default"]
+        assert metrics["fetches"] == 1
+        assert metrics["hits"] == 5
+
+    @pytest.mark.asyncio
+    async def test_expiring_token_refreshed_in_background(self):
+        """期限間近のトークンは即座に返し、裏で新しいトークンを取得すること"""
+        inner = _FakeCredential(lifetime=120)
+        credential = CachingCredential(inner, refresh_margin=300)
+        await credential.get_token("scope/.default")
+
+        stale = await credential.get_token("scope/.default")
+        await asyncio.sleep(0.05)
+        fresh = await credential.get_token("scope/.default")
+
+        assert stale.token == "token-1"
+        assert fresh.token == "token-2"
+        assert credential.metrics()["scope/.default"]["background_refreshes"] >= 1
+
+        async with credential:
+            pass
+        assert inner.closed is False
@@ -0,0 +1,69 @@
+"""
+GraphGroupResolver のテスト
+
+検証内容:
+1. 同じトークンの同時リクエストが1回の Graph 呼び出しに集約され、以後キャッシュされること
+   同じ oid を名乗る別トークン（署名未検証）はキャッシュを共有しないこと
+2. Graph 呼び出し失敗時は何も許可しないフィルタを返し、キャッシュしないこと
+"""
+
+import asyncio
+import base64
+import json
+
+import pytest
+
+from backend.auth.graph_groups import GraphGroupResolver
+
+
+def _token(oid, tid="tenant-1", nonce="a"):
+    def encode(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).decode().rstrip("=")
+    return f"{encode({'alg': 'none'})}.{encode({'oid': oid, 'tid': tid, 'nonce': nonce})}.sig"
+
+
+class TestGraphGroupResolver:
+    """グループ解決とキャッシュのテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_lookups_share_one_graph_call(self):
+        """同時ミスは1回の取得にまとめられ、同じ oid でも別トークンならキャッシュを使わないこと"""
+        resolver = GraphGroupResolver("group_ids")
+        calls = []
+
+        async def fetch_group_ids(user_token):
+            calls.append(user_token)
+            await asyncio.sleep(0.05)
+            return ["g1", "g2"]
+
+        resolver.fetch_group_ids = fetch_group_ids
+
+        filters = await asyncio.gather(*(resolver.get_filter_string(_token("user-1")) for _ in range(5)))
+        cached = await resolver.get_filter_string(_token("user-1"))
+
+        assert len(calls) == 1
+        assert set(filters) == {"group_ids/any(g:search.in(g, 'g1, g2'))"}
+        assert cached == filters[0]
+        assert resolver.get_cached_filter_string(_token("user-1", nonce="forged")) is None
+
+    @pytest.mark.asyncio
+    async def test_failure_returns_deny_all_filter_without_caching(self):
+        """取得失敗時は空グループのフィルタを返し、次回は再取得すること"""
+        resolver = GraphGroupResolver("group_ids")
+        attempts = 0
+
+        async def fetch_group_ids(user_token):
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1:
+                raise RuntimeError("Error fetching user groups: 503")
+            return ["g1"]
+
+        resolver.fetch_group_ids = fetch_group_ids
+
+        first = await resolver.get_filter_string(_token("user-2"))
+        second = await resolver.get_filter_string(_token("user-2"))
+
+        assert first == "group_ids/any(g:search.in(g, ''))"
+        assert second == "group_ids/any(g:search.in(g, 'g1'))"
+        assert resolver.get_cached_filter_string(_token("user-2")) == second
@@ -0,0 +1,99 @@
+"""
+AsyncKeyVaultSecretStore のテスト
+
+検証内容:
+1. シークレットを並行に一括取得し、以降はキャッシュから返すこと（未登録も TTL 内はキャッシュ）
+2. 更新時に Key Vault へ到達できない場合は直前の値を返し続けること
+3. 削除・無効化されたシークレットはキャッシュと環境変数から取り除くこと
+"""
+
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+
+from backend.keyvault_utils import AsyncKeyVaultSecretStore, KeyVaultConfig
+
+
+class _FakeSecretClient:
+    def __init__(self, values):
+        self.values = values
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+
+    async def get_secret(self, name):
+        self.calls.append(name)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        value = self.values[name]
+        if isinstance(value, Exception):
+            raise value
+        return SimpleNamespace(value=value)
+
+
+def _store(values, **kwargs):
+    store = AsyncKeyVaultSecretStore(KeyVaultConfig(vault_url="https://kv-test.vault.azure.net/"), **kwargs)
+    store._client = _FakeSecretClient(values)
+    return store
+
+
+class TestAsyncKeyVaultSecretStore:
+    """非同期シークレットストアのテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_load_all_fetches_concurrently_and_caches(self, monkeypatch):
+        """一括取得は並行に行われ、2回目以降は Key Vault を呼ばないこと"""
+        monkeypatch.delenv("TEST_KV_MAPPED", raising=False)
+        store = _store(
+            {"a": "1", "b": "2", "missing": ResourceNotFoundError("not found")},
+            env_mappings={"TEST_KV_MAPPED": "a"}
+        )
+
+        secrets = await store.load_all(["a", "b", "missing"])
+
+        assert secrets == {"a": "1", "b": "2", "missing": None}
+        assert store._client.peak == 3
+        assert os.environ["TEST_KV_MAPPED"] == "1"
+        assert await store.get_secret("a") == "1"
+        assert await store.get_secret("missing", "default") == "default"
+        assert len(store._client.calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_refresh_failure_keeps_last_known_value(self):
+        """更新時の取得失敗では直前の値を保持すること"""
+        store = _store({"a": "old"})
+        await store.load_all(["a"])
+        store._client.values["a"] = RuntimeError("vault unreachable")
+
+        await store.fetch("a")
+
+        assert store.get_cached("a") == "old"
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("error", [
+        ResourceNotFoundError("not found"),
+        HttpResponseError(
+            response=SimpleNamespace(
+                status_code=403, reason="Forbidden", headers={}, request=None,
+                text=lambda: '{"error": {"code": "Forbidden", "message": "Operation get is not allowed on a disabled secret.",'
+                             ' "innererror": {"code": "SecretDisabled"}}}',
+            )
+        ),
+    ])
+    async def test_removed_secret_dropped_from_cache_and_env(self, monkeypatch, error):
+        """削除・無効化されたシークレットは直前の値を返さず、書き込んだ環境変数も消すこと"""
+        monkeypatch.delenv("TEST_KV_REMOVED", raising=False)
+        store = _store({"a": "old"}, env_mappings={"TEST_KV_REMOVED": "a"})
+        await store.load_all(["a"])
+        assert os.environ["TEST_KV_REMOVED"] == "old"
+        store._client.values["a"] = error
+
+        await store.load_all(["a"])
+
+        assert store.get_cached("a") is None
+        assert "TEST_KV_REMOVED" not in os.environ
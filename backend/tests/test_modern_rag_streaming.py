@@ -0,0 +1,292 @@
+"""
+Modern RAG ストリーミング応答のテスト
+
+検証内容:
+1. Agents run イベントストリームのデルタが順に転送され、最後に引用チャンクが出ること
+2. ストリーミング不可の場合にポーリングへフォールバックし、開始済みの run があれば再利用すること
+3. ツール呼び出しの並列実行（バッチ検索の時間も計測に含む）と会話ごとのスレッド再利用
+4. エージェント定義ハッシュによるワーカー間でのエージェント再利用
+5. イベントが途絶えたストリームも response_timeout で打ち切られ、会話ロックが解放されること
+"""
+
+import os
+
+os.environ.setdefault("AZURE_OPENAI_MODEL", "gpt-4o")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com/")
+
+import asyncio
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from azure.ai.agents.models import ThreadRun
+from azure.core.exceptions import ResourceNotFoundError
+
+from backend.agent_identity import FileAgentIdentityStore
+from backend.modern_rag_web_service import AgentThreadCache, ModernBingGroundingAgentService
+from backend.utils import format_modern_rag_stream_response
+
+
+class _FakeStream:
+    """runs.stream() が返す AsyncAgentRunStream 相当"""
+
+    def __init__(self, events):
+        self._events = events
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return None
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for event in self._events:
+            yield event
+
+
+def _build_service(stream_side_effect):
+    service = object.__new__(ModernBingGroundingAgentService)
+    service.response_timeout = 30
+    service.search_proxy_client = None
+
+    client = SimpleNamespace(
+        threads=SimpleNamespace(create=AsyncMock(return_value=SimpleNamespace(id="thread-1"))),
+        messages=SimpleNamespace(create=AsyncMock(return_value=SimpleNamespace(
+            id="msg-1", created_at=datetime.now()
+        ))),
+        runs=SimpleNamespace(
+            stream=AsyncMock(side_effect=stream_side_effect),
+            create=AsyncMock(return_value=SimpleNamespace(id="run-1")),
+            get=AsyncMock(return_value=SimpleNamespace(id="run-1", status="completed")),
+        ),
+    )
+    service._get_or_create_agent = AsyncMock(return_value=SimpleNamespace(id="agent-1"))
+    service._get_agents_client = AsyncMock(return_value=client)
+    service._extract_modern_citations = AsyncMock(return_value=[])
+    service._extract_response = AsyncMock(return_value="polled answer")
+    service._wait_for_completion = AsyncMock(return_value=SimpleNamespace(id="run-1", status="completed"))
+    return service, client
+
+
+async def _events(stream):
+    return [event async for event in stream]
+
+
+async def _collect(service):
+    return await _events(service.stream_user_query("質問です", "user-1"))
+
+
+class TestModernRagStreaming:
+    """stream_user_query のテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_stream_forwards_deltas_then_citations(self):
+        """デルタが順に転送され、最後に final イベントが出ること"""
+        events = [
+            ("thread.run.created", ThreadRun({"id": "run-1", "status": "queued"}), None),
+            ("thread.message.delta", SimpleNamespace(text="こんに"), None),
+            ("thread.message.delta", SimpleNamespace(text="ちは"), None),
+            ("thread.run.completed", ThreadRun({"id": "run-1", "status": "completed"}), None),
+            ("done", "[DONE]", None),
+        ]
+        service, client = _build_service(lambda **kwargs: _FakeStream(events))
+
+        result = await _collect(service)
+
+        assert [e["content"] for e in result if e["type"] == "delta"] == ["こんに", "ちは"]
+        assert result[-1]["type"] == "final"
+        assert result[-1]["result"].status == "success"
+        assert result[-1]["result"].response == "こんにちは"
+        client.runs.create.assert_not_called()
+
+        chunk = format_modern_rag_stream_response(result[0], "resp-1", "gpt-4o", {})
+        assert chunk["choices"][0]["messages"][0]["content"] == "こんに"
+
+    @pytest.mark.asyncio
+    async def test_stream_falls_back_to_polling(self):
+        """ストリーミングが使えない場合はポーリング結果を1チャンクで返すこと"""
+        def unavailable(**kwargs):
+            raise RuntimeError("streaming not supported")
+
+        service, client = _build_service(unavailable)
+
+        result = await _collect(service)
+
+        client.runs.create.assert_awaited_once()
+        assert [e["content"] for e in result if e["type"] == "delta"] == ["polled answer"]
+        assert result[-1]["result"].status == "success"
+
+    @pytest.mark.asyncio
+    async def test_stalled_stream_times_out_and_releases_lock(self):
+        """次のイベントが届かなくても response_timeout で timeout を返し、同じ会話を続けられること"""
+        class _StalledStream(_FakeStream):
+            async def _iterate(self):
+                yield ("thread.run.created", ThreadRun({"id": "run-1", "status": "queued"}), None)
+                await asyncio.sleep(60)
+                yield ("done", "[DONE]", None)
+
+        service, client = _build_service(lambda **kwargs: _StalledStream([]))
+        service.response_timeout = 0.1
+        service.thread_cache = AgentThreadCache()
+
+        result = await asyncio.wait_for(
+            _events(service.stream_user_query("質問です", "user-1", conversation_id="conv-1")), 2
+        )
+
+        assert result[-1]["result"].status == "timeout"
+        assert "timed out" in result[-1]["result"].error
+        assert not service._conversation_lock("conv-1", "user-1").locked()
+
+    @pytest.mark.asyncio
+    async def test_polling_fallback_reuses_run_started_by_stream(self):
+        """ThreadRun イベント前にストリームが失敗しても、開始済みの run を待ち新しい run を作らないこと"""
+        def broken(**kwargs):
+            raise RuntimeError("connection reset")
+
+        service, client = _build_service(broken)
+
+        async def list_runs(thread_id, limit=None, order=None):
+            yield SimpleNamespace(id="run-started", status="in_progress")
+
+        client.runs.list = list_runs
+
+        result = await _collect(service)
+
+        client.runs.create.assert_not_called()
+        assert service._wait_for_completion.await_args.args[0].id == "run-started"
+        assert result[-1]["result"].status == "success"
+
+
+class TestParallelToolCalls:
+    """requires_action 時のツール並列実行のテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_tool_calls_run_concurrently_with_partial_failure(self):
+        """ツール呼び出しが並列に実行され、失敗分はエラー出力として順序通り返ること"""
+        service = object.__new__(ModernBingGroundingAgentService)
+        service.tool_call_stats = {"batches": 0, "calls": 0, "wall_clock_seconds": 0.0, "saved_seconds": 0.0}
+
+        async def execute_tool_call(name, arguments):
+            await asyncio.sleep(0.2)
+            if arguments["query"] == "bad":
+                raise RuntimeError("proxy failure")
+            return '{"results": []}'
+
+        service.search_proxy_client = SimpleNamespace(execute_tool_call=execute_tool_call)
+        tool_calls = [
+            SimpleNamespace(id=f"call-{q}", function=SimpleNamespace(
+                name="search_internal_documents", arguments=f'{{"query": "{q}"}}'
+            ))
+            for q in ("a", "bad", "c")
+        ]
+
+        started = asyncio.get_running_loop().time()
+        outputs = await service._execute_tool_calls(tool_calls)
+        elapsed = asyncio.get_running_loop().time() - started
+
+        assert elapsed < 0.5
+        assert [o["tool_call_id"] for o in outputs] == ["call-a", "call-bad", "call-c"]
+        assert "proxy failure" in outputs[1]["output"]
+        assert service.tool_call_stats["saved_seconds"] > 0
+
+    @pytest.mark.asyncio
+    async def test_batched_search_time_included_in_stats(self):
+        """バッチ検索は他のツール呼び出しと並行に実行され、その時間が統計に含まれること"""
+        service = object.__new__(ModernBingGroundingAgentService)
+        service.tool_call_stats = {"batches": 0, "calls": 0, "wall_clock_seconds": 0.0, "saved_seconds": 0.0}
+
+        async def execute_batch_tool_calls(calls):
+            await asyncio.sleep(0.1)
+            return {call_id: '{"results": []}' for call_id, _ in calls}
+
+        async def execute_single_tool_call(tool_call):
+            await asyncio.sleep(0.1)
+            return {"tool_call_id": tool_call.id, "output": '{"time": "10:00"}'}
+
+        service.search_proxy_client = SimpleNamespace(execute_batch_tool_calls=execute_batch_tool_calls)
+        service._execute_single_tool_call = execute_single_tool_call
+        tool_calls = [
+            SimpleNamespace(id=f"call-{q}", function=SimpleNamespace(
+                name="search_internal_documents", arguments=f'{{"query": "{q}"}}'
+            ))
+            for q in ("a", "b")
+        ] + [SimpleNamespace(id="call-clock", function=SimpleNamespace(name="get_current_time", arguments="{}"))]
+
+        started = asyncio.get_running_loop().time()
+        outputs = await service._execute_tool_calls(tool_calls)
+        elapsed = asyncio.get_running_loop().time() - started
+
+        assert [o["tool_call_id"] for o in outputs] == ["call-a", "call-b", "call-clock"]
+        assert elapsed < 0.18
+        assert service.tool_call_stats["wall_clock_seconds"] >= 0.1
+        assert service.tool_call_stats["saved_seconds"] > 0
+
+
+class TestAgentThreadReuse:
+    """会話ごとの Agents スレッド再利用のテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_follow_up_turn_reuses_thread(self):
+        """同じ会話の2ターン目は既存スレッドにメッセージを追加するだけであること"""
+        service, client = _build_service(None)
+        service.thread_cache = AgentThreadCache()
+
+        first = await service._prepare_thread(client, "1ターン目", "user-1", "conv-1", None)
+        second = await service._prepare_thread(client, "2ターン目", "user-1", "conv-1", None)
+
+        assert first[0] == second[0] == "thread-1"
+        assert (first[2], second[2]) == (True, False)
+        client.threads.create.assert_awaited_once()
+        assert client.messages.create.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_deleted_thread_falls_back_to_new_thread(self):
+        """保存済みスレッドが削除されていた場合は新規スレッドを作成すること"""
+        service, client = _build_service(None)
+        service.thread_cache = AgentThreadCache()
+        created = SimpleNamespace(id="msg-2", created_at=datetime.now())
+        client.messages.create = AsyncMock(side_effect=[ResourceNotFoundError("gone"), created])
+
+        thread_id, _, thread_created = await service._prepare_thread(
+            client, "質問", "user-1", "conv-1", "stale-thread"
+        )
+
+        assert thread_id == "thread-1"
+        assert thread_created is True
+        assert service.get_cached_thread_id("conv-1", "user-1") == "thread-1"
+
+
+class TestAgentIdentityReuse:
+    """エージェント ID 永続化のテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_workers_share_one_created_agent(self, tmp_path):
+        """同時に起動した複数ワーカーでも create_agent は1回だけ呼ばれ、以後は再利用されること"""
+        client = SimpleNamespace(
+            create_agent=AsyncMock(return_value=SimpleNamespace(id="agent-1")),
+            get_agent=AsyncMock(return_value=SimpleNamespace(id="agent-1")),
+        )
+
+        def build_worker():
+            service = object.__new__(ModernBingGroundingAgentService)
+            service.agent_cache = {}
+            service._agent_lock = asyncio.Lock()
+            service.agent_store = FileAgentIdentityStore(str(tmp_path / "agents.json"))
+            service._get_agents_client = AsyncMock(return_value=client)
+            service.build_agent_definition = lambda: {
+                "name": "corp-web-rag-agent", "model": "gpt-4o", "instructions": "指示",
+                "tools": [{"type": "bing_grounding"}], "tool_resources": None,
+            }
+            return service
+
+        workers = [build_worker(), build_worker()]
+        agents = await asyncio.gather(*(w._get_or_create_agent() for w in workers for _ in range(3)))
+        restarted = await build_worker()._get_or_create_agent()
+
+        assert {agent.id for agent in agents} == {"agent-1"}
+        assert restarted.id == "agent-1"
+        client.create_agent.assert_awaited_once()
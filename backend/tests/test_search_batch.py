@@ -0,0 +1,177 @@
+"""
+Search Proxy バッチモードのテスト
+
+検証内容:
+1. 複数クエリが並行実行され、正規化後に同一のクエリは1回だけ検索されること
+2. 結果はクエリキーごとに返り、クエリ間で重複するドキュメントは documents に1回だけ含まれること
+3. クライアントが組み立て直したバッチ結果が単一検索の結果と同じ形になり、id の無いドキュメントも取り違えないこと
+4. デプロイされる関数アプリ（infra/searchfuncapp）でも search/batch ルートが使えること
+5. バッチ要求の一時的な 5xx は個別検索にフォールバックし、バッチは無効化しないこと
+"""
+
+import asyncio
+import json
+
+import azure.functions as func
+import pytest
+
+from backend.functions import search_proxy
+from backend.functions.config import FunctionsConfig
+from backend.functions.search_cache import SearchResultCache
+from backend.modern_rag_web_service import SearchProxyClient
+from infra.searchfuncapp import Search as deployed_search
+
+
+class TestSearchBatch:
+    """バッチ検索のテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_batch_runs_concurrently_and_dedupes_documents(self, monkeypatch):
+        """同一クエリは1回だけ実行し、重複ドキュメントは1回だけ返すこと"""
+        calls = []
+
+        async def perform_search(search_text, top, filters, request_id, projection=None, query_type=None):
+            calls.append(search_text)
+            await asyncio.sleep(0.1)
+            return [
+                {"id": "shared", "score": 1.0, "fields": {"title": "共通"}},
+                {"id": f"doc-{search_text.strip().lower()}", "score": 0.5, "fields": {"title": search_text}},
+            ]
+
+        config = FunctionsConfig(search_endpoint="https://example.search.windows.net", search_index="i", search_key="k")
+        monkeypatch.setattr(search_proxy, "perform_search", perform_search)
+        monkeypatch.setattr(search_proxy, "get_config", lambda: config)
+        monkeypatch.setattr(search_proxy, "get_search_cache", lambda: SearchResultCache(ttl=0))
+
+        request = search_proxy.HttpRequest("POST", body={
+            "queries": [{"id": "q1", "search_text": "A"}, {"id": "q2", "search_text": " a "}, "B"],
+            "top": 2,
+        })
+        started = asyncio.get_running_loop().time()
+        response = await search_proxy.main(request)
+        elapsed = asyncio.get_running_loop().time() - started
+        data = json.loads(response.get_body())
+
+        assert response.status_code == 200
+        assert sorted(calls) == ["A", "B"]
+        assert elapsed < 0.2
+        assert set(data["results"]) == {"q1", "q2", "B"}
+        assert data["results"]["q2"]["results"] == data["results"]["q1"]["results"]
+        assert set(data["documents"]) == {"shared", "doc-a", "doc-b"}
+
+    @pytest.mark.asyncio
+    async def test_client_rebuilds_batch_results_in_single_search_shape(self, monkeypatch):
+        """バッチ経由の結果が関数アプリの単一検索と同じ形になり、id の無いドキュメントがクエリ間で混ざらないこと"""
+        async def search(search_text, top, projection, query_type="simple"):
+            return [
+                {"@search.score": 1.0, "id": "shared", "title": "共通"},
+                {"@search.score": 0.5, "title": f"id なし {search_text}", "@search.truncated": True},
+            ]
+
+        monkeypatch.setattr(deployed_search, "_search", search)
+        monkeypatch.setattr(deployed_search, "get_search_cache", lambda: SearchResultCache(ttl=0))
+
+        async def call_function(path, body):
+            request = func.HttpRequest(
+                method="POST",
+                url=f"https://example.azurewebsites.net/api/{path}",
+                route_params={"mode": "batch"} if path.endswith("/batch") else {},
+                body=json.dumps(body).encode(),
+            )
+            return json.loads((await deployed_search.main(request)).get_body())
+
+        batch_payload = await call_function("search/batch", {"queries": [
+            {"id": "call-1", "search_text": "A", "top": 5},
+            {"id": "call-2", "search_text": "B", "top": 5},
+        ]})
+
+        class _Response:
+            status = 200
+
+            async def json(self):
+                return batch_payload
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+        class _Session:
+            def post(self, url, json):
+                return _Response()
+
+        async def get_session():
+            return _Session()
+
+        client = object.__new__(SearchProxyClient)
+        client.batch_url = "https://proxy/api/search/batch"
+        client._batch_supported = True
+        client._request_count = client._error_count = client._batch_count = 0
+        client._get_session = get_session
+        outputs = await client.execute_batch_tool_calls([("call-1", {"query": "A"}), ("call-2", {"query": "B"})])
+
+        for call_id, text in (("call-1", "A"), ("call-2", "B")):
+            single = await call_function("search", {"search_text": text, "top": 5})
+            assert json.loads(outputs[call_id])["results"] == single["results"]
+        assert json.loads(outputs["call-2"])["results"][1]["title"] == "id なし B"
+
+    @pytest.mark.asyncio
+    async def test_deployed_function_app_serves_batch_route(self, monkeypatch):
+        """infra の関数アプリも search/batch でクエリをまとめて実行すること"""
+        async def search(search_text, top, projection, query_type="simple"):
+            return [{"@search.score": 1.0, "id": "shared", "title": "共通"}]
+
+        monkeypatch.setattr(deployed_search, "_search", search)
+        monkeypatch.setattr(deployed_search, "get_search_cache", lambda: SearchResultCache(ttl=0))
+        request = func.HttpRequest(
+            method="POST",
+            url="https://example.azurewebsites.net/api/search/batch",
+            route_params={"mode": "batch"},
+            body=json.dumps({"queries": [{"id": "q1", "query": "A"}, {"id": "q2", "query": "B"}]}).encode(),
+        )
+
+        response = await deployed_search.main(request)
+        data = json.loads(response.get_body())
+
+        assert response.status_code == 200
+        assert data["results"]["q1"]["results"] == [{"doc": "shared", "@search.score": 1.0}]
+        assert data["documents"] == {"shared": {"id": "shared", "title": "共通"}}
+
+    @pytest.mark.asyncio
+    async def test_client_falls_back_on_transient_batch_failure(self):
+        """バッチ要求が 503 の場合は個別検索で結果を返し、次回もバッチを試すこと"""
+        client = object.__new__(SearchProxyClient)
+        client.batch_url = "https://proxy/api/search/batch"
+        client._batch_supported = True
+        client._request_count = client._error_count = client._batch_count = 0
+
+        class _Response:
+            status = 503
+
+            async def text(self):
+                return "Service Unavailable"
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+        class _Session:
+            def post(self, url, json):
+                return _Response()
+
+        async def get_session():
+            return _Session()
+
+        async def search(query, top=5, filters=None):
+            return {"results": [{"id": f"doc-{query}"}], "count": 1}
+
+        client._get_session = get_session
+        client.search = search
+
+        results = await client.batch_search([{"id": "q1", "query": "A"}, {"id": "q2", "query": "B"}])
+
+        assert results["q2"] == {"results": [{"id": "doc-B"}], "count": 1}
+        assert client._batch_supported is True
@@ -0,0 +1,36 @@
+"""
+SearchResultCache のテスト
+
+検証内容:
+1. 表記揺れ（大文字小文字・空白・全角）やフィルタのキー順が違っても同じキャッシュキーになること
+2. プロセス内 LRU で上限超過分が追い出され、共有ティア（SQLite）から復元できること
+"""
+
+import pytest
+
+from backend.functions.search_cache import SearchResultCache, SqliteCacheTier, make_cache_key
+
+
+class TestSearchResultCache:
+    """検索結果キャッシュのテストスイート"""
+
+    def test_cache_key_is_normalized(self):
+        """正規化後に同じ検索条件なら同じキーになること"""
+        key = make_cache_key("Azure  Search", 5, {"b": 1, "a": 2})
+
+        assert make_cache_key(" ａｚｕｒｅ search ", 5, {"a": 2, "b": 1}) == key
+        assert make_cache_key("azure search", 10, {"a": 2, "b": 1}) != key
+        assert make_cache_key("azure search", 5, {}) == make_cache_key("azure search", 5, None)
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction_falls_back_to_shared_tier(self, tmp_path):
+        """追い出されたエントリは共有ティアから取得され、どちらにも無ければミスになること"""
+        cache = SearchResultCache(ttl=60, max_entries=1, shared_tier=SqliteCacheTier(str(tmp_path / "cache.db")))
+
+        await cache.set("k1", [{"id": "1"}])
+        await cache.set("k2", [{"id": "2"}])
+
+        assert await cache.get("k2") == ([{"id": "2"}], "memory")
+        assert await cache.get("k1") == ([{"id": "1"}], "shared")
+        assert await cache.get("k3") == (None, None)
+        assert cache.stats == {"hits": 1, "shared_hits": 1, "misses": 1, "shared_errors": 0}
@@ -0,0 +1,56 @@
+"""
+SearchProjection / encode_body のテスト
+
+検証内容:
+1. ベクトルフィールドが既定で除外され、本文が上限文字数で切り詰められること
+2. gzip は Accept-Encoding に含まれ、下限サイズ以上の場合のみ適用されること
+"""
+
+import gzip
+
+import pytest
+
+from backend.functions.config import FunctionsConfig
+from backend.functions.search_payload import ProjectionError, SearchProjection, encode_body
+
+
+def _config(**overrides):
+    return FunctionsConfig(
+        search_endpoint="https://example.search.windows.net",
+        search_index="index",
+        search_key="key",
+        **overrides
+    )
+
+
+class TestSearchPayload:
+    """応答の射影・圧縮のテストスイート"""
+
+    def test_vectors_dropped_and_content_capped(self):
+        """ベクトルは設定名・形状の両方で除外され、要求値は設定上限に丸められること"""
+        projection = SearchProjection.from_request(_config(max_content_chars=10), {"max_content_chars": 100})
+        fields, truncated = projection.compact_fields({
+            "title": "doc",
+            "content": "x" * 50,
+            "contentVector": [0.1, 0.2],
+            "otherVector": [0.5] * 128,
+            "tags": ["a", "b"],
+        })
+
+        assert fields == {"title": "doc", "content": "x" * 10 + "…", "tags": ["a", "b"]}
+        assert truncated == ["content"]
+        with pytest.raises(ProjectionError):
+            SearchProjection.from_request(_config(), {"select": 1})
+
+    def test_gzip_only_when_accepted_and_large(self):
+        """gzip 対応クライアントかつ下限以上のサイズのみ圧縮すること"""
+        body = "{\"results\": \"" + "あ" * 1000 + "\"}"
+
+        compressed, headers = encode_body(body, "gzip, deflate, br", 1024)
+        plain, no_headers = encode_body(body, "br", 1024)
+        small, small_headers = encode_body("{}", "gzip", 1024)
+
+        assert headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(compressed).decode("utf-8") == body
+        assert (plain, no_headers) == (body, {})
+        assert (small, small_headers) == ("{}", {})
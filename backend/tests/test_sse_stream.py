@@ -0,0 +1,83 @@
+"""
+SSE 転送と再開のテスト
+
+検証内容:
+1. 各イベントに <stream_id>.<seq> の ID が付き、無通信時はハートビート、最後に done が送られること
+2. 切断後も生成は続き、Last-Event-ID から続きだけを受け取れること（上流は再実行しない）
+3. 他ユーザー・バッファから溢れたイベントからの再開は拒否されること
+"""
+
+import asyncio
+
+import pytest
+
+from backend.sse_stream import StreamRegistry, StreamResumeError, sse_events
+
+
+async def _lines(count, delay=0.0, produced=None):
+    for index in range(count):
+        if delay:
+            await asyncio.sleep(delay)
+        if produced is not None:
+            produced.append(index)
+        yield f'{{"n":{index}}}\n'
+
+
+class TestSseStream:
+    """SSE ストリームのテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_event_ids_heartbeat_and_done(self):
+        """イベント ID・ハートビート・終了イベントが送られること"""
+        registry = StreamRegistry()
+        stream = registry.start(_lines(2, delay=0.05), owner="user-1")
+
+        frames = [frame async for frame in sse_events(stream, heartbeat_seconds=0.01)]
+
+        assert frames[0].startswith("retry: ")
+        assert ": heartbeat\n\n" in frames
+        data = [frame for frame in frames if frame.startswith("id: ")]
+        assert data == [
+            f'id: {stream.stream_id}.0\ndata: {{"n":0}}\n\n',
+            f'id: {stream.stream_id}.1\ndata: {{"n":1}}\n\n',
+        ]
+        assert frames[-1].startswith("event: done\n")
+
+    @pytest.mark.asyncio
+    async def test_resume_after_disconnect(self):
+        """切断中のイベントも保持され、再接続で続きから受け取れること"""
+        registry = StreamRegistry()
+        produced = []
+        stream = registry.start(_lines(5, delay=0.01, produced=produced), owner="user-1")
+
+        received = []
+        connection = sse_events(stream)
+        async for frame in connection:
+            if frame.startswith("id: "):
+                received.append(frame)
+                if len(received) == 2:
+                    break
+        await connection.aclose()
+        await stream.task
+
+        resumed, seq = registry.resume(f"{stream.stream_id}.1", owner="user-1")
+        frames = [frame async for frame in sse_events(resumed, after_seq=seq)]
+
+        assert [frame.split("\n")[1] for frame in frames if frame.startswith("id: ")] == [
+            'data: {"n":2}', 'data: {"n":3}', 'data: {"n":4}'
+        ]
+        assert produced == [0, 1, 2, 3, 4]
+
+    @pytest.mark.asyncio
+    async def test_resume_rejected(self):
+        """所有者が違う場合・必要なイベントが溢れた場合は再開できないこと"""
+        registry = StreamRegistry(max_events=2)
+        stream = registry.start(_lines(5), owner="user-1")
+        await stream.task
+
+        with pytest.raises(StreamResumeError):
+            registry.resume(f"{stream.stream_id}.3", owner="user-2")
+        with pytest.raises(StreamResumeError):
+            registry.resume(f"{stream.stream_id}.0", owner="user-1")
+        resumed, seq = registry.resume(f"{stream.stream_id}.2", owner="user-1")
+        assert [event[0] for event in resumed.events_after(seq)] == [3, 4]
@@ -0,0 +1,153 @@
+"""
+NDJSON ストリームエンコーダのテスト
+
+検証内容:
+1. 本文トークンがサイズで結合され、従来形式と同じ内容・エンベロープで復元できること
+2. 上流が止まっても時間窓を過ぎたトークンは先に送られること
+3. 本文以外のイベントは結合中のトークンを送ってから送られること
+4. コンパクト形式ではエンベロープを meta 行で1回だけ送り、更新は差分、最後に end 行を送ること
+5. 時間窓ごとの待機でアイテムを取りこぼさず、上流のエラー行も改行で終わること
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from backend.stream_encoder import encode_ndjson_stream, openai_stream_items, wants_compact_stream
+
+
+def _chunk(content=None, tool_calls=None, finish_reason=None):
+    return SimpleNamespace(
+        id="chatcmpl-1",
+        model="gpt-4o",
+        created=1700000000,
+        object="chat.completion.chunk",
+        choices=[SimpleNamespace(
+            delta=SimpleNamespace(role="assistant", content=content, tool_calls=tool_calls),
+            finish_reason=finish_reason,
+        )],
+    )
+
+
+async def _collect(stream):
+    return [json.loads(line) async for text in stream for line in text.splitlines()]
+
+
+class TestStreamEncoder:
+    """ストリームエンコーダのテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_tokens_coalesced_by_size(self):
+        """トークンは上限バイト数ごとに1行にまとめられ、エンベロープは従来と同じであること"""
+        history_metadata = {"conversation_id": "conv-1", "title": "経費"}
+
+        async def chunks():
+            for token in ["経費", "精算", "の", "締め日", "は", "25日", "です"]:
+                yield _chunk(token)
+
+        lines = await _collect(encode_ndjson_stream(
+            openai_stream_items(chunks(), history_metadata, "apim-1"), window_ms=1000, window_bytes=12
+        ))
+
+        assert len(lines) < 7
+        assert "".join(line["choices"][0]["messages"][0]["content"] for line in lines) == "経費精算の締め日は25日です"
+        assert lines[0]["id"] == "chatcmpl-1"
+        assert lines[0]["history_metadata"] == history_metadata
+        assert lines[0]["apim-request-id"] == "apim-1"
+        assert lines[0]["choices"][0]["messages"][0]["role"] == "assistant"
+
+    @pytest.mark.asyncio
+    async def test_stalled_upstream_flushes_after_window(self):
+        """次のチャンクが遅れても、時間窓を過ぎたトークンはその前に送られること"""
+        received = []
+
+        async def chunks():
+            yield _chunk("前半")
+            await asyncio.sleep(0.2)
+            yield _chunk("後半")
+
+        async for line in encode_ndjson_stream(
+            openai_stream_items(chunks(), {}, ""), window_ms=20, window_bytes=1024
+        ):
+            received.append((asyncio.get_running_loop().time(), json.loads(line)))
+
+        assert [item["choices"][0]["messages"][0]["content"] for _, item in received] == ["前半", "後半"]
+        assert received[1][0] - received[0][0] >= 0.1
+
+    @pytest.mark.asyncio
+    async def test_other_events_flush_pending_tokens_first(self):
+        """tool_calls などのイベントは結合中の本文の後に順序どおり送られること"""
+        tool_call = SimpleNamespace(
+            id="call-1", type="function", function=SimpleNamespace(name="search", arguments="{}")
+        )
+
+        async def chunks():
+            yield _chunk("検索します")
+            yield _chunk(tool_calls=[tool_call])
+
+        lines = await _collect(encode_ndjson_stream(
+            openai_stream_items(chunks(), {}, ""), window_ms=1000, window_bytes=1024
+        ))
+
+        assert lines[0]["choices"][0]["messages"][0]["content"] == "検索します"
+        assert lines[1]["choices"][0]["messages"][0]["tool_calls"]["id"] == "call-1"
+
+    @pytest.mark.asyncio
+    async def test_compact_stream_sends_envelope_once(self):
+        """meta 行の後は本文差分のみ、メタデータ更新は差分の meta 行、最後に end 行が送られること"""
+        history_metadata = {"conversation_id": "conv-1", "title": "経費"}
+
+        async def chunks():
+            yield _chunk("経費")
+            yield _chunk("精算")
+            yield _chunk(finish_reason="stop")
+
+        async def events():
+            async for item in openai_stream_items(chunks(), history_metadata, "apim-1"):
+                yield item
+            # 保存・タイトル生成の完了待ちの後にメタデータが更新される
+            await asyncio.sleep(0.01)
+            history_metadata["title"] = "経費精算の締め日"
+            yield {"choices": [{"messages": []}], "history_metadata": history_metadata, "history_error": "failed"}
+
+        lines = await _collect(encode_ndjson_stream(events(), window_ms=0, compact=True))
+
+        assert lines[0] == {
+            "t": "meta", "id": "chatcmpl-1", "model": "gpt-4o", "created": 1700000000,
+            "object": "chat.completion.chunk", "history_metadata": {"conversation_id": "conv-1", "title": "経費"},
+            "apim-request-id": "apim-1",
+        }
+        assert lines[1:3] == [{"t": "d", "c": "経費"}, {"t": "d", "c": "精算"}]
+        assert lines[3] == {
+            "t": "meta", "history_metadata": {"conversation_id": "conv-1", "title": "経費精算の締め日"},
+            "history_error": "failed",
+        }
+        assert lines[4] == {"t": "end", "finish_reason": "stop", "usage": None}
+        assert len(lines) == 5
+
+    @pytest.mark.asyncio
+    async def test_repeated_window_waits_keep_items_and_error_line_is_terminated(self):
+        """時間窓の待機を何度繰り返してもトークンを失わず、エラー行は改行で終わること"""
+        async def chunks():
+            for token in ["一", "二", "三", "四"]:
+                yield _chunk(token)
+                await asyncio.sleep(0.03)
+            raise RuntimeError("upstream failed")
+
+        texts = [text async for text in encode_ndjson_stream(
+            openai_stream_items(chunks(), {}, ""), window_ms=10, window_bytes=1024
+        )]
+        lines = [json.loads(text) for text in texts]
+
+        assert all(text.endswith("\n") for text in texts)
+        assert "".join(line["choices"][0]["messages"][0]["content"] for line in lines[:-1]) == "一二三四"
+        assert lines[-1] == {"error": "upstream failed"}
+
+    def test_compact_negotiation(self):
+        """Accept の profile またはクエリ指定でのみコンパクト形式になること"""
+        assert wants_compact_stream("application/x-ndjson; profile=compact, application/x-ndjson;q=0.9")
+        assert wants_compact_stream(None, "compact")
+        assert not wants_compact_stream("application/x-ndjson")
+        assert not wants_compact_stream("application/x-ndjson; profile=compact", "full")
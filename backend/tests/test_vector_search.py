@@ -0,0 +1,108 @@
+"""
+ベクトル / ハイブリッド検索のテスト
+
+検証内容:
+1. クエリ埋め込みが正規化テキスト単位でキャッシュされ、同時ミスは1回の呼び出しにまとめられること
+2. クエリ種別ごとに SearchClient.search の引数が組み立てられること
+3. 埋め込みが未設定の構成で vector 系を指定すると 400 になること（デプロイされる関数アプリも同様）
+4. 共有 QueryEmbedder はイベントループごとに作り直され、埋め込みキャッシュは引き継がれ、置き換えた側は閉じられること
+"""
+
+import asyncio
+import json
+
+import azure.functions as func
+import pytest
+
+from backend.functions import search_proxy, vector_search
+from backend.functions.config import FunctionsConfig
+from backend.functions.vector_search import QueryEmbedder, build_search_kwargs, get_query_embedder, normalize_query_type
+from infra.searchfuncapp import Search as deployed_search
+
+
+class TestVectorSearch:
+    """ベクトル検索のテストスイート"""
+
+    @pytest.mark.asyncio
+    async def test_embeddings_cached_by_normalized_text(self):
+        """表記揺れのある同一クエリは埋め込み API を1回だけ呼ぶこと"""
+        embedder = QueryEmbedder(endpoint="https://example.openai.azure.com/", deployment="embed")
+        calls = []
+
+        async def compute_embedding(text):
+            calls.append(text)
+            await asyncio.sleep(0.01)
+            return [0.1, 0.2]
+
+        embedder.compute_embedding = compute_embedding
+
+        vectors = await asyncio.gather(embedder.embed("経費  精算"), embedder.embed("経費 精算"))
+        again = await embedder.embed(" 経費 精算 ")
+
+        assert calls == ["経費 精算"]
+        assert vectors == [[0.1, 0.2], [0.1, 0.2]]
+        assert again == [0.1, 0.2]
+        assert embedder.stats["hits"] == 1
+
+    def test_search_kwargs_per_query_type(self):
+        """vector 単独はキーワードなし、semantic 系は semantic 構成を指定すること"""
+        vector_only = build_search_kwargs("vector", "q", [0.1], "contentVector", 50, "default")
+        hybrid = build_search_kwargs(
+            normalize_query_type("vectorSemanticHybrid"), "q", [0.1], "contentVector", 50, "default"
+        )
+
+        assert vector_only["search_text"] is None
+        assert hybrid["search_text"] == "q"
+        assert hybrid["query_type"] == "semantic"
+        assert hybrid["semantic_configuration_name"] == "default"
+        if vector_search.VectorizedQuery is None:
+            assert hybrid["vector"] == [0.1] and hybrid["vector_fields"] == "contentVector"
+        else:
+            assert hybrid["vector_queries"][0].k_nearest_neighbors == 50
+        with pytest.raises(ValueError):
+            build_search_kwargs("vector", "q", None, "contentVector", 50, None)
+
+    @pytest.mark.asyncio
+    async def test_unavailable_query_type_is_rejected(self, monkeypatch):
+        """埋め込みの設定が無い場合、vector 系の要求は検索前に 400 を返すこと"""
+        config = FunctionsConfig(search_endpoint="https://example.search.windows.net", search_index="i", search_key="k")
+        monkeypatch.setattr(search_proxy, "get_config", lambda: config)
+        monkeypatch.delenv("AZURE_OPENAI_EMBEDDING_NAME", raising=False)
+        body = {"search_text": "経費精算", "query_type": "vectorSemanticHybrid"}
+
+        response = await search_proxy.main(search_proxy.HttpRequest("POST", body=body))
+        deployed = await deployed_search.main(func.HttpRequest(
+            method="POST", url="https://example.azurewebsites.net/api/search", body=json.dumps(body).encode()
+        ))
+
+        assert response.status_code == 400
+        assert deployed.status_code == 400
+        assert "not available" in json.loads(response.get_body())["error"]["message"]
+
+    def test_embedder_rebuilt_per_event_loop(self, monkeypatch):
+        """イベントループが変わると新しい QueryEmbedder を使い、キャッシュは引き継ぎ、古い方は閉じること"""
+        monkeypatch.setattr(vector_search, "_embedder", None)
+        monkeypatch.setattr(vector_search, "_embedder_loop", None)
+        closed = []
+
+        async def aclose(self):
+            closed.append(self)
+
+        monkeypatch.setattr(QueryEmbedder, "aclose", aclose)
+        config = FunctionsConfig(
+            search_endpoint="https://example.search.windows.net", search_index="i", search_key="k",
+            embedding_endpoint="https://example.openai.azure.com/", embedding_deployment="embed"
+        )
+
+        async def current():
+            embedder = get_query_embedder(config)
+            await asyncio.sleep(0)
+            return embedder
+
+        first = asyncio.run(current())
+        first._cache["key"] = [0.1]
+        second = asyncio.run(current())
+
+        assert second is not first
+        assert second._cache == {"key": [0.1]}
+        assert closed == [first]
@@ -1,11 +1,18 @@
 import os
 import json
+import time
 import logging
 import requests
 import dataclasses
 
+import unicodedata
 from typing import Any, Dict, List
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 DEBUG = os.environ.get("DEBUG", "false")
 if DEBUG.lower() == "true":
     logging.basicConfig(level=logging.DEBUG)
@@ -22,13 +29,44 @@ class JSONEncoder(json.JSONEncoder):
         return super().default(o)
 
 
+# auto（orjson があれば使用） / orjson / json
+NDJSON_ENCODER = os.environ.get("NDJSON_ENCODER", "auto").lower()
+
+
+def _orjson_default(o):
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps_json(obj: Any) -> str:
+    """
+    ストリーム出力用の JSON シリアライズ（区切りの空白なし・非 ASCII はそのまま UTF-8）
+
+    orjson がインストールされていればそちらを使う（NDJSON_ENCODER=json で無効化）。
+    orjson が扱えない値（非文字列キー等）は標準 json にフォールバックする。
+    """
+    if orjson is not None and NDJSON_ENCODER != "json":
+        try:
+            return orjson.dumps(obj, default=_orjson_default).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":"))
+
+
 async def format_as_ndjson(r):
     try:
         async for event in r:
-            yield json.dumps(event, cls=JSONEncoder) + "\n"
+            yield dumps_json(event) + "\n"
     except Exception as error:
         logging.exception("Exception while generating response stream: %s", error)
-        yield json.dumps({"error": str(error)})
+        yield dumps_json({"error": str(error)})
+
+
+def normalize_text(text: str) -> str:
+    """照合用にテキストを正規化（全角/半角の統一、小文字化、連続空白の畳み込み）"""
+    normalized = unicodedata.normalize("NFKC", text or "")
+    return " ".join(normalized.lower().split())
 
 
 def parse_multi_columns(columns: str) -> list:
@@ -39,25 +77,24 @@ def parse_multi_columns(columns: str) -> list:
 
 
 def fetchUserGroups(userToken, nextLink=None):
-    # Recursively fetch group membership
-    if nextLink:
-        endpoint = nextLink
-    else:
-        endpoint = "https://graph.microsoft.com/v1.0/me/transitiveMemberOf?$select=id"
+    # Fetch group membership, following @odata.nextLink pages iteratively
+    # (blocking; async callers should use backend.auth.graph_groups.GraphGroupResolver)
+    endpoint = nextLink or "https://graph.microsoft.com/v1.0/me/transitiveMemberOf?$select=id"
 
     headers = {"Authorization": "bearer " + userToken}
+    groups = []
     try:
-        r = requests.get(endpoint, headers=headers)
-        if r.status_code != 200:
-            logging.error(f"Error fetching user groups: {r.status_code} {r.text}")
-            return []
+        while endpoint:
+            r = requests.get(endpoint, headers=headers, timeout=10)
+            if r.status_code != 200:
+                logging.error(f"Error fetching user groups: {r.status_code} {r.text}")
+                return []
 
-        r = r.json()
-        if "@odata.nextLink" in r:
-            nextLinkData = fetchUserGroups(userToken, r["@odata.nextLink"])
-            r["value"].extend(nextLinkData)
+            r = r.json()
+            groups.extend(r["value"])
+            endpoint = r.get("@odata.nextLink")
 
-        return r["value"]
+        return groups
     except Exception as e:
         logging.error(f"Exception in fetchUserGroups: {e}")
         return []
@@ -193,6 +230,53 @@ def format_stream_response(chatCompletionChunk, history_metadata, apim_request_i
     return {}
 
 
+def format_modern_rag_stream_response(event, response_id, model, history_metadata):
+    '''
+    Convert a ModernBingGroundingAgentService.stream_user_query event into
+    the chat chunk envelope consumed by the frontend NDJSON reader.
+    '''
+    response_obj = {
+        "id": response_id,
+        "model": model,
+        "created": int(time.time()),
+        "object": "chat.completion.chunk",
+        "choices": [{"messages": []}],
+        "history_metadata": history_metadata,
+    }
+
+    event_type = event.get("type")
+    if event_type == "delta":
+        response_obj["choices"][0]["messages"].append({
+            "role": "assistant",
+            "content": event["content"],
+        })
+        return response_obj
+    if event_type == "tool":
+        # Tool progress is sent outside choices so it never ends up in the persisted
+        # assistant message (and never as a 'tool' role message)
+        response_obj["tool_progress"] = {
+            "id": event["tool_call_id"],
+            "name": event["name"],
+            "status": event["status"],
+        }
+        return response_obj
+    if event_type == "final":
+        result = event["result"]
+        if result.status != "success":
+            return {"error": f"Modern RAG処理に失敗しました: {result.error}"}
+        response_obj["choices"][0]["messages"].append({
+            "role": "assistant",
+            "content": "",
+            "context": json.dumps({
+                "citations": [citation.to_dict() for citation in result.citations],
+                "citations_html": event.get("citations_html", ""),
+            }),
+        })
+        return response_obj
+
+    return {}
+
+
 def format_pf_non_streaming_response(
     chatCompletion, history_metadata, response_field_name, citations_field_name, message_uuid=None
 ):
@@ -1,6 +1,7 @@
 import { chatHistorySampleData } from '../constants/chatHistory'
 
 import { ChatMessage, Conversation, ConversationRequest, CosmosDBHealth, CosmosDBStatus, UserInfo } from './models'
+import { COMPACT_STREAM_ACCEPT } from './streamDecoder'
 
 const stripToolMessages = (messages?: ChatMessage[]): ChatMessage[] => {
   if (!Array.isArray(messages)) {
@@ -13,7 +14,8 @@ export async function conversationApi(options: ConversationRequest, abortSignal:
   const response = await fetch('/conversation', {
     method: 'POST',
     headers: {
-      'Content-Type': 'application/json'
+      'Content-Type': 'application/json',
+      Accept: COMPACT_STREAM_ACCEPT
     },
     body: JSON.stringify({
       messages: stripToolMessages(options.messages)
@@ -28,10 +30,12 @@ export async function modernRagWebConversationApi(options: ConversationRequest,
   const response = await fetch('/conversation/modern-rag-web', {
     method: 'POST',
     headers: {
-      'Content-Type': 'application/json'
+      'Content-Type': 'application/json',
+      Accept: COMPACT_STREAM_ACCEPT
     },
     body: JSON.stringify({
-      messages: stripToolMessages(options.messages)
+      messages: stripToolMessages(options.messages),
+      stream: true
     }),
     signal: abortSignal
   })
@@ -168,7 +172,8 @@ export const historyGenerate = async (
   const response = await fetch('/history/generate', {
     method: 'POST',
     headers: {
-      'Content-Type': 'application/json'
+      'Content-Type': 'application/json',
+      Accept: COMPACT_STREAM_ACCEPT
     },
     body: body,
     signal: abortSignal
@@ -192,17 +197,20 @@ export const modernRagHistoryGenerate = async (
   if (convId) {
     body = JSON.stringify({
       conversation_id: convId,
-      messages: stripToolMessages(options.messages)
+      messages: stripToolMessages(options.messages),
+      stream: true
     })
   } else {
     body = JSON.stringify({
-      messages: stripToolMessages(options.messages)
+      messages: stripToolMessages(options.messages),
+      stream: true
     })
   }
   const response = await fetch('/history/generate/modern-rag-web', {
     method: 'POST',
     headers: {
-      'Content-Type': 'application/json'
+      'Content-Type': 'application/json',
+      Accept: COMPACT_STREAM_ACCEPT
     },
     body: body,
     signal: abortSignal
@@ -80,6 +80,13 @@ export type ChatResponse = {
     conversation_id: string
     title: string
     date: string
+    title_pending?: boolean
+  }
+  history_error?: string
+  tool_progress?: {
+    id: string
+    name: string
+    status: string
   }
   error?: any
 }
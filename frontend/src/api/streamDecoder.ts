@@ -0,0 +1,64 @@
+import { ChatMessage, ChatResponse } from './models'
+
+// Requests the compact delta stream; servers that do not support it keep sending full chunks
+export const COMPACT_STREAM_ACCEPT = 'application/x-ndjson; profile=compact, application/x-ndjson;q=0.9'
+
+type CompactStreamEvent = {
+  t: 'meta' | 'd' | 'tc' | 'ctx' | 'tool' | 'err' | 'end'
+  c?: string
+  tool_calls?: any
+  context?: string
+  tool_progress?: ChatResponse['tool_progress']
+  error?: any
+  finish_reason?: string | null
+  usage?: any
+  [key: string]: any
+}
+
+export const isCompactStream = (response: Response): boolean =>
+  response.headers.get('X-Stream-Format') === 'compact'
+
+/**
+ * Rebuilds full ChatResponse chunks from the compact delta stream.
+ * The envelope (id, model, history_metadata, ...) is sent once in a "meta" event
+ * and re-attached here, so the chat page handles both formats the same way.
+ */
+export class CompactStreamDecoder {
+  private meta: Partial<ChatResponse> & { 'apim-request-id'?: string } = {}
+
+  finishReason?: string | null
+  usage?: any
+
+  decode(event: CompactStreamEvent): ChatResponse {
+    const messages: ChatMessage[] = []
+    const response = { ...this.meta, choices: [{ messages }] } as ChatResponse
+
+    switch (event.t) {
+      case 'meta': {
+        const fields: Partial<CompactStreamEvent> = { ...event }
+        delete fields.t
+        this.meta = { ...this.meta, ...fields }
+        return { ...this.meta, choices: [{ messages }] } as ChatResponse
+      }
+      case 'd':
+        messages.push({ role: 'assistant', content: event.c ?? '' } as ChatMessage)
+        return response
+      case 'tc':
+        messages.push({ role: 'assistant', content: '', tool_calls: event.tool_calls } as ChatMessage)
+        return response
+      case 'ctx':
+        messages.push({ role: 'assistant', content: '', context: event.context } as ChatMessage)
+        return response
+      case 'tool':
+        return { ...response, tool_progress: event.tool_progress }
+      case 'err':
+        return { error: event.error } as ChatResponse
+      case 'end':
+        this.finishReason = event.finish_reason
+        this.usage = event.usage
+        return response
+      default:
+        return response
+    }
+  }
+}
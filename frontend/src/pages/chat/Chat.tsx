@@ -36,6 +36,8 @@ import {
   CosmosDBStatus,
   ErrorMessage,
   ExecResults,
+  CompactStreamDecoder,
+  isCompactStream,
 } from "../../api";
 import { Answer } from "../../components/Answer";
 import { QuestionInput } from "../../components/QuestionInput";
@@ -284,18 +286,24 @@ const Chat = () => {
         const reader = response.body.getReader()
 
         let runningText = ''
+        // stream: true keeps multi-byte characters split across reads intact
+        const decoder = new TextDecoder('utf-8')
+        const compactDecoder = isCompactStream(response) ? new CompactStreamDecoder() : null
         while (true) {
           setProcessMessages(messageStatus.Processing)
           const { done, value } = await reader.read()
           if (done) break
 
-          var text = new TextDecoder('utf-8').decode(value)
+          var text = decoder.decode(value, { stream: true })
           const objects = text.split('\n')
           objects.forEach(obj => {
             try {
               if (obj !== '' && obj !== '{}') {
                 runningText += obj
                 result = JSON.parse(runningText)
+                if (compactDecoder) {
+                  result = compactDecoder.decode(result)
+                }
                 if (result.choices?.length > 0) {
                   result.choices[0].messages.forEach(msg => {
                     msg.id = result.id
@@ -450,19 +458,34 @@ const Chat = () => {
         const reader = response.body.getReader()
 
         let runningText = ''
+        // stream: true keeps multi-byte characters split across reads intact
+        const decoder = new TextDecoder('utf-8')
+        const compactDecoder = isCompactStream(response) ? new CompactStreamDecoder() : null
         while (true) {
           setProcessMessages(messageStatus.Processing)
           const { done, value } = await reader.read()
           if (done) break
 
-          var text = new TextDecoder('utf-8').decode(value)
+          var text = decoder.decode(value, { stream: true })
           const objects = text.split('\n')
           objects.forEach(obj => {
             try {
               if (obj !== '' && obj !== '{}') {
                 runningText += obj
                 result = JSON.parse(runningText)
-                if (!result.choices?.[0]?.messages?.[0].content) {
+                if (compactDecoder) {
+                  result = compactDecoder.decode(result)
+                }
+                if (result.history_error) {
+                  // History is saved alongside the stream; a failure does not interrupt the answer
+                  console.error('Failed to save conversation history:', result.history_error)
+                }
+                const resultMessages = result.choices?.[0]?.messages
+                // Progress chunks carry no messages; citation chunks carry context only
+                if (
+                  !resultMessages ||
+                  (resultMessages.length > 0 && !resultMessages[0].content && !resultMessages[0].context)
+                ) {
                   errorResponseMessage = NO_CONTENT_ERROR
                   throw Error()
                 }
@@ -1,14 +1,21 @@
+import asyncio
 import json
 import time
 import logging
 import os
-from typing import Dict, Any
+from types import SimpleNamespace
+from typing import Dict, Any, Optional
 
 import azure.functions as func
 from azure.search.documents.aio import SearchClient
 from azure.core.credentials import AzureKeyCredential
 from azure.core.exceptions import ClientAuthenticationError, HttpResponseError
 
+from .search_batch import build_batch_response, is_batch_request, parse_batch_queries, run_batch_queries
+from .search_cache import get_search_cache, make_cache_key
+from .search_payload import ProjectionError, SearchProjection, encode_body
+from .vector_search import build_search_kwargs, get_query_embedder, resolve_query_type, uses_vector
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,10 +30,139 @@ def _get_config():
     return endpoint, index, key
 
 
-def _create_response(data: Dict[str, Any], status_code: int) -> func.HttpResponse:
+def _env_list(name: str, default: str = "") -> list:
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
+
+
+def _get_payload_config() -> SimpleNamespace:
+    return SimpleNamespace(
+        select_fields=_env_list("SEARCH_SELECT_FIELDS"),
+        vector_fields=_env_list("SEARCH_VECTOR_FIELDS", "contentVector,embedding"),
+        content_fields=_env_list("SEARCH_CONTENT_FIELDS", "content"),
+        max_content_chars=int(os.getenv("SEARCH_MAX_CONTENT_CHARS", "2000")),
+        gzip_min_bytes=int(os.getenv("SEARCH_GZIP_MIN_BYTES", "1024")),
+    )
+
+
+def _get_search_config() -> SimpleNamespace:
+    # query_type: simple / semantic / vector / vector_simple_hybrid / vector_semantic_hybrid
+    return SimpleNamespace(
+        query_type=os.getenv("SEARCH_QUERY_TYPE", "simple"),
+        semantic_config=os.getenv("SEARCH_SEMANTIC_CONFIG", "default"),
+        vector_search_field=os.getenv("SEARCH_VECTOR_SEARCH_FIELD", "contentVector"),
+        vector_k=int(os.getenv("SEARCH_VECTOR_K", "50")),
+        embedding_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        embedding_key=os.getenv("AZURE_OPENAI_EMBEDDING_KEY") or os.getenv("AZURE_OPENAI_KEY"),
+        embedding_deployment=os.getenv("AZURE_OPENAI_EMBEDDING_NAME"),
+        embedding_api_version=os.getenv("AZURE_OPENAI_EMBEDDING_API_VERSION", "2024-05-01-preview"),
+    )
+
+
+def _create_response(data: Dict[str, Any], status_code: int, headers: Optional[Dict[str, str]] = None,
+                     accept_encoding: Optional[str] = None) -> func.HttpResponse:
+    body = json.dumps(data, ensure_ascii=False)
+    if accept_encoding:
+        body, encoding_headers = encode_body(body, accept_encoding, _get_payload_config().gzip_min_bytes)
+        if encoding_headers:
+            headers = {**(headers or {}), **encoding_headers}
     return func.HttpResponse(
-        json.dumps(data), status_code=status_code, mimetype="application/json"
+        body, status_code=status_code, mimetype="application/json", headers=headers
+    )
+
+
+# Reused across invocations on a warm worker; rebuilt if config or event loop changes
+_client: Optional[SearchClient] = None
+_client_key: Optional[tuple] = None
+
+
+def _get_client() -> SearchClient:
+    global _client, _client_key
+    endpoint, index, key = _get_config()
+    client_key = (endpoint, index, key, id(asyncio.get_running_loop()))
+    if _client is None or _client_key != client_key:
+        _client = SearchClient(endpoint=endpoint, index_name=index, credential=AzureKeyCredential(key))
+        _client_key = client_key
+    return _client
+
+
+def _error_payload(e: Exception) -> Dict[str, Any]:
+    if isinstance(e, ClientAuthenticationError):
+        return {"code": "SearchUpstreamError", "message": "Authentication failed", "upstream": {"stage": "auth"}}
+    if isinstance(e, HttpResponseError):
+        msg = str(e)
+        if "DNS server returned answer with no data" in msg:
+            return {"code": "SearchUpstreamError", "message": "DNS resolution failed", "upstream": {"stage": "dns"}}
+        if getattr(getattr(e, "response", None), "status_code", None) == 429:
+            return {"code": "SearchUpstreamError", "message": "Rate limit exceeded", "upstream": {"stage": "429"}}
+        if "timeout" in msg.lower():
+            return {"code": "SearchUpstreamError", "message": "Request timeout", "upstream": {"stage": "timeout"}}
+        return {"code": "SearchUpstreamError", "message": "Search service error", "upstream": {"stage": "search"}}
+    return {"code": "InternalServerError", "message": "An unexpected error occurred"}
+
+
+async def _search(search_text: str, top: int, projection: SearchProjection, query_type: str = "simple") -> list:
+    client = _get_client()
+    config = _get_search_config()
+    results = []
+    vector = await get_query_embedder(config).embed(search_text) if uses_vector(query_type) else None
+    search_kwargs = build_search_kwargs(
+        query_type, search_text, vector, config.vector_search_field, max(config.vector_k, top), config.semantic_config
     )
+    if projection.select:
+        search_kwargs["select"] = list(dict.fromkeys(("id",) + projection.select))
+    search_results = await client.search(top=top, include_total_count=True, **search_kwargs)
+    async for item in search_results:
+        fields, truncated = projection.compact_fields(
+            {k: v for k, v in item.items() if not k.startswith("@")}
+        )
+        doc = {"@search.score": item.get("@search.score"), **fields}
+        if item.get("@search.reranker_score") is not None:
+            doc["@search.reranker_score"] = item["@search.reranker_score"]
+        if truncated:
+            doc["@search.truncated"] = truncated
+        results.append(doc)
+    return results
+
+
+def _split_result(result: Dict[str, Any]):
+    # {"@search.score", **fields} 形式の結果を (id, スコア項目, 本文) に分解（単一検索と同じ形に戻せるように）
+    score_keys = ("@search.score", "@search.reranker_score")
+    scores = {k: result[k] for k in score_keys if k in result}
+    document = {k: v for k, v in result.items() if k not in score_keys}
+    return result.get("id") or None, scores, document
+
+
+async def _handle_batch(req: func.HttpRequest, body: Dict[str, Any], request_id: str,
+                        start_time: float) -> func.HttpResponse:
+    # queries 配列を1つの SearchClient で並行実行し、重複ドキュメントは documents に1回だけ含める
+    try:
+        queries = parse_batch_queries(body)
+        query_type = resolve_query_type(body.get("query_type"), _get_search_config())
+        projection = SearchProjection.from_request(_get_payload_config(), body)
+    except (ValueError, ProjectionError) as e:
+        return _create_response({"error": {"code": "InvalidParameterType", "message": str(e)}}, 400)
+
+    async def search(query: Dict[str, Any]) -> list:
+        return await _search(query["search_text"], query["top"], projection, query_type)
+
+    outcomes = await run_batch_queries(
+        queries, search, get_search_cache(), {**projection.cache_options(), "query_type": query_type},
+        bypass_cache="no-cache" in (req.headers.get("cache-control") or "").lower()
+    )
+    results, documents, failures = build_batch_response(queries, outcomes, _split_result)
+    errors = {}
+    for key, error in failures.items():
+        logger.error(f"[{request_id}] Batch query '{key}' failed: {error}")
+        errors[key] = _error_payload(error)
+
+    elapsed_ms = int((time.time() - start_time) * 1000)
+    data = {"results": results, "documents": documents, "count": len(results), "elapsedMs": elapsed_ms}
+    if errors:
+        data["errors"] = errors
+    logger.info(f"[{request_id}] Batch search completed: {len(queries)} queries, {len(documents)} unique documents, "
+                f"{len(errors)} errors in {elapsed_ms}ms")
+    # 全クエリが失敗した場合のみエラーステータスを返す
+    return _create_response(data, 200 if results else 500, accept_encoding=req.headers.get("accept-encoding"))
 
 
 async def main(req: func.HttpRequest) -> func.HttpResponse:
@@ -47,8 +183,15 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
     if not body:
         return _create_response({"error": {"code": "EmptyRequest", "message": "Request body is empty"}}, 400)
 
-    # Accept legacy aliases as well (q, search)
-    search_text = body.get("search_text") or body.get("q") or body.get("search")
+    # search/batch route or a queries array: several searches in one request
+    mode = (getattr(req, "route_params", None) or {}).get("mode")
+    if mode and mode != "batch":
+        return _create_response({"error": {"code": "NotFound", "message": f"Unknown search mode: {mode}"}}, 404)
+    if mode == "batch" or is_batch_request(req.url, body):
+        return await _handle_batch(req, body, request_id, start_time)
+
+    # Accept aliases as well (query from SearchProxyClient, legacy q / search)
+    search_text = body.get("search_text") or body.get("query") or body.get("q") or body.get("search")
     if not search_text:
         return _create_response({"error": {"code": "MissingSearchText", "message": "search_text (or q) parameter is required"}}, 400)
 
@@ -56,17 +199,33 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
     if not isinstance(top, int) or top <= 0:
         return _create_response({"error": {"code": "InvalidParameterType", "message": "top must be a positive integer"}}, 400)
 
+    filters = body.get("filters") or {}
+    if not isinstance(filters, dict):
+        return _create_response({"error": {"code": "InvalidParameterType", "message": "filters must be a dictionary"}}, 400)
+
+    # Search mode and response projection: select / max_content_chars / include_vectors (vectors dropped by default)
+    try:
+        query_type = resolve_query_type(body.get("query_type"), _get_search_config())
+        projection = SearchProjection.from_request(_get_payload_config(), body)
+    except (ValueError, ProjectionError) as e:
+        return _create_response({"error": {"code": "InvalidParameterType", "message": str(e)}}, 400)
+
+    cache = get_search_cache()
+    cache_key = make_cache_key(search_text, top, filters, {**projection.cache_options(), "query_type": query_type})
+    bypass_cache = "no-cache" in (req.headers.get("cache-control") or "").lower()
+    results, cache_source = (None, None) if bypass_cache else await cache.get(cache_key)
+
     try:
-        endpoint, index, key = _get_config()
-        client = SearchClient(endpoint=endpoint, index_name=index, credential=AzureKeyCredential(key))
-        results = []
-        search_results = await client.search(search_text=search_text, top=top, include_total_count=True)
-        async for item in search_results:
-            results.append({k: v for k, v in item.items()})
-        await client.close()
+        if results is None:
+            results = await _search(search_text, top, projection, query_type)
+            await cache.set(cache_key, results)
 
         elapsed_ms = int((time.time() - start_time) * 1000)
-        return _create_response({"results": results, "count": len(results), "elapsedMs": elapsed_ms}, 200)
+        headers = {"X-Cache": "HIT" if cache_source else "MISS"}
+        if cache_source:
+            headers["X-Cache-Source"] = cache_source
+        return _create_response({"results": results, "count": len(results), "elapsedMs": elapsed_ms}, 200, headers,
+                                accept_encoding=req.headers.get("accept-encoding"))
 
     except ClientAuthenticationError as e:
         logger.error(f"[{request_id}] Authentication failed: {e}")
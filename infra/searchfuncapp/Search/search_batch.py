@@ -0,0 +1,171 @@
+"""
+Search Proxy のバッチモード（複数クエリを1リクエストで実行）
+
+目的:
+- エージェントの1ステップで発生する複数の検索ツール呼び出しを1往復にまとめる
+- クエリ間で重複するドキュメントを応答に1回だけ含める
+
+設計:
+- /search/batch ルート、または queries 配列を含むリクエストをバッチとみなす
+- 正規化後に同一のクエリ（キャッシュキーが同じ）は1回だけ実行し、同時実行数はセマフォで制限する
+- 結果は split_result で (id, スコア項目, 本文) に分解する。参照はスコア項目と documents のキー（doc）を持ち、
+  クライアントは {**スコア項目, **本文} で単一検索と同じ形の結果に戻す
+- id の無いドキュメントは重複排除せず、クエリごとのキー（<クエリキー>#<順位>）で documents に入れる
+- backend/functions と infra/searchfuncapp/Search で同じ内容を使う
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from .search_cache import make_cache_key
+
+logger = logging.getLogger(__name__)
+
+# バッチの1リクエストあたりのクエリ数上限と同時実行数
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "10"))
+SEARCH_BATCH_CONCURRENCY = int(os.getenv("SEARCH_BATCH_CONCURRENCY", "5"))
+
+# (検索結果, キャッシュヒット元) または例外
+BatchOutcome = Union[Tuple[list, Optional[str]], BaseException]
+
+
+def is_batch_request(url: Optional[str], request_data: Dict[str, Any]) -> bool:
+    """/search/batch ルート、または queries 配列を含むリクエストをバッチとみなす"""
+    return "queries" in request_data or (url or "").split("?")[0].rstrip("/").endswith("/batch")
+
+
+def parse_batch_queries(request_data: Dict[str, Any], max_queries: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    バッチのクエリ一覧を検証・正規化
+
+    各クエリは search_text（または query）を必須とし、top / filters / id は任意。
+    省略された top / filters はバッチ全体の値を使う。応答のキーは id（未指定なら search_text）。
+
+    Raises:
+        ValueError: クエリ一覧が不正な場合
+    """
+    max_queries = max_queries or SEARCH_BATCH_MAX_QUERIES
+    queries = request_data.get("queries")
+    if not isinstance(queries, list) or not queries:
+        raise ValueError("queries must be a non-empty list")
+    if len(queries) > max_queries:
+        raise ValueError(f"queries must not exceed {max_queries} items")
+
+    default_top = request_data.get("top", 10)
+    default_filters = request_data.get("filters", {})
+    parsed = []
+    for item in queries:
+        if isinstance(item, str):
+            item = {"search_text": item}
+        if not isinstance(item, dict):
+            raise ValueError("each query must be a string or an object")
+        search_text = item.get("search_text") or item.get("query")
+        if not search_text or not isinstance(search_text, str):
+            raise ValueError("each query requires search_text")
+        top = item.get("top", default_top)
+        if isinstance(top, bool) or not isinstance(top, int) or top <= 0:
+            raise ValueError("top must be a positive integer")
+        filters = item.get("filters", default_filters)
+        if not isinstance(filters, dict):
+            raise ValueError("filters must be a dictionary")
+        parsed.append({"key": str(item.get("id") or search_text), "search_text": search_text, "top": top, "filters": filters})
+
+    keys = [query["key"] for query in parsed]
+    if len(set(keys)) != len(keys):
+        raise ValueError("query ids (or search_text when id is omitted) must be unique")
+    return parsed
+
+
+async def run_batch_queries(
+    queries: List[Dict[str, Any]],
+    search: Callable[[Dict[str, Any]], Awaitable[list]],
+    cache: Any,
+    cache_options: Dict[str, Any],
+    bypass_cache: bool = False,
+    concurrency: Optional[int] = None
+) -> List[BatchOutcome]:
+    """
+    クエリを並行実行し、クエリと同じ順序で結果を返す
+
+    Args:
+        queries: parse_batch_queries の戻り値
+        search: 1クエリを検索して結果リストを返す関数
+        cache: get_search_cache() のキャッシュ
+        cache_options: キャッシュキーに含める射影・検索モードのオプション
+        bypass_cache: True の場合はキャッシュを参照しない（結果は登録する）
+        concurrency: 同時に実行する検索の上限
+    """
+    semaphore = asyncio.Semaphore(max(concurrency or SEARCH_BATCH_CONCURRENCY, 1))
+    # 正規化後に同一のクエリは1回だけ実行する
+    inflight: Dict[str, asyncio.Task] = {}
+
+    async def run_query(cache_key: str, query: Dict[str, Any]) -> Tuple[list, Optional[str]]:
+        if not bypass_cache:
+            cached, source = await cache.get(cache_key)
+            if cached is not None:
+                return cached, source
+        async with semaphore:
+            results = await search(query)
+        await cache.set(cache_key, results)
+        return results, None
+
+    tasks = []
+    for query in queries:
+        cache_key = make_cache_key(query["search_text"], query["top"], query["filters"], cache_options)
+        if cache_key not in inflight:
+            inflight[cache_key] = asyncio.ensure_future(run_query(cache_key, query))
+        tasks.append(inflight[cache_key])
+    outcomes = await asyncio.gather(*inflight.values(), return_exceptions=True)
+    outcome_by_task = dict(zip(inflight.values(), outcomes))
+    return [outcome_by_task[task] for task in tasks]
+
+
+SCORE_KEYS = ("score", "rerankerScore")
+
+
+def split_result(result: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any], Dict[str, Any]]:
+    """
+    {"id", "score", "rerankerScore"?, "fields", ...} 形式の結果を (id, スコア項目, 本文) に分解
+
+    スコアはクエリごとに異なるため参照側に持たせ、それ以外（id を含む）は本文として共有する。
+    """
+    scores = {key: result[key] for key in SCORE_KEYS if key in result}
+    document = {key: value for key, value in result.items() if key not in SCORE_KEYS}
+    return result.get("id") or None, scores, document
+
+
+def build_batch_response(
+    queries: List[Dict[str, Any]],
+    outcomes: List[BatchOutcome],
+    split: Callable[[Dict[str, Any]], Tuple[Optional[str], Dict[str, Any], Dict[str, Any]]] = split_result
+) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, BaseException]]:
+    """
+    バッチ応答の results / documents と、失敗したクエリの例外を組み立てる
+
+    Returns:
+        (results: クエリキー → {query, count, cache, results: [{doc, **スコア項目}]},
+         documents: doc → 本文（クエリ間で重複するドキュメントは1回だけ）,
+         failures: クエリキー → 例外)
+    """
+    results: Dict[str, Any] = {}
+    documents: Dict[str, Any] = {}
+    failures: Dict[str, BaseException] = {}
+    for query, outcome in zip(queries, outcomes):
+        if isinstance(outcome, BaseException):
+            failures[query["key"]] = outcome
+            continue
+        query_results, cache_source = outcome
+        refs = []
+        for position, result in enumerate(query_results):
+            doc_id, scores, document = split(result)
+            doc_key = doc_id if doc_id else f"{query['key']}#{position}"
+            documents.setdefault(doc_key, document)
+            refs.append({"doc": doc_key, **scores})
+        results[query["key"]] = {
+            "query": query["search_text"],
+            "count": len(refs),
+            "cache": "HIT" if cache_source else "MISS",
+            "results": refs
+        }
+    return results, documents, failures
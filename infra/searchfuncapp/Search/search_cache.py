@@ -0,0 +1,223 @@
+"""
+Search Proxy の検索結果キャッシュ
+
+目的:
+- エージェントが同一セッション内で繰り返す同一クエリ（search_internal_documents）で
+  Azure AI Search を毎回呼ばないようにする
+
+設計:
+- キーは正規化した search_text（NFKC・小文字化・空白の畳み込み）+ top + filters（キー順ソート）
+  + 射影オプションのハッシュ
+- 1段目: プロセス内の TTL 付き LRU（ウォームワーカー内で共有）
+- 2段目（任意）: 共有ティア。SEARCH_CACHE_SQLITE_PATH を指定すると SQLite ファイルを使う
+  （同一ホスト上の複数ワーカー・再起動後も共有できる）。get/set を持つ任意のオブジェクトを差し替え可能
+- 共有ティアの障害はキャッシュミスとして扱い、検索自体は失敗させない
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Protocol, Tuple
+
+logger = logging.getLogger(__name__)
+
+# キャッシュ有効期間（秒）。0 以下でキャッシュ無効
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "300"))
+# プロセス内キャッシュのエントリ数上限
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", "512"))
+# 共有ティア（SQLite）のファイルパス。未指定なら共有ティアなし
+SEARCH_CACHE_SQLITE_PATH = os.environ.get("SEARCH_CACHE_SQLITE_PATH", "")
+
+
+def normalize_search_text(search_text: str) -> str:
+    """検索テキストを正規化（全角/半角の統一、小文字化、連続空白の畳み込み）"""
+    normalized = unicodedata.normalize("NFKC", search_text or "")
+    return " ".join(normalized.lower().split())
+
+
+def make_cache_key(
+    search_text: str,
+    top: int,
+    filters: Optional[Dict[str, Any]] = None,
+    options: Optional[Dict[str, Any]] = None
+) -> str:
+    """正規化した検索条件（+ 応答の射影オプション）からキャッシュキーを作成"""
+    payload = json.dumps(
+        {"q": normalize_search_text(search_text), "top": top, "filters": filters or {}, "options": options or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SharedCacheTier(Protocol):
+    """共有キャッシュティアのインターフェース"""
+
+    async def get(self, key: str) -> Optional[Any]: ...
+
+    async def set(self, key: str, value: Any, ttl: float) -> None: ...
+
+
+class SqliteCacheTier:
+    """
+    SQLite ファイルによる共有キャッシュティア
+
+    sqlite3 は同期 API のため、呼び出しはスレッドに逃がしてイベントループを塞がない。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self._initialized:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    def _get_sync(self, key: str) -> Optional[Any]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT value, expires_at FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= time.time():
+                conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            return json.loads(row[0])
+        finally:
+            conn.close()
+
+    def _set_sync(self, key: str, value: Any, ttl: float) -> None:
+        conn = self._connect()
+        try:
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False, default=str), now + ttl)
+            )
+            conn.execute("DELETE FROM search_cache WHERE expires_at <= ?", (now,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self._get_sync, key)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await asyncio.to_thread(self._set_sync, key, value, ttl)
+
+
+class SearchResultCache:
+    """
+    検索結果の TTL 付き LRU キャッシュ（任意で共有ティア付き）
+
+    Args:
+        ttl: 有効期間（秒）。0 以下でキャッシュ無効
+        max_entries: プロセス内キャッシュのエントリ数上限
+        shared_tier: 共有ティア（get/set を持つオブジェクト）
+    """
+
+    def __init__(
+        self,
+        ttl: float = SEARCH_CACHE_TTL,
+        max_entries: int = SEARCH_CACHE_MAX_ENTRIES,
+        shared_tier: Optional[SharedCacheTier] = None
+    ):
+        self.ttl = ttl
+        self.max_entries = max(max_entries, 1)
+        self.shared_tier = shared_tier
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.stats = {"hits": 0, "shared_hits": 0, "misses": 0, "shared_errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _get_local(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Tuple[Optional[Any], Optional[str]]:
+        """
+        キャッシュを参照
+
+        Returns:
+            (値, 取得元 "memory" / "shared")。ミス時は (None, None)
+        """
+        if not self.enabled:
+            return None, None
+
+        value = self._get_local(key)
+        if value is not None:
+            self.stats["hits"] += 1
+            return value, "memory"
+
+        if self.shared_tier is not None:
+            try:
+                value = await self.shared_tier.get(key)
+            except Exception as e:
+                self.stats["shared_errors"] += 1
+                logger.warning(f"Shared search cache read failed: {e}")
+                value = None
+            if value is not None:
+                self.stats["shared_hits"] += 1
+                self._set_local(key, value)
+                return value, "shared"
+
+        self.stats["misses"] += 1
+        return None, None
+
+    async def set(self, key: str, value: Any) -> None:
+        """キャッシュに登録（共有ティアにも書き込む）"""
+        if not self.enabled:
+            return
+        self._set_local(key, value)
+        if self.shared_tier is not None:
+            try:
+                await self.shared_tier.set(key, value, self.ttl)
+            except Exception as e:
+                self.stats["shared_errors"] += 1
+                logger.warning(f"Shared search cache write failed: {e}")
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+_cache: Optional[SearchResultCache] = None
+
+
+def get_search_cache() -> SearchResultCache:
+    """プロセス共有の SearchResultCache を取得"""
+    global _cache
+    if _cache is None:
+        shared_tier = SqliteCacheTier(SEARCH_CACHE_SQLITE_PATH) if SEARCH_CACHE_SQLITE_PATH else None
+        _cache = SearchResultCache(shared_tier=shared_tier)
+    return _cache
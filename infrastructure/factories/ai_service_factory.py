@@ -7,15 +7,19 @@ app.pyのinit_openai_client関数を移植し、
 
 import os
 import json
+import time
+import asyncio
+import hashlib
 import logging
+import importlib.util
 import httpx
-from typing import Optional, Dict, Any, List
-from openai import AsyncAzureOpenAI
-from azure.identity.aio import DefaultAzureCredential, ManagedIdentityCredential, get_bearer_token_provider
+from typing import Optional, Dict, Any, List, Set
+from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
 from azure.keyvault.secrets import SecretClient
 
 from backend.settings import app_settings, MINIMUM_SUPPORTED_AZURE_OPENAI_PREVIEW_API_VERSION
 from backend.keyvault_utils import KeyVaultService
+from backend.auth.credential_registry import COGNITIVE_SERVICES_SCOPE, get_credential_registry
 
 # app.pyからget_secret_from_keyvault機能を移植
 from azure.keyvault.secrets import SecretClient
@@ -28,6 +32,13 @@ USER_AGENT = "GitHubCopilotChat-Sample/1.0.0"
 azure_openai_tools: List[Dict[str, Any]] = []
 azure_openai_available_tools: List[str] = []
 
+# HTTP/2 は h2 パッケージがある場合のみ有効化できる
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# キーローテーション時、旧クライアントを閉じるまでの猶予（実行中リクエストの完了待ち）
+# HTTP タイムアウト（http_timeout）にこの余裕を足した時間だけ待つ
+RETIRED_CLIENT_GRACE_MARGIN_SECONDS = 5.0
+
 
 class AIServiceFactory:
     """
@@ -46,6 +57,15 @@ class AIServiceFactory:
         self.keyvault_service = keyvault_service
         self.keyvault_client = keyvault_client
         self.logger = logging.getLogger(__name__)
+        
+        # ワーカープロセス内で共有する長寿命クライアント
+        self._client: Optional[AsyncAzureOpenAI] = None
+        self._client_fingerprint: Optional[str] = None
+        self._client_lock = asyncio.Lock()
+        self._last_rotation_check = 0.0
+        self._credential = None
+        self._tools_initialized = False
+        self._retire_tasks: Set[asyncio.Task] = set()
     
     def get_secret_from_keyvault(self, secret_name: str) -> Optional[str]:
         """
@@ -81,11 +101,75 @@ class AIServiceFactory:
             self.logger.error(f"Failed to retrieve secret {secret_name} from Key Vault: {e}")
             return None
     
-    async def create_azure_openai_client(self) -> AsyncAzureOpenAI:
+    async def get_azure_openai_client(self) -> AsyncAzureOpenAI:
+        """
+        ワーカー内で共有するAzure OpenAIクライアントを取得する
+        
+        初回呼び出し時にクライアントを生成し、以降は同じ接続プールを再利用する。
+        AZURE_OPENAI_CLIENT_REFRESH_INTERVAL 秒ごとにキー/エンドポイントを再確認し、
+        変更（ローテーション）があった場合のみクライアントを再生成する。
+        
+        Returns:
+            AsyncAzureOpenAI: 共有クライアント
+        """
+        refresh_interval = app_settings.azure_openai.client_refresh_interval
+        if (
+            self._client is not None and
+            time.monotonic() - self._last_rotation_check < refresh_interval
+        ):
+            return self._client
+        
+        async with self._client_lock:
+            endpoint = await self._get_endpoint()
+            aoai_api_key = self._resolve_api_key()
+            fingerprint = self._compute_fingerprint(endpoint, aoai_api_key)
+            self._last_rotation_check = time.monotonic()
+            
+            if self._client is not None and fingerprint == self._client_fingerprint:
+                return self._client
+            
+            if self._client is not None:
+                self.logger.info("Azure OpenAI key or endpoint rotated, rebuilding shared client")
+                self._retire_client(self._client)
+            
+            self._client = await self.create_azure_openai_client(
+                endpoint=endpoint, aoai_api_key=aoai_api_key
+            )
+            self._client_fingerprint = fingerprint
+            self.logger.info("Shared Azure OpenAI client initialized")
+            return self._client
+    
+    def invalidate_azure_openai_client(self) -> None:
+        """次回取得時にキー/エンドポイントを再確認させる（401発生時など）"""
+        self._last_rotation_check = 0.0
+    
+    async def aclose(self) -> None:
+        """共有クライアントと認証情報をクローズする（after_servingから呼び出す）"""
+        async with self._client_lock:
+            if self._client is not None:
+                await self._client.close()
+                self._client = None
+                self._client_fingerprint = None
+            for task in list(self._retire_tasks):
+                task.cancel()
+            self._retire_tasks.clear()
+            # 共有認証情報は CredentialRegistry が閉じる
+            self._credential = None
+    
+    async def create_azure_openai_client(
+        self,
+        endpoint: Optional[str] = None,
+        aoai_api_key: Optional[str] = None
+    ) -> AsyncAzureOpenAI:
         """
         Azure OpenAI クライアントを作成する
         
         app.pyのinit_openai_client関数を移植
+        リクエスト処理では get_azure_openai_client() の共有クライアントを使用すること
+        
+        Args:
+            endpoint: 解決済みエンドポイント（省略時は設定から解決）
+            aoai_api_key: 解決済みAPIキー（省略時はKey Vault/設定から解決）
         
         Returns:
             AsyncAzureOpenAI: 設定されたAzure OpenAIクライアント
@@ -105,16 +189,22 @@ class AIServiceFactory:
                 )
 
             # Endpoint validation and construction
-            endpoint = await self._get_endpoint()
+            if not endpoint:
+                endpoint = await self._get_endpoint()
             
             # Authentication configuration
-            aoai_api_key, ad_token_provider = await self._configure_authentication()
+            if aoai_api_key:
+                ad_token_provider = None
+            else:
+                aoai_api_key, ad_token_provider = await self._configure_authentication()
             
             # Deployment validation
             deployment = await self._get_deployment()
             
-            # Azure Functions tools setup
-            await self._setup_azure_functions_tools()
+            # Azure Functions tools setup (ワーカーごとに一度だけ)
+            if not self._tools_initialized:
+                await self._setup_azure_functions_tools()
+                self._tools_initialized = True
             
             # Create client
             azure_openai_client = AsyncAzureOpenAI(
@@ -123,6 +213,7 @@ class AIServiceFactory:
                 azure_ad_token_provider=ad_token_provider,
                 default_headers={"x-ms-useragent": USER_AGENT},
                 azure_endpoint=endpoint,
+                http_client=self._create_http_client(),
             )
 
             return azure_openai_client
@@ -131,6 +222,47 @@ class AIServiceFactory:
             self.logger.exception("Exception in Azure OpenAI initialization: %s", str(e))
             raise e
     
+    def _create_http_client(self) -> httpx.AsyncClient:
+        """接続プール・keep-alive・HTTP/2を設定したhttpxクライアントを作成"""
+        settings = app_settings.azure_openai
+        http2 = bool(settings.http2_enabled and HTTP2_AVAILABLE)
+        if settings.http2_enabled and not HTTP2_AVAILABLE:
+            self.logger.info("HTTP/2 requested but 'h2' package is not installed, using HTTP/1.1")
+        
+        return DefaultAsyncHttpxClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive_connections,
+                keepalive_expiry=settings.http_keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(settings.http_timeout, connect=settings.http_connect_timeout),
+        )
+    
+    def _compute_fingerprint(self, endpoint: str, aoai_api_key: Optional[str]) -> str:
+        """キー/エンドポイントの変更検知用フィンガープリント（キー自体は保持しない）"""
+        material = "|".join([
+            endpoint or "",
+            app_settings.azure_openai.preview_api_version,
+            aoai_api_key or "entra-id",
+        ])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+    
+    def _retire_client(self, client: AsyncAzureOpenAI) -> None:
+        """旧クライアントを実行中リクエストの完了を待ってからクローズする"""
+        # 実行中のリクエストは最長で http_timeout まで続くため、それより先に閉じない
+        grace_seconds = app_settings.azure_openai.http_timeout + RETIRED_CLIENT_GRACE_MARGIN_SECONDS
+        
+        async def _close_after_grace():
+            try:
+                await asyncio.sleep(grace_seconds)
+            finally:
+                await client.close()
+        
+        task = asyncio.create_task(_close_after_grace())
+        self._retire_tasks.add(task)
+        task.add_done_callback(self._retire_tasks.discard)
+    
     async def _get_endpoint(self) -> str:
         """エンドポイントの取得と検証"""
         if (
@@ -149,15 +281,14 @@ class AIServiceFactory:
         
         return endpoint
     
-    async def _configure_authentication(self) -> tuple[Optional[str], Optional[Any]]:
+    def _resolve_api_key(self) -> Optional[str]:
         """
-        認証設定の構成
+        APIキーの解決（Key Vaultサービス → 従来Key Vault → App Service設定の順）
         
         Returns:
-            tuple: (api_key, ad_token_provider)
+            str: APIキー（Entra ID認証を使う場合はNone）
         """
         aoai_api_key = None
-        ad_token_provider = None
         
         # 第一優先：新Key Vaultサービスからの取得（最も安全）
         if self.keyvault_service:
@@ -165,12 +296,7 @@ class AIServiceFactory:
                 openai_config = self.keyvault_service.get_openai_configuration()
                 if openai_config.get("api_key"):
                     aoai_api_key = openai_config["api_key"]
-                    self.logger.info("Using OpenAI API key from Key Vault service (secure)")
-                    
-                    # エンドポイントもKey Vaultから取得可能
-                    if openai_config.get("endpoint"):
-                        endpoint = openai_config["endpoint"]
-                        self.logger.info("Using OpenAI endpoint from Key Vault service")
+                    self.logger.debug("Using OpenAI API key from Key Vault service (secure)")
             except Exception as e:
                 self.logger.warning(f"Failed to get OpenAI config from Key Vault service: {e}")
         
@@ -179,37 +305,36 @@ class AIServiceFactory:
             keyvault_secret = self.get_secret_from_keyvault("openai-api-key")
             if keyvault_secret:
                 aoai_api_key = keyvault_secret
-                self.logger.info("Using OpenAI API key from legacy Key Vault (secure fallback)")
+                self.logger.debug("Using OpenAI API key from legacy Key Vault (secure fallback)")
         
         # 最終フォールバック：App Service設定
         if not aoai_api_key:
             aoai_api_key = app_settings.azure_openai.key
             if aoai_api_key and aoai_api_key.startswith("@Microsoft.KeyVault"):
-                self.logger.info("Using OpenAI API key from App Service Key Vault reference (secure fallback)")
+                self.logger.debug("Using OpenAI API key from App Service Key Vault reference (secure fallback)")
             elif aoai_api_key:
-                self.logger.warning("Using OpenAI API key from app settings (fallback)")
-            else:
-                self.logger.error("No OpenAI API key available from any source")
+                self.logger.debug("Using OpenAI API key from app settings (fallback)")
+        
+        return aoai_api_key
+    
+    async def _configure_authentication(self) -> tuple[Optional[str], Optional[Any]]:
+        """
+        認証設定の構成
+        
+        Returns:
+            tuple: (api_key, ad_token_provider)
+        """
+        ad_token_provider = None
+        aoai_api_key = self._resolve_api_key()
         
         # Azure Entra ID認証の設定
         if not aoai_api_key:
             self.logger.debug("No AZURE_OPENAI_KEY found, using Azure Entra ID auth")
             
-            # Use managed identity with explicit client ID
-            managed_identity_client_id = os.environ.get("AZURE_CLIENT_ID")
-            if managed_identity_client_id:
-                # Use specific managed identity
-                credential = ManagedIdentityCredential(client_id=managed_identity_client_id)
-                self.logger.info(f"Using managed identity for OpenAI with client ID: {managed_identity_client_id}")
-            else:
-                # Fallback to default credential
-                credential = DefaultAzureCredential()
-                self.logger.info("Using DefaultAzureCredential for OpenAI")
-                
-            ad_token_provider = get_bearer_token_provider(
-                credential,
-                "https://cognitiveservices.azure.com/.default"
-            )
+            # 認証情報・トークンキャッシュはワーカー内で Cosmos / Agents と共有する
+            registry = get_credential_registry()
+            self._credential = registry.get_credential()
+            ad_token_provider = registry.get_token_provider(COGNITIVE_SERVICES_SCOPE)
         
         return aoai_api_key, ad_token_provider
     
@@ -432,7 +432,7 @@ class AIProcessingService(IAIProcessingService):
             if not has_app_context():
                 raise RuntimeError("Application context required for Azure OpenAI client")
                 
-            azure_openai_client = await current_app.ai_service_factory.create_azure_openai_client()
+            azure_openai_client = await current_app.ai_service_factory.get_azure_openai_client()
             raw_response = await azure_openai_client.chat.completions.with_raw_response.create(**model_args)
             response = raw_response.parse()
             apim_request_id = raw_response.headers.get("apim-request-id") 
@@ -0,0 +1,172 @@
+"""
+チャット応答ストリームの NDJSON エンコードベンチマーク（従来形式 vs 結合エンコーダ）
+
+使い方:
+    python tools/ndjson_benchmark.py --tokens 2000 --answers 50 --interval-ms 0
+
+擬似的な Chat Completions チャンク列（日本語と英数字の混在トークン）を
+次の方式でエンコードし、1回答あたりの行数・バイト数とエンコード時間を出力する。
+
+- legacy:        format_stream_response + json.dumps(cls=JSONEncoder)（従来の format_as_ndjson）
+- encoder-json:  backend.stream_encoder（標準 json）
+- encoder-orjson: backend.stream_encoder（orjson、インストールされている場合）
+- compact:       backend.stream_encoder のコンパクト形式（meta 行 + 本文差分）
+
+parse ms は全行を json.loads する時間で、クライアント側の解析コストの目安。
+
+--interval-ms を指定するとトークン到着間隔を模擬し、時間窓による結合も含めて計測する
+（0 の場合はサイズ上限による結合のみ）。
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+# Ensure project root is on sys.path for `import backend`
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from backend import utils
+from backend.stream_encoder import (
+    STREAM_COALESCE_BYTES,
+    STREAM_COALESCE_MS,
+    encode_ndjson_stream,
+    openai_stream_items,
+)
+from backend.utils import JSONEncoder, format_stream_response
+
+TOKENS = ["経費", "精算", "の", "締め", "日は", "毎月", "25", "日", "です", "。", " The", " deadline", " is", " the", " 25th", "."]
+
+HISTORY_METADATA = {
+    "conversation_id": "6f1c2d3e-4b5a-6978-8a9b-0c1d2e3f4a5b",
+    "title": "経費精算の締め日",
+    "date": "2026-10-16T09:00:00",
+}
+
+
+def make_chunks(count):
+    chunks = []
+    for index in range(count):
+        delta = SimpleNamespace(role="assistant", content=TOKENS[index % len(TOKENS)], tool_calls=None)
+        chunks.append(SimpleNamespace(
+            id="chatcmpl-benchmark",
+            model="gpt-4o",
+            created=1760600000,
+            object="chat.completion.chunk",
+            choices=[SimpleNamespace(delta=delta)],
+        ))
+    return chunks
+
+
+async def replay(chunks, interval):
+    for chunk in chunks:
+        if interval:
+            await asyncio.sleep(interval)
+        yield chunk
+
+
+async def legacy_lines(chunks, interval):
+    async for chunk in replay(chunks, interval):
+        event = format_stream_response(chunk, HISTORY_METADATA, "apim-benchmark")
+        if event:
+            yield json.dumps(event, cls=JSONEncoder) + "\n"
+
+
+def encoder_lines(chunks, interval, window_ms, window_bytes, compact=False):
+    return encode_ndjson_stream(
+        openai_stream_items(replay(chunks, interval), HISTORY_METADATA, "apim-benchmark"),
+        window_ms=window_ms,
+        window_bytes=window_bytes,
+        compact=compact,
+    )
+
+
+def line_content(event):
+    if "t" in event:
+        return event.get("c", "")
+    return event["choices"][0]["messages"][0]["content"]
+
+
+async def measure(name, make_stream, answers):
+    output = []
+    started = time.perf_counter()
+    for answer in range(answers):
+        async for text in make_stream():
+            if answer == 0:
+                output.append(text)
+    elapsed = time.perf_counter() - started
+
+    lines = "".join(output).splitlines()
+    parse_started = time.perf_counter()
+    events = [json.loads(line) for line in lines]
+    parse_elapsed = time.perf_counter() - parse_started
+    return {
+        "encoder": name,
+        "lines_per_answer": len(lines),
+        "bytes_per_answer": sum(len(text.encode("utf-8")) for text in output),
+        "ms_per_answer": elapsed * 1000 / answers,
+        "parse_ms": parse_elapsed * 1000,
+        "content": "".join(line_content(event) for event in events),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare NDJSON stream encoders")
+    parser.add_argument("--tokens", type=int, default=1000, help="Tokens per answer")
+    parser.add_argument("--answers", type=int, default=20, help="Answers to encode per encoder")
+    parser.add_argument("--interval-ms", type=float, default=0.0, help="Simulated delay between tokens")
+    parser.add_argument("--window-ms", type=float, default=STREAM_COALESCE_MS)
+    parser.add_argument("--window-bytes", type=int, default=STREAM_COALESCE_BYTES)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.tokens)
+    interval = args.interval_ms / 1000
+    rows = [await measure("legacy", lambda: legacy_lines(chunks, interval), args.answers)]
+
+    original_encoder = utils.NDJSON_ENCODER
+    encoders = ["json"] + (["orjson"] if utils.orjson is not None else [])
+    try:
+        for encoder in encoders:
+            utils.NDJSON_ENCODER = encoder
+            rows.append(await measure(
+                f"encoder-{encoder}",
+                lambda: encoder_lines(chunks, interval, args.window_ms, args.window_bytes),
+                args.answers,
+            ))
+        rows.append(await measure(
+            "compact",
+            lambda: encoder_lines(chunks, interval, args.window_ms, args.window_bytes, compact=True),
+            args.answers,
+        ))
+    finally:
+        utils.NDJSON_ENCODER = original_encoder
+
+    reference = rows[0]["content"]
+    for row in rows:
+        row["content_matches"] = row.pop("content") == reference
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+
+    base = rows[0]
+    print(
+        f"{'encoder':<16} {'lines':>8} {'bytes':>10} {'bytes %':>8} {'ms/answer':>10} "
+        f"{'tokens/s':>12} {'parse ms':>9} {'same text':>10}"
+    )
+    for row in rows:
+        tokens_per_second = args.tokens / (row["ms_per_answer"] / 1000) if row["ms_per_answer"] else 0
+        print(
+            f"{row['encoder']:<16} {row['lines_per_answer']:>8.0f} {row['bytes_per_answer']:>10.0f} "
+            f"{row['bytes_per_answer'] / base['bytes_per_answer'] * 100:>7.1f}% {row['ms_per_answer']:>10.2f} "
+            f"{tokens_per_second:>12.0f} {row['parse_ms']:>9.2f} {str(row['content_matches']):>10}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
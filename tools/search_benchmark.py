@@ -0,0 +1,109 @@
+"""
+Search Proxy 検索モード別ベンチマーク（再現率 vs レイテンシ）
+
+使い方:
+    python tools/search_benchmark.py queries.jsonl --modes simple,semantic,vector,vector_semantic_hybrid --top 5
+
+queries.jsonl は1行1クエリ:
+    {"query": "経費精算の締め日", "relevant": ["doc-12", "doc-40"]}
+
+各モードで perform_search を直接呼び出し（結果キャッシュは経由しない）、
+recall@top と p50/p95 レイテンシを出力する。--repeat 2 以上では2周目以降に
+埋め込みキャッシュが効くため、vector 系の埋め込み計算分の短縮も確認できる。
+SEARCH_ENDPOINT / SEARCH_KEY / SEARCH_INDEX と、vector 系では AZURE_OPENAI_ENDPOINT /
+AZURE_OPENAI_EMBEDDING_NAME が必要。
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+# Ensure project root is on sys.path for `import backend`
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from backend.functions.config import get_config
+from backend.functions.search_proxy import perform_search
+from backend.functions.vector_search import get_query_embedder, normalize_query_type, uses_vector
+
+
+def load_queries(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+async def run_mode(mode, queries, top, repeat):
+    latencies = []
+    recalls = []
+    for round_index in range(repeat):
+        for item in queries:
+            started = time.perf_counter()
+            results = await perform_search(item["query"], top, {}, "benchmark", query_type=mode)
+            latencies.append((time.perf_counter() - started) * 1000)
+            relevant = set(item.get("relevant") or [])
+            if relevant and round_index == 0:
+                retrieved = {result["id"] for result in results}
+                recalls.append(len(retrieved & relevant) / len(relevant))
+    return {
+        "mode": mode,
+        "queries": len(queries),
+        "recall": statistics.mean(recalls) if recalls else None,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "mean_ms": statistics.mean(latencies),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare recall and latency of search proxy query modes")
+    parser.add_argument("queries", help="JSONL file with query and relevant document ids")
+    parser.add_argument("--modes", default="simple,semantic,vector,vector_simple_hybrid,vector_semantic_hybrid")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=2, help="Rounds per mode (later rounds hit the embedding cache)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    modes = [normalize_query_type(mode.strip()) for mode in args.modes.split(",") if mode.strip()]
+
+    rows = []
+    for mode in modes:
+        try:
+            rows.append(await run_mode(mode, queries, args.top, max(args.repeat, 1)))
+        except Exception as e:
+            rows.append({"mode": mode, "error": str(e)})
+
+    embedder_stats = None
+    if any(uses_vector(mode) for mode in modes):
+        try:
+            embedder_stats = get_query_embedder(get_config()).stats
+        except ValueError:
+            pass
+
+    if args.json:
+        print(json.dumps({"results": rows, "embedding_cache": embedder_stats}, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'mode':<24} {'recall@' + str(args.top):>10} {'p50 ms':>10} {'p95 ms':>10} {'mean ms':>10}")
+    for row in rows:
+        if "error" in row:
+            print(f"{row['mode']:<24} ERROR: {row['error']}")
+            continue
+        recall = f"{row['recall']:.3f}" if row["recall"] is not None else "-"
+        print(f"{row['mode']:<24} {recall:>10} {row['p50_ms']:>10.1f} {row['p95_ms']:>10.1f} {row['mean_ms']:>10.1f}")
+    if embedder_stats:
+        print(f"embedding cache: {embedder_stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -21,6 +21,7 @@ import logging
 import uuid
 from typing import Dict, List, Optional, Any, Union
 from backend.history.conversation_service import ConversationHistoryService
+from backend.history.cosmosdbservice import ConversationNotFoundError
 
 
 class HistoryController:
@@ -70,7 +71,8 @@ class HistoryController:
         user_id: str,
         messages: List[Dict[str, Any]],
         conversation_id: Optional[str] = None,
-        title_generator_func: Optional[callable] = None
+        title_generator_func: Optional[callable] = None,
+        allocated_metadata: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
         会話作成 - add_conversation()の移植
@@ -82,6 +84,7 @@ class HistoryController:
             messages: メッセージリスト
             conversation_id: 会話ID（省略時は新規作成）
             title_generator_func: タイトル生成関数
+            allocated_metadata: prepare_conversation で払い出した新規会話のメタデータ
             
         Returns:
             作成結果（success, history_metadata含む）
@@ -99,11 +102,13 @@ class HistoryController:
             # タイトル生成関数は新規作成時のみ適用
             title_generator = title_generator_func if not conversation_id else None
             
+            extra = {"allocated_metadata": allocated_metadata} if allocated_metadata and not conversation_id else {}
             result = await self._conversation_service.create_conversation_with_message(
                 user_id=user_id,
                 messages=messages,
                 conversation_id=conversation_id,
-                title_generator_func=title_generator
+                title_generator_func=title_generator,
+                **extra
             )
             
             if not result.get("success"):
@@ -214,6 +219,93 @@ class HistoryController:
             self._logger.error(f"Failed to create DeepResearch conversation: {str(e)}")
             raise
     
+    def get_request_charge_stats(self) -> Dict[str, Any]:
+        """
+        Cosmos DB 操作ごとの RU 消費統計（ポイント読み取り化の効果確認用）
+        
+        Returns:
+            {操作名: {"count", "request_units", "avg_request_units"}}
+        """
+        cosmos_client = getattr(self._conversation_service, "cosmos_client", None)
+        tracker = getattr(cosmos_client, "request_charges", None)
+        return tracker.snapshot() if tracker else {}
+    
+    def prepare_conversation(
+        self,
+        user_id: str,
+        messages: List[Dict[str, Any]],
+        conversation_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        保存前に検証し、応答に載せる履歴メタデータを決める
+        
+        新規会話は ID・暫定タイトル・作成日時を払い出すため、Cosmos DB への
+        書き込み（create_conversation）と応答生成を並行して開始できる。
+        
+        Returns:
+            history_metadata（新規会話は allocated_metadata としてそのまま create_conversation に渡す）
+            
+        Raises:
+            ValueError: パラメータ検証エラー
+        """
+        self._validate_user_id(user_id)
+        self._validate_messages(messages)
+        if not isinstance(messages[-1], dict) or messages[-1].get("role") != "user":
+            raise ValueError("No user message found")
+        if conversation_id:
+            self._validate_conversation_id(conversation_id)
+            return {"conversation_id": conversation_id}
+        
+        allocate = getattr(self._conversation_service, "allocate_conversation_metadata", None)
+        return allocate(messages) if allocate else {}
+    
+    async def get_generated_title(self, conversation_id: Optional[str], timeout: float = 0) -> Optional[str]:
+        """
+        バックグラウンドで生成された会話タイトルを取得（ストリーム末尾のメタデータ用）
+        
+        Args:
+            conversation_id: 会話ID
+            timeout: 生成完了を待つ最大秒数
+            
+        Returns:
+            生成タイトル（未生成・失敗時は None）
+        """
+        get_title = getattr(self._conversation_service, "get_generated_title", None)
+        if not conversation_id or get_title is None:
+            return None
+        return await get_title(conversation_id, timeout=timeout)
+    
+    async def get_agent_thread_id(self, user_id: str, conversation_id: str) -> Optional[str]:
+        """
+        会話に紐づく Azure AI Agents スレッドID取得（Modern RAG のスレッド再利用用）
+        
+        Args:
+            user_id: ユーザーID
+            conversation_id: 会話ID
+            
+        Returns:
+            スレッドID（未保存の場合はNone）
+        """
+        self._validate_user_id(user_id)
+        self._validate_conversation_id(conversation_id)
+        return await self._conversation_service.get_agent_thread_id(user_id, conversation_id)
+    
+    async def set_agent_thread_id(self, user_id: str, conversation_id: str, thread_id: str) -> bool:
+        """
+        会話に Azure AI Agents スレッドIDを保存
+        
+        Args:
+            user_id: ユーザーID
+            conversation_id: 会話ID
+            thread_id: スレッドID
+            
+        Returns:
+            保存できた場合True
+        """
+        self._validate_user_id(user_id)
+        self._validate_conversation_id(conversation_id)
+        return await self._conversation_service.set_agent_thread_id(user_id, conversation_id, thread_id)
+    
     async def update_conversation(
         self,
         user_id: str,
@@ -399,6 +491,11 @@ class HistoryController:
         offset = max(0, offset)
         limit = min(max(1, limit), 100)  # 1-100の範囲に制限
         
+        if offset == 0:
+            # 先頭ページは継続トークン方式で取得（OFFSET 不要）
+            page = await self.list_conversations_page(user_id, limit=limit)
+            return page["conversations"]
+        
         try:
             conversations = await self._conversation_service.get_user_conversations(
                 user_id, offset=offset, limit=limit
@@ -411,10 +508,45 @@ class HistoryController:
             self._logger.error(f"Failed to list conversations: {str(e)}")
             raise
     
+    async def list_conversations_page(
+        self,
+        user_id: str,
+        limit: int = 25,
+        continuation_token: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        会話一覧取得（継続トークン方式）
+        
+        Args:
+            user_id: ユーザーID
+            limit: 1ページの件数
+            continuation_token: 前ページで返された継続トークン（先頭ページはNone）
+            
+        Returns:
+            {"conversations": [...], "continuation_token": 次ページのトークン（最終ページはNone）}
+        """
+        self._validate_user_id(user_id)
+        
+        limit = min(max(1, limit), 100)  # 1-100の範囲に制限
+        
+        try:
+            page = await self._conversation_service.get_user_conversations_page(
+                user_id, limit=limit, continuation_token=continuation_token
+            )
+            
+            self._logger.info(f"Retrieved {len(page['conversations'])} conversations for user {user_id}")
+            return page
+            
+        except Exception as e:
+            self._logger.error(f"Failed to list conversations: {str(e)}")
+            raise
+    
     async def get_conversation(
         self,
         user_id: str,
-        conversation_id: str
+        conversation_id: str,
+        limit: Optional[int] = None,
+        before: Optional[str] = None
     ) -> Optional[Dict[str, Any]]:
         """
         会話詳細取得 - get_conversation()の移植
@@ -424,6 +556,8 @@ class HistoryController:
         Args:
             user_id: ユーザーID
             conversation_id: 会話ID
+            limit: 返す直近メッセージ数（省略時は全件）
+            before: より古いメッセージのみ返すカーソル（前回の next_cursor をそのまま渡す）
             
         Returns:
             会話詳細（存在しない場合はNone）
@@ -436,8 +570,10 @@ class HistoryController:
         self._validate_conversation_id(conversation_id)
         
         try:
+            if limit is not None:
+                limit = min(max(1, limit), 100)
             result = await self._conversation_service.get_conversation_with_messages(
-                user_id, conversation_id
+                user_id, conversation_id, limit=limit, before=before
             )
             
             if result:
@@ -447,6 +583,9 @@ class HistoryController:
             
             return result
             
+        except ConversationNotFoundError:
+            self._logger.info(f"Conversation {conversation_id} not found for user {user_id}")
+            return None
         except Exception as e:
             self._logger.error(f"Failed to get conversation: {str(e)}")
             raise
@@ -492,6 +631,9 @@ class HistoryController:
             
             return updated_conversation
             
+        except ConversationNotFoundError:
+            self._logger.info(f"Conversation {conversation_id} not found for user {user_id}")
+            return None
         except Exception as e:
             self._logger.error(f"Failed to rename conversation: {str(e)}")
             raise
@@ -514,13 +656,15 @@ class HistoryController:
         self._validate_user_id(user_id)
         
         try:
-            deleted_count = await self._conversation_service.delete_all_user_conversations(user_id)
+            result = await self._conversation_service.delete_all_user_conversations(user_id)
+            deleted_count = result["deleted_conversations_count"]
             
             if deleted_count > 0:
                 self._logger.info(f"Deleted {deleted_count} conversations for user {user_id}")
                 return {
                     "success": True,
                     "deleted_count": deleted_count,
+                    "deleted_messages_count": result["deleted_messages_count"],
                     "message": f"Successfully deleted {deleted_count} conversations and messages for user {user_id}"
                 }
             else:
@@ -544,6 +688,63 @@ class HistoryController:
             self._logger.error(f"Failed to delete all conversations: {str(e)}")
             raise
     
+    async def stream_delete_all_conversations(self, user_id: str):
+        """
+        全会話削除（進捗ストリーミング版）
+        
+        ページを削除するごとに進捗を返すため、件数が多くてもリクエストがタイムアウトしない。
+        途中で切断されても再実行で残りから再開できる。
+        
+        Args:
+            user_id: ユーザーID
+            
+        Yields:
+            進捗（BulkDeleteProgress.to_dict()）
+        """
+        self._validate_user_id(user_id)
+        
+        async for progress in self._conversation_service.iter_delete_all_user_conversations(user_id):
+            yield progress.to_dict()
+        
+        self._logger.info(f"Streamed delete of all conversations for user {user_id} finished")
+    
+    async def start_delete_all_job(self, user_id: str, job_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        全会話削除をバックグラウンドジョブとして開始
+        
+        Args:
+            user_id: ユーザーID
+            job_id: 再開するジョブID（省略時は新規）
+            
+        Returns:
+            ジョブの初期状態（job_id を含む）
+        """
+        self._validate_user_id(user_id)
+        
+        jobs = self._conversation_service.get_bulk_delete_jobs()
+        status = await jobs.start(user_id, job_id)
+        self._logger.info(f"Started bulk delete job {status['job_id']} for user {user_id}")
+        return status
+    
+    async def get_delete_job_status(self, user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        全会話削除ジョブの状態取得
+        
+        Args:
+            user_id: ユーザーID
+            job_id: ジョブID
+            
+        Returns:
+            ジョブ状態（存在しない場合はNone）
+        """
+        self._validate_user_id(user_id)
+        
+        if not job_id:
+            return None
+        
+        jobs = self._conversation_service.get_bulk_delete_jobs()
+        return await jobs.get_status(user_id, job_id)
+    
     async def clear_messages(
         self,
         user_id: str,
@@ -5,5 +5,6 @@ web.routers package - HTTPルーター集約
 """
 
 from .history_router import history_bp, init_history_router
+from .stream_router import stream_bp
 
-__all__ = ['history_bp', 'init_history_router']
+__all__ = ['history_bp', 'init_history_router', 'stream_bp']
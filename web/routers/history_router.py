@@ -23,9 +23,12 @@ TDD Phase: REFACTOR - 外部委託対応HTTPエンドポイント実装（t-wada
 ✅ clear_messages() → POST /history/clear
 """
 
+import asyncio
 import copy
 import json
 import logging
+import os
+import time
 import uuid
 from datetime import datetime
 from typing import Dict, List, Optional, Any
@@ -34,11 +37,20 @@ from web.controllers.history_controller import HistoryController
 from backend.auth.auth_utils import get_authenticated_user_details
 from backend.utils import (
     format_as_ndjson,
-    format_stream_response,
     format_non_streaming_response,
     sanitize_messages_for_openai,
 )
+from backend.completion_singleflight import create_chat_completion
+from backend.stream_encoder import (
+    encode_ndjson_stream,
+    modern_rag_stream_items,
+    openai_stream_items,
+    stream_format_headers,
+    wants_compact_stream,
+)
 from backend.settings import app_settings
+from web.routers.stream_router import chat_stream_response
+from backend.history.conversation_service import ConversationTitleGenerator
 from domain.conversation.services.conversation_service import ConversationService
 
 
@@ -51,6 +63,9 @@ history_bp = Blueprint('history', __name__, url_prefix='/history')
 # 依存性注入用のグローバル変数（実際のアプリではDIコンテナを使用）
 _history_controller: Optional[HistoryController] = None
 
+# 生成タイトルを応答末尾のメタデータで返す際の最大待ち時間（秒）
+TITLE_TRAILING_WAIT_SECONDS = float(os.environ.get("TITLE_TRAILING_WAIT_SECONDS", "3"))
+
 
 def init_history_router(conversation_service: ConversationService) -> None:
     """
@@ -81,6 +96,80 @@ def get_history_controller() -> HistoryController:
     return _history_controller
 
 
+async def _get_title_generator():
+    """
+    会話タイトル生成関数を取得（会話作成後にバックグラウンドで実行される）
+    
+    Returns:
+        タイトル生成関数（AI Service Factory 未初期化時は None）
+    """
+    factory = getattr(current_app, "ai_service_factory", None)
+    if not factory:
+        return None
+    try:
+        openai_client = await factory.get_azure_openai_client()
+    except Exception as e:
+        logger.warning(f"Title generation disabled, Azure OpenAI client unavailable: {e}")
+        return None
+    return ConversationTitleGenerator(openai_client, model=app_settings.azure_openai.model).generate_title
+
+
+async def _apply_generated_title(controller: HistoryController, history_metadata: Dict[str, Any]) -> bool:
+    """
+    生成タイトルが得られていれば history_metadata に反映
+    
+    Returns:
+        bool: タイトルを更新した場合 True
+    """
+    if not history_metadata.pop("title_pending", False):
+        return False
+    title = await controller.get_generated_title(
+        history_metadata.get("conversation_id"), timeout=TITLE_TRAILING_WAIT_SECONDS
+    )
+    if not title:
+        return False
+    history_metadata["title"] = title
+    return True
+
+
+def _log_persist_failure(task: "asyncio.Task") -> None:
+    """応答と並行した履歴保存の失敗をログに残す（クライアント切断で結果が参照されない場合も含む）"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background history persistence failed: {task.exception()}")
+
+
+async def _await_persistence(persist_task: "asyncio.Task", history_metadata: Dict[str, Any]) -> Optional[str]:
+    """
+    並行実行した履歴保存の完了を待ち、結果のメタデータ（title_pending 等）を反映
+    
+    Returns:
+        保存失敗時のエラーメッセージ（成功時は None）
+    """
+    try:
+        result = await persist_task
+    except asyncio.CancelledError:
+        return "History persistence was cancelled"
+    except Exception as e:
+        return f"Failed to save conversation history: {e}"
+    for key, value in (result.get("history_metadata") or {}).items():
+        history_metadata.setdefault(key, value)
+    if (result.get("history_metadata") or {}).get("title_pending"):
+        history_metadata["title_pending"] = True
+    return None
+
+
+def _metadata_chunk(response_id: str, history_metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """メッセージを含まない、更新済みメタデータだけのストリーム末尾チャンク"""
+    return {
+        "id": response_id,
+        "model": app_settings.azure_openai.model,
+        "created": int(time.time()),
+        "object": "chat.completion.chunk",
+        "choices": [{"messages": []}],
+        "history_metadata": history_metadata,
+    }
+
+
 def _merge_tool_citations_into_assistant(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     merged = []
     pending_citations = None
@@ -188,15 +277,21 @@ async def create_conversation():
         
         controller = get_history_controller()
         
-        # 会話メタデータを作成/取得
-        result = await controller.create_conversation(
+        # 履歴メタデータを先に確定し（新規会話は ID・暫定タイトルを払い出し）、
+        # Cosmos DB への保存は OpenAI 呼び出しと並行して実行する
+        history_metadata = controller.prepare_conversation(user_id, messages, conversation_id)
+        title_generator = None if conversation_id else await _get_title_generator()
+        persist_task = asyncio.create_task(controller.create_conversation(
             user_id=user_id,
             messages=messages,
             conversation_id=conversation_id,
-            title_generator_func=None
-        )
-        
-        history_metadata = result.get("history_metadata", {})
+            title_generator_func=title_generator,
+            allocated_metadata=dict(history_metadata) if not conversation_id else None
+        ))
+        persist_task.add_done_callback(_log_persist_failure)
+        if not history_metadata.get("conversation_id"):
+            # ID を事前に払い出せないサービスでは保存完了を待つ（従来の逐次動作）
+            history_metadata = (await persist_task).get("history_metadata", {})
         
         # メッセージを準備（システムメッセージを追加、toolロールを整合性チェック）
         prepared_messages = sanitize_messages_for_openai(copy.deepcopy(messages))
@@ -221,7 +316,11 @@ async def create_conversation():
         if not factory:
             return jsonify({"error": "AI Service Factory is not initialized"}), 500
         
-        azure_openai_client = await factory.create_azure_openai_client()
+        try:
+            azure_openai_client = await factory.get_azure_openai_client()
+        except Exception:
+            persist_task.cancel()
+            raise
         
         apim_request_id = (
             request.headers.get("apim-request-id") or
@@ -244,24 +343,43 @@ async def create_conversation():
         if app_settings.azure_openai.user:
             openai_request["user"] = app_settings.azure_openai.user
         
-        # ストリーミングレスポンス
+        # ストリーミングレスポンス（最初のトークンは保存完了を待たない）
         if openai_request["stream"]:
-            response_stream = await azure_openai_client.chat.completions.create(**openai_request)
+            response_stream = await create_chat_completion(azure_openai_client, openai_request)
             
-            async def events():
+            response_id = str(uuid.uuid4())
+            
+            async def completion_chunks():
+                nonlocal response_id
                 async for completion_chunk in response_stream:
-                    event = format_stream_response(completion_chunk, history_metadata, apim_request_id)
-                    if event:
-                        yield event
+                    response_id = completion_chunk.id or response_id
+                    yield completion_chunk
             
-            return Response(
-                format_as_ndjson(events()),
-                mimetype="application/x-ndjson",
+            async def events():
+                async for item in openai_stream_items(completion_chunks(), history_metadata, apim_request_id):
+                    yield item
+                # 保存結果（失敗はストリーム内で通知）と生成タイトルは末尾のメタデータチャンクで通知
+                history_error = await _await_persistence(persist_task, history_metadata)
+                title_updated = await _apply_generated_title(controller, history_metadata)
+                if history_error or title_updated:
+                    chunk = _metadata_chunk(response_id, history_metadata)
+                    if history_error:
+                        chunk["history_error"] = history_error
+                    yield chunk
+            
+            compact = wants_compact_stream(request.headers.get("Accept"), request.args.get("stream_format"))
+            return chat_stream_response(
+                encode_ndjson_stream(events(), compact=compact),
+                headers=stream_format_headers(compact),
             )
         
         # 非ストリーミングレスポンス
-        chat_completion = await azure_openai_client.chat.completions.create(**openai_request)
+        chat_completion = await create_chat_completion(azure_openai_client, openai_request)
+        history_error = await _await_persistence(persist_task, history_metadata)
+        await _apply_generated_title(controller, history_metadata)
         response_obj = format_non_streaming_response(chat_completion, history_metadata, apim_request_id)
+        if history_error:
+            response_obj["history_error"] = history_error
         
         # IMPORTANT: Filter out tool role messages from response before sending to frontend
         # Tool messages are stored in CosmosDB but should never be sent to client
@@ -293,7 +411,8 @@ async def create_modern_rag_conversation():
     Request Body:
         {
             "messages": [{"role": "user", "content": "Hello"}],
-            "conversation_id": "optional-uuid"
+            "conversation_id": "optional-uuid",
+            "stream": true  (optional: NDJSON streaming via Agents run events)
         }
         
     Response:
@@ -325,7 +444,7 @@ async def create_modern_rag_conversation():
             user_id=user_id,
             messages=messages,
             conversation_id=conversation_id,
-            title_generator_func=None
+            title_generator_func=None if conversation_id else await _get_title_generator()
         )
         
         history_metadata = result.get("history_metadata", {})
@@ -345,7 +464,59 @@ async def create_modern_rag_conversation():
             return jsonify({"error": "Modern RAG service not initialized"}), 503
         
         service = current_app.modern_rag
-        rag_result = await service.process_user_query(user_message, user_id)
+        
+        # 会話ごとに Agents スレッドを再利用（キャッシュミス時のみ保存済みIDを参照）
+        history_conversation_id = history_metadata.get("conversation_id") or result.get("conversation_id")
+        agent_thread_id = None
+        if conversation_id and not service.get_cached_thread_id(conversation_id, user_id):
+            try:
+                agent_thread_id = await controller.get_agent_thread_id(user_id, conversation_id)
+            except Exception as e:
+                logger.warning(f"Failed to load agent thread id for conversation: {e}")
+        
+        async def persist_thread(rag_result):
+            if rag_result.thread_created and rag_result.thread_id and history_conversation_id:
+                try:
+                    await controller.set_agent_thread_id(user_id, history_conversation_id, rag_result.thread_id)
+                except Exception as e:
+                    logger.warning(f"Failed to persist agent thread id: {e}")
+        
+        if request_json.get("stream"):
+            # Agents run event stream: token deltas / tool progress / citations (final chunk)
+            response_id = str(uuid.uuid4())
+            
+            async def agent_events():
+                async for event in service.stream_user_query(
+                    user_message, user_id,
+                    conversation_id=history_conversation_id,
+                    thread_id=agent_thread_id
+                ):
+                    if event.get("type") == "final":
+                        await persist_thread(event["result"])
+                    yield event
+            
+            async def events():
+                async for item in modern_rag_stream_items(
+                    agent_events(), response_id, app_settings.azure_openai.model, history_metadata
+                ):
+                    yield item
+                # 生成タイトルは末尾のメタデータチャンクで通知
+                if await _apply_generated_title(controller, history_metadata):
+                    yield _metadata_chunk(response_id, history_metadata)
+            
+            compact = wants_compact_stream(request.headers.get("Accept"), request.args.get("stream_format"))
+            return chat_stream_response(
+                encode_ndjson_stream(events(), compact=compact),
+                headers=stream_format_headers(compact),
+            )
+        
+        rag_result = await service.process_user_query(
+            user_message, user_id,
+            conversation_id=history_conversation_id,
+            thread_id=agent_thread_id
+        )
+        await persist_thread(rag_result)
+        await _apply_generated_title(controller, history_metadata)
         
         if rag_result.status == "success":
             # Format response in chat completion format
@@ -413,7 +584,7 @@ async def create_deepresearch_conversation():
             user_id=user_id,
             messages=messages,
             conversation_id=conversation_id,
-            title_generator_func=None
+            title_generator_func=None if conversation_id else await _get_title_generator()
         )
         history_metadata = result.get("history_metadata", {})
         
@@ -431,6 +602,7 @@ async def create_deepresearch_conversation():
         
         service = current_app.deepresearch
         research_result = await service.run_research(user_message, user_id)
+        await _apply_generated_title(controller, history_metadata)
         
         if str(research_result.status).lower() not in ("success", "succeeded", "ok"):
             return jsonify({"error": f"DeepResearch processing failed: {research_result.response}"}), 500
@@ -616,11 +788,13 @@ async def list_conversations():
     外部委託重要: 会話一覧APIの明確化
     
     Query Parameters:
-        offset: int (default: 0)
+        offset: int (default: 0) ※後方互換。0より大きい場合のみ OFFSET 方式
         limit: int (default: 25, max: 100)
+        continuation_token: str 前ページの X-Continuation-Token（X-Continuation-Token ヘッダーでも可）
         
     Response:
-        200: [{"id": "...", "title": "..."}, ...]
+        200: [{"id": "...", "title": "...", "createdAt": "...", "updatedAt": "..."}, ...]
+             次ページがある場合は X-Continuation-Token ヘッダーを付与
         404: {"error": "No conversations found"}
     """
     try:
@@ -629,15 +803,30 @@ async def list_conversations():
         
         offset = int(request.args.get("offset", 0))
         limit = int(request.args.get("limit", 25))
+        continuation_token = (
+            request.args.get("continuation_token")
+            or request.headers.get("X-Continuation-Token")
+        )
         
         controller = get_history_controller()
-        conversations = await controller.list_conversations(
+        if offset > 0 and not continuation_token:
+            conversations = await controller.list_conversations(
+                user_id=user_id,
+                offset=offset,
+                limit=limit
+            )
+            return jsonify(conversations), 200
+        
+        page = await controller.list_conversations_page(
             user_id=user_id,
-            offset=offset,
-            limit=limit
+            limit=limit,
+            continuation_token=continuation_token
         )
         
-        return jsonify(conversations), 200
+        response = jsonify(page["conversations"])
+        if page["continuation_token"]:
+            response.headers["X-Continuation-Token"] = page["continuation_token"]
+        return response, 200
         
     except Exception as e:
         if "No conversations" in str(e):
@@ -654,10 +843,14 @@ async def get_conversation():
     外部委託重要: 会話詳細取得APIの明確化
     
     Request Body:
-        {"conversation_id": "required-uuid"}
+        {
+            "conversation_id": "required-uuid",
+            "limit": 50,          # 任意: 直近N件のみ返す
+            "before": "cursor"    # 任意: 前回レスポンスの next_cursor（より古いメッセージを取得）
+        }
         
     Response:
-        200: {"id": "...", "title": "...", "messages": [...]}
+        200: {"id": "...", "title": "...", "messages": [...], "next_cursor": "..."（limit指定時）}
         404: {"error": "Conversation not found"}
     """
     try:
@@ -672,10 +865,14 @@ async def get_conversation():
         if not conversation_id:
             return jsonify({"error": "conversation_id is required"}), 400
         
+        limit = request_json.get("limit")
+        
         controller = get_history_controller()
         result = await controller.get_conversation(
             user_id=user_id,
-            conversation_id=conversation_id
+            conversation_id=conversation_id,
+            limit=int(limit) if limit is not None else None,
+            before=request_json.get("before")
         )
         
         if result is None:
@@ -765,8 +962,14 @@ async def delete_all_conversations():
     
     外部委託重要: 全会話削除APIの明確化
     
+    Query:
+        mode: "stream"（NDJSONで進捗を返す） / "background"（ジョブIDを即時返却）
+        job_id: background 時に再開するジョブID（任意）
+    
     Response:
         200: {"success": true, "deleted_count": N, "message": "..."}
+        202: {"job_id": "...", "status": "running", ...}（mode=background）
+        400: {"error": "Invalid job_id"}（job_id がサーバー発行のIDでない場合）
         404: {"success": false, "error": "No conversations found"}
     """
     try:
@@ -774,6 +977,21 @@ async def delete_all_conversations():
         user_id = await _get_authenticated_user_id()
         
         controller = get_history_controller()
+        mode = request.args.get("mode")
+        
+        if mode == "stream":
+            return Response(
+                format_as_ndjson(controller.stream_delete_all_conversations(user_id=user_id)),
+                mimetype="application/x-ndjson",
+            )
+        
+        if mode == "background":
+            job = await controller.start_delete_all_job(
+                user_id=user_id,
+                job_id=request.args.get("job_id")
+            )
+            return jsonify(job), 202
+        
         result = await controller.delete_all_conversations(user_id=user_id)
         
         if result["success"]:
@@ -781,11 +999,48 @@ async def delete_all_conversations():
         else:
             return jsonify(result), 404
         
+    except ValueError as e:
+        logger.warning(f"Validation error in delete_all_conversations: {str(e)}")
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.exception("Exception in /history/delete_all")
         return jsonify({"error": str(e)}), 500
 
 
+@history_bp.route('/delete_all/status', methods=['GET'])
+async def delete_all_status():
+    """
+    全会話削除ジョブの状態取得エンドポイント
+    
+    Query:
+        job_id: DELETE /history/delete_all?mode=background が返したジョブID
+        
+    Response:
+        200: {"job_id": "...", "status": "running|completed|failed|cancelled", ...}
+        404: {"error": "Job not found"}
+    """
+    try:
+        await _ensure_cosmos_ready()
+        user_id = await _get_authenticated_user_id()
+        
+        controller = get_history_controller()
+        status = await controller.get_delete_job_status(
+            user_id=user_id,
+            job_id=request.args.get("job_id")
+        )
+        
+        if not status:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(status), 200
+        
+    except ValueError as e:
+        logger.warning(f"Validation error in delete_all_status: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("Exception in /history/delete_all/status")
+        return jsonify({"error": str(e)}), 500
+
+
 @history_bp.route('/clear', methods=['POST'])
 async def clear_messages():
     """
@@ -833,7 +1088,7 @@ async def ensure_cosmos():
     外部委託重要: チャット履歴状態確認APIの明確化
     
     Response:
-        200: {"message": "ChatGPT is configured to save chat history", "cosmosDB": True, "status": "Working"}
+        200: {"message": "ChatGPT is configured to save chat history", "cosmosDB": True, "status": "Working", "requestCharges": {...}}
         200: {"message": "Chat history is not enabled", "cosmosDB": False, "status": "NotConfigured"}
     """
     try:
@@ -844,7 +1099,8 @@ async def ensure_cosmos():
             return jsonify({
                 "message": "ChatGPT is configured to save chat history",
                 "cosmosDB": True,
-                "status": "Working"
+                "status": "Working",
+                "requestCharges": controller.get_request_charge_stats()
             }), 200
 
         return jsonify({
@@ -0,0 +1,73 @@
+"""
+StreamRouter - チャット応答ストリームの HTTP 転送
+
+エンドポイント:
+✅ GET /conversation/stream → Last-Event-ID から SSE ストリームを再開
+
+チャット系エンドポイントは chat_stream_response() で応答を返し、
+Accept: text/event-stream の場合は再開可能な SSE、それ以外は従来どおり NDJSON で送る。
+"""
+
+import logging
+from typing import AsyncIterator, Dict, Optional
+
+from quart import Blueprint, Response, jsonify, request
+
+from backend.auth.auth_utils import get_authenticated_user_details
+from backend.sse_stream import StreamResumeError, get_stream_registry, sse_events, wants_sse
+
+
+# ログ設定
+logger = logging.getLogger(__name__)
+
+# Blueprintの作成
+stream_bp = Blueprint('stream', __name__)
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # リバースプロキシでのバッファリングを無効化
+    "X-Accel-Buffering": "no",
+}
+
+
+def _current_user_id() -> Optional[str]:
+    return get_authenticated_user_details(request_headers=request.headers).get("user_principal_id")
+
+
+def chat_stream_response(lines: AsyncIterator[str], headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    NDJSON 行のストリームを応答にする
+
+    SSE の場合は生成を接続から切り離してバッファし、X-Stream-Id で再開用の ID を返す。
+    """
+    headers = dict(headers or {})
+    if not wants_sse(request.headers.get("Accept")):
+        return Response(lines, mimetype="application/x-ndjson", headers=headers)
+
+    stream = get_stream_registry().start(lines, owner=_current_user_id())
+    headers.update(SSE_HEADERS)
+    headers["X-Stream-Id"] = stream.stream_id
+    return Response(sse_events(stream), mimetype="text/event-stream", headers=headers)
+
+
+@stream_bp.route("/conversation/stream", methods=["GET"])
+async def resume_stream():
+    """
+    SSE ストリームを再開
+
+    Last-Event-ID ヘッダー（EventSource の自動再接続）または last_event_id クエリで
+    最後に受け取ったイベントを指定し、その次のイベントから送り直す。
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        stream, seq = get_stream_registry().resume(last_event_id, owner=_current_user_id())
+    except StreamResumeError as e:
+        logger.info(f"Stream resume rejected: {e}")
+        # クライアントは 404 を受けたら通常のリクエストでやり直す
+        return jsonify({"error": str(e)}), 404
+
+    return Response(
+        sse_events(stream, after_seq=seq),
+        mimetype="text/event-stream",
+        headers={**SSE_HEADERS, "X-Stream-Id": stream.stream_id},
+    )